@@ -1,26 +1,33 @@
-from fastapi import FastAPI, BackgroundTasks, HTTPException, Form
+from fastapi import FastAPI, HTTPException, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
+import asyncio
 import uuid
 import os
 import shutil
 from datetime import datetime
 
+# 🧵 Size the native thread pools for the embedded workers before numpy/torch
+# create them
+from core.threads import get_thread_budget
+get_thread_budget().apply_process_defaults()
+
 # Import our StemSense modules
 from core.downloader import AudioDownloader
 from core.stems import StemSeparator
-from core.analyzer import AudioAnalyzer
-from core.packager import Packager
-from config import EXPORT_DIR
-from google.cloud import storage
-import google.auth
-from google.oauth2 import service_account
+from core.jobqueue import get_job_queue
+from core.scheduler import WorkerPool, get_limiter
+from core.formats import parse_stem_format
+from core.profiles import parse_separation_profile
+from core.events import get_event_bus, TERMINAL_STATUSES
+from core.cancellation import get_cancellations
+from core.aio import run_blocking
+from core.taskstore import AsyncTaskStore
+from core.storage import get_signed_url_cache
+from config import EXPORT_DIR, DEMUCS_PRELOAD, EMBEDDED_WORKER, STEM_FORMAT, SEPARATION_PROFILE
 import json
-import os
-from config import GCS_BUCKET_NAME
-from datetime import timedelta
 
 
 app = FastAPI(
@@ -53,9 +60,18 @@ app.add_middleware(
 )
 
 # Persistent storage for task statuses using Google Cloud Firestore
-from google.cloud import firestore
-db = firestore.Client()
-TASKS_COLLECTION = "stemsense_tasks"
+from workflow import task_store, process_job, result_cache, export_exists, job_variant
+from core.cache import extract_video_id
+
+# Idle SSE streams get a keep-alive comment this often
+SSE_KEEPALIVE_SECONDS = 15
+
+# ⚡ Handlers await the task store so Firestore calls never block the event loop
+tasks = AsyncTaskStore(task_store)
+
+# 📬 Jobs wait here in FIFO order until a worker slot is free
+job_queue = get_job_queue()
+worker_pool = None
 
 class ProcessRequest(BaseModel):
     input: str
@@ -66,145 +82,95 @@ class TaskStatus(BaseModel):
     result_file: Optional[str] = None
     error: Optional[str] = None
     created_at: str
+    queue_position: Optional[int] = None
 
-# Helper to check if task was cancelled
-def is_cancelled(task_id: str) -> bool:
-    doc = db.collection(TASKS_COLLECTION).document(task_id).get()
-    if doc.exists and doc.to_dict().get("status") == "cancelled":
-        print(f"🛑 Task {task_id} was cancelled by user. Stopping.")
-        return True
-    return False
-
-# Helper function to run the heavy processing in the background
-def run_full_workflow(task_id: str, query: str):
-    # 🛑 CHECKPOINT 1: Start
-    if is_cancelled(task_id): return
-
-    # Set status to downloading in Firestore
-    db.collection(TASKS_COLLECTION).document(task_id).update({"status": "downloading"})
-    
-    downloader = AudioDownloader()
-    separator = StemSeparator()
-    analyzer = AudioAnalyzer()
-    packager = Packager()
-
-    try:
-        # 🛑 CHECKPOINT 2: Before Download
-        if is_cancelled(task_id): return
-
-        # 1. Download
-        audio_path = downloader.download(query)
-        if not audio_path:
-            db.collection(TASKS_COLLECTION).document(task_id).update({
-                "status": "failed",
-                "error": "Download failed"
-            })
-            return
-
-        track_name = os.path.splitext(os.path.basename(audio_path))[0]
-        
-        # 🛑 CHECKPOINT 3: Before Separation (Expensive!)
-        if is_cancelled(task_id): return
-
-        # 2. Separate
-        db.collection(TASKS_COLLECTION).document(task_id).update({"status": "separating"})
-        stems_dir = separator.separate(audio_path)
-        if not stems_dir:
-            db.collection(TASKS_COLLECTION).document(task_id).update({
-                "status": "failed",
-                "error": "Stem separation failed"
-            })
-            return
-
-        # 🛑 CHECKPOINT 4: Before Analysis
-        if is_cancelled(task_id): return
-
-        # 3. Analyze
-        db.collection(TASKS_COLLECTION).document(task_id).update({"status": "analyzing"})
-        analysis_results = analyzer.analyze(audio_path)
-
-        # 🛑 CHECKPOINT 5: Before Packaging
-        if is_cancelled(task_id): return
-
-        # 4. Package
-        db.collection(TASKS_COLLECTION).document(task_id).update({"status": "packaging"})
-        zip_path = packager.create_package(
-            track_name=track_name,
-            original_file=audio_path,
-            stems_dir=stems_dir,
-            analysis_data=analysis_results or {"note": "analysis failed"}
-        )
+@app.on_event("startup")
+def start_workers():
+    global worker_pool
+    if not EMBEDDED_WORKER:
+        print("ℹ️ EMBEDDED_WORKER=0: jobs are processed by a separate `python worker.py`.")
+        return
 
-        # 🛑 CHECKPOINT 6: Final check before marking complete
-        if is_cancelled(task_id): return
+    # 🔥 Load Demucs weights once in the background so the first job is warm
+    if DEMUCS_PRELOAD:
+        import threading
+        threading.Thread(target=StemSeparator().preload, daemon=True).start()
 
-        if zip_path:
-            db.collection(TASKS_COLLECTION).document(task_id).update({
-                "status": "completed",
-                "result_file": os.path.basename(zip_path)
-            })
-        else:
-            db.collection(TASKS_COLLECTION).document(task_id).update({
-                "status": "failed",
-                "error": "Packaging failed"
-            })
+    worker_pool = WorkerPool(job_queue, process_job)
+    worker_pool.start()
 
-    except Exception as e:
-        # One last check to see if we failed BECAUSE of a purposeful cancel
-        if is_cancelled(task_id): return
-        
-        db.collection(TASKS_COLLECTION).document(task_id).update({
-            "status": "failed",
-            "error": str(e)
-        })
+@app.on_event("shutdown")
+def stop_workers():
+    if worker_pool:
+        worker_pool.stop(timeout=5)
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to StemSense API. Use POST /process to start."}
 
 @app.post("/process", response_model=dict)
-async def process_audio(background_tasks: BackgroundTasks, input: str = Form(...)):
+async def process_audio(
+    input: str = Form(...),
+    original_format: str = Form("source"),
+    stem_format: str = Form(STEM_FORMAT),
+    separation_profile: str = Form(SEPARATION_PROFILE),
+):
     """
     Submit a song name or YouTube URL for processing via Form Data.
+
+    `original_format` is "source" (ship the downloaded stream untouched) or
+    "mp3" (encode the original to MP3 for the package).
+    `stem_format` is one of wav, wav24, wav32f, flac, flac16, mp3[:kbps] or
+    opus[:kbps], e.g. "opus:128".
+    `separation_profile` is standard, karaoke (vocals + instrumental), best,
+    fast or a model name, optionally with overrides, e.g.
+    "standard:two_stems=vocals,shifts=2" (keys: model, two_stems, shifts,
+    overlap, segment).
     """
+    if original_format not in ("source", "mp3"):
+        raise HTTPException(status_code=400, detail="original_format must be 'source' or 'mp3'")
+    try:
+        stem_format = parse_stem_format(stem_format)["name"]
+        separation_profile = parse_separation_profile(separation_profile)["name"]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    options = {
+        "original_format": original_format,
+        "stem_format": stem_format,
+        "separation_profile": separation_profile,
+    }
+    variant = job_variant(options)
+
+    # 🔎 RESOLVE (metadata only, no download) so searches map to a video ID
+    resolved = await run_blocking(AudioDownloader().resolve, input)
+    video_id = resolved["video_id"] if resolved else extract_video_id(input)
+
     # 🔍 CACHE CHECK
-    # Check if we already processed this exact input successfully
+    # Match on the input text and the video ID; the worker additionally
+    # matches on the downloaded audio's content hash.
     try:
-        docs = db.collection(TASKS_COLLECTION)\
-            .where("input", "==", input)\
-            .where("status", "==", "completed")\
-            .order_by("created_at", direction=firestore.Query.DESCENDING)\
-            .limit(1)\
-            .stream()
-        
-        cached_doc = next(docs, None)
+        result_file = await run_blocking(
+            result_cache.lookup,
+            [result_cache.input_key(input), result_cache.video_key(video_id)],
+            export_exists,
+            variant,
+        )
         
-        if cached_doc:
-            data = cached_doc.to_dict()
-            result_file = data.get("result_file")
-            
-            # Verify the file actually still exists in GCS
-            # (We reuse the credentials logic if needed, or simple check if we trust the record)
-            # For speed, we'll assume if it's recent it's there, but let's be safe:
-            storage_client = storage.Client() # Uses Cloud Run default creds
-            bucket = storage_client.bucket(GCS_BUCKET_NAME)
-            blob = bucket.blob(f"exports/{result_file}")
-            
-            if blob.exists():
-                print(f"🚀 CACHE HIT for: {input}")
-                # Create a specific task for this user session that is INSTANTLY completed
-                task_id = str(uuid.uuid4())
-                task_data = {
-                    "task_id": task_id,
-                    "input": input, # Save input for future cache hits
-                    "status": "completed",
-                    "result_file": result_file,
-                    "error": None,
-                    "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "is_cached": True
-                }
-                db.collection(TASKS_COLLECTION).document(task_id).set(task_data)
-                return {"task_id": task_id, "message": "Result found in cache! 🚀"}
+        if result_file:
+            print(f"🚀 CACHE HIT for: {input}")
+            # Create a specific task for this user session that is INSTANTLY completed
+            task_id = str(uuid.uuid4())
+            task_data = {
+                "task_id": task_id,
+                "input": input,
+                "status": "completed",
+                "result_file": result_file,
+                "error": None,
+                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "is_cached": True
+            }
+            await tasks.create(task_id, task_data)
+            return {"task_id": task_id, "message": "Result found in cache! 🚀"}
                 
     except Exception as e:
         print(f"⚠️ Cache check failed: {e}")
@@ -222,44 +188,146 @@ async def process_audio(background_tasks: BackgroundTasks, input: str = Form(...
     }
     
     # Save to Firestore
-    db.collection(TASKS_COLLECTION).document(task_id).set(task_data)
+    await tasks.create(task_id, task_data)
     
-    # Start the background task
-    background_tasks.add_task(run_full_workflow, task_id, input)
+    # Queue the job; a worker picks it up once a slot is free.
+    # A job already queued/running for the same video is shared instead:
+    # this task subscribes to it and gets its status updates from now on.
+    queued_id = await run_blocking(
+        job_queue.enqueue,
+        task_id,
+        {"input": input, "resolved": resolved, "options": options},
+        dedupe_key=result_cache.scoped(result_cache.video_key(video_id), variant),
+    )
+    if queued_id != task_id:
+        print(f"🔗 Deduplicated {input} into running task {queued_id}")
+        # Pick up where the shared job is (e.g. "separating"); final statuses
+        # are the original requester's (a cancel) or reach this task from
+        # the workflow itself
+        shared = await tasks.get(queued_id)
+        if shared and shared.get("status") not in (None, "queued", *TERMINAL_STATUSES):
+            await tasks.update(task_id, {"status": shared["status"]})
+        return {
+            "task_id": task_id,
+            "message": "Same track is already being processed",
+            "queue_position": await run_blocking(job_queue.position, task_id),
+        }
     
-    return {"task_id": task_id, "message": "Job submitted successfully"}
+    return {
+        "task_id": task_id,
+        "message": "Job submitted successfully",
+        "queue_position": await run_blocking(job_queue.position, task_id),
+    }
 
 @app.post("/cancel/{task_id}")
 async def cancel_task(task_id: str):
     """
     Cancel an ongoing task.
     """
-    doc_ref = db.collection(TASKS_COLLECTION).document(task_id)
-    doc = doc_ref.get()
+    task = await tasks.get(task_id)
     
-    if not doc.exists:
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
         
-    current_status = doc.to_dict().get("status")
+    current_status = task.get("status")
     if current_status in ["completed", "failed", "cancelled"]:
         return {"message": "Task already finished or cancelled"}
         
-    # Mark as cancelled
-    doc_ref.update({"status": "cancelled"})
+    # Mark as cancelled; a job shared with other requests keeps running for them
+    await tasks.update(task_id, {"status": "cancelled"})
+    get_event_bus().publish(task_id, {"task_id": task_id, "status": "cancelled"})
+    job_id, remaining = await run_blocking(job_queue.unsubscribe, task_id)
+    if remaining:
+        return {"message": "Task cancellation requested"}
+
+    # Nobody wants the job any more: drop it from the queue if it never started
+    await run_blocking(job_queue.remove, job_id)
+    # 🛑 Stop it mid-stage if an embedded worker is running it right now
+    get_cancellations().cancel(job_id)
     return {"message": "Task cancellation requested"}
 
 @app.get("/tasks/{task_id}", response_model=TaskStatus)
 async def get_status(task_id: str):
     """
-    Check the status of a processing task from Firestore.
+    Check the status of a processing task from the task store.
     """
-    doc_ref = db.collection(TASKS_COLLECTION).document(task_id)
-    doc = doc_ref.get()
+    data = await tasks.get(task_id)
     
-    if not doc.exists:
+    if data is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    return doc.to_dict()
+    if data.get("status") == "queued":
+        data["queue_position"] = await run_blocking(job_queue.position, task_id)
+    return data
+
+def sse_event(data: dict) -> str:
+    return f"data: {json.dumps(data, default=str)}\n\n"
+
+@app.get("/tasks/{task_id}/events")
+async def task_events(task_id: str, request: Request):
+    """
+    Stream status/progress changes for a task as Server-Sent Events.
+
+    The first event is the current state; after that an event is pushed on
+    every change, so clients do not need to poll GET /tasks/{task_id}.
+    The stream ends once the task completes, fails or is cancelled.
+    """
+    bus = get_event_bus()
+    # Subscribe before reading the snapshot so no update falls in between
+    subscription = bus.subscribe(task_id, loop=asyncio.get_running_loop())
+
+    snapshot = bus.last(task_id)
+    if snapshot is None:
+        snapshot = await tasks.get(task_id)
+        if snapshot is None:
+            subscription.close()
+            raise HTTPException(status_code=404, detail="Task not found")
+
+    async def stream():
+        event = snapshot
+        try:
+            while True:
+                if event is not None:
+                    if event.get("status") == "queued":
+                        event = {**event, "queue_position": await run_blocking(job_queue.position, task_id)}
+                    yield sse_event(event)
+                    if event.get("status") in TERMINAL_STATUSES:
+                        return
+                if await request.is_disconnected():
+                    return
+
+                try:
+                    event = await subscription.aget(timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    event = None
+                    if not EMBEDDED_WORKER:
+                        # Jobs run in another process whose events never reach
+                        # this bus, so fall back to a Firestore read.
+                        event = await tasks.get(task_id)
+                    if event is None:
+                        # Comment line keeps proxies from closing an idle stream
+                        yield ": keep-alive\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/queue")
+async def queue_status():
+    """
+    Report how many jobs are waiting, running, and holding each resource.
+    """
+    limiter = get_limiter()
+    return {
+        "depth": await run_blocking(job_queue.depth),
+        "running": await run_blocking(job_queue.running),
+        "limits": limiter.limits,
+        "in_use": limiter.in_use(),
+    }
 
 
 @app.get("/download/{filename}")
@@ -269,40 +337,35 @@ async def download_file(filename: str):
     Uses IAM Signer for Cloud Run compatibility.
     """
     try:
-        # 1. Load credentials from Secret Env Var (Robust Fix)
-        sa_key_json = os.environ.get("GCP_SA_KEY")
-        
-        if sa_key_json:
-            # ✅ Production: Use the injected JSON key from Secret Manager
-            info = json.loads(sa_key_json)
-            credentials = service_account.Credentials.from_service_account_info(info)
-        else:
-            # ⚠️ Fallback: Try default (will fail for signing on Cloud Run without IAM Signer)
-            print("⚠️ GCP_SA_KEY not found. Falling back to default credentials.")
-            credentials, _ = google.auth.default()
-
-        # 2. Initialize Client with these powerful credentials
-        storage_client = storage.Client(credentials=credentials)
-        bucket = storage_client.bucket(GCS_BUCKET_NAME)
-        blob = bucket.blob(f"exports/{filename}")
-
-        if not blob.exists():
+        # ♻️ URLs are signed once per export and reused until shortly before
+        # they expire, so repeat downloads skip the GCS check and the signing
+        signed_urls = await run_blocking(get_signed_url_cache)
+        name = f"exports/{filename}"
+
+        try:
+            url = await run_blocking(signed_urls.url, name)
+        except FileNotFoundError:
             raise HTTPException(status_code=404, detail="File not found in Cloud Storage")
 
-        # 3. Generate a signed URL (Standard Method)
-        # Since 'credentials' now has a private key, this works natively!
-        url = blob.generate_signed_url(
-            version="v4",
-            expiration=timedelta(minutes=15),
-            method="GET",
-        )
+        if url is None:
+            # Local storage backend: serve the file ourselves
+            return FileResponse(signed_urls.storage.uri(name), filename=filename)
         
         return RedirectResponse(url=url)
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error generating signed URL: {e}")
         raise HTTPException(status_code=500, detail="Could not generate download link")
 
+@app.get("/stats")
+async def stats():
+    """
+    Hit/miss counters for the in-process caches.
+    """
+    return {"signed_urls": (await run_blocking(get_signed_url_cache)).stats()}
+
 if __name__ == "__main__":
     import uvicorn
     # Use PORT env var if available (Cloud Run sets this), otherwise default to 8080
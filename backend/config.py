@@ -12,3 +12,129 @@ for directory in [DOWNLOAD_DIR, STEMS_DIR, EXPORT_DIR]:
 # Google Cloud Storage Settings
 # Replace with your actual bucket name created in the console
 GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME", "stemsense-audio-700920052420")
+
+# Demucs Settings
+# "inprocess" keeps one warm model per worker; "cli" spawns `demucs` per track
+DEMUCS_ENGINE = os.getenv("DEMUCS_ENGINE", "inprocess")
+DEMUCS_MODEL = os.getenv("DEMUCS_MODEL", "htdemucs")
+# Load the model when the API starts instead of on the first job
+DEMUCS_PRELOAD = os.getenv("DEMUCS_PRELOAD", "1") == "1"
+# Default separation profile for jobs that don't pick one: "standard",
+# "karaoke" (vocals + instrumental), "best" or "fast" (see core/profiles.py)
+SEPARATION_PROFILE = os.getenv("SEPARATION_PROFILE", "standard")
+# "full" separates the whole track in one model pass (a cancel only takes
+# effect once it ends); "segmented" runs the model over overlapping windows
+# and streams each finished window to the stem files, so memory stays flat
+# however long the track is; "auto" segments tracks longer than
+# SEPARATION_SEGMENTED_MIN_SECONDS and runs shorter ones in the same windows
+# in memory, so a cancel stops them after the current window (in-process
+# engine only)
+SEPARATION_MODE = os.getenv("SEPARATION_MODE", "auto")
+SEPARATION_SEGMENTED_MIN_SECONDS = float(os.getenv("SEPARATION_SEGMENTED_MIN_SECONDS", "600"))
+SEPARATION_SEGMENT_SECONDS = float(os.getenv("SEPARATION_SEGMENT_SECONDS", "60"))
+# Length of the crossfade between consecutive windows
+SEPARATION_OVERLAP_SECONDS = float(os.getenv("SEPARATION_OVERLAP_SECONDS", "2"))
+# Separate up to SEPARATION_BATCH_SIZE queued tracks together (one model pass
+# or one `demucs` run); a batch waits at most SEPARATION_BATCH_WINDOW_SECONDS
+# for more tracks after the first arrives. 1 disables batching.
+SEPARATION_BATCH_SIZE = int(os.getenv("SEPARATION_BATCH_SIZE", "1"))
+SEPARATION_BATCH_WINDOW_SECONDS = float(os.getenv("SEPARATION_BATCH_WINDOW_SECONDS", "2"))
+
+# Decoded Audio Settings
+# Keep each job's decoded float32 buffer in a memory-mapped temp file
+# (under DECODE_DIR) instead of RAM
+DECODE_TO_MEMMAP = os.getenv("DECODE_TO_MEMMAP", "0") == "1"
+DECODE_DIR = os.path.join(os.getcwd(), "data", "decoded")
+# Jobs for tracks longer than this skip the up-front decode: separation and
+# analysis each stream the downloaded file block by block instead, so a job's
+# memory stays bounded however long the track is
+DECODE_STREAM_MIN_SECONDS = float(os.getenv("DECODE_STREAM_MIN_SECONDS", "600"))
+
+# Analysis Settings
+# "full" (whole signal at once), "stream" (fixed-size blocks, bounded memory)
+# or "auto" (stream tracks longer than ANALYSIS_STREAM_MIN_SECONDS)
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "auto")
+ANALYSIS_STREAM_MIN_SECONDS = float(os.getenv("ANALYSIS_STREAM_MIN_SECONDS", "900"))
+ANALYSIS_BLOCK_SECONDS = float(os.getenv("ANALYSIS_BLOCK_SECONDS", "30"))
+# Also analyze the separated stems (beat grid from drums, key from bass+other,
+# loudness per stem) and add the results to metadata.json
+ANALYZE_STEMS = os.getenv("ANALYZE_STEMS", "1") == "1"
+# Rate BPM/key detection runs at (0 = native); loudness always uses the native rate
+ANALYSIS_SAMPLE_RATE = int(os.getenv("ANALYSIS_SAMPLE_RATE", "22050"))
+
+# Analysis results keyed by audio content + analyzer version + parameters:
+# "sqlite" (local disk), "firestore" (shared by all instances), "memory" or "none"
+ANALYSIS_CACHE_BACKEND = os.getenv("ANALYSIS_CACHE_BACKEND", "sqlite")
+ANALYSIS_CACHE_DB_PATH = os.getenv("ANALYSIS_CACHE_DB_PATH", os.path.join(os.getcwd(), "data", "analysis.sqlite3"))
+
+# Job Scheduling Settings
+# Persistent FIFO queue shared by the API and any standalone worker process
+QUEUE_DB_PATH = os.getenv("QUEUE_DB_PATH", os.path.join(os.getcwd(), "data", "queue.sqlite3"))
+# Jobs processed at once by one worker process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# A running job is owned by its worker process for this long after the
+# worker's last heartbeat; after that another process may requeue it
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# Concurrency caps per resource class inside a worker process
+RESOURCE_LIMITS = {
+    "download": int(os.getenv("DOWNLOAD_CONCURRENCY", "2")),
+    "separate": int(os.getenv("SEPARATION_CONCURRENCY", "1")),
+    "analyze": int(os.getenv("ANALYSIS_CONCURRENCY", "2")),
+    "package": int(os.getenv("PACKAGING_CONCURRENCY", "2")),
+}
+# Run the worker pool inside the API process (set to 0 when using worker.py)
+EMBEDDED_WORKER = os.getenv("EMBEDDED_WORKER", "1") == "1"
+# How often a worker running apart from the API (EMBEDDED_WORKER=0) polls the
+# task store for cancellation; embedded workers are signalled directly
+CANCEL_POLL_SECONDS = float(os.getenv("CANCEL_POLL_SECONDS", "2"))
+# Threads each separation/analysis may use (0 = available CPUs / JOB_WORKERS),
+# so concurrent jobs do not oversubscribe the cores
+THREADS_PER_JOB = int(os.getenv("THREADS_PER_JOB", "0"))
+# Pin each demucs subprocess to its own slice of CPUs
+CPU_AFFINITY = os.getenv("CPU_AFFINITY", "0") == "1"
+
+# Task Store Settings
+# "firestore" in production, "memory" for single-process local runs and tests
+TASK_STORE_BACKEND = os.getenv("TASK_STORE_BACKEND", "firestore")
+# Threads for blocking Firestore/GCS calls made from async API handlers
+IO_THREADS = int(os.getenv("IO_THREADS", "32"))
+
+# Result Cache Settings
+# "firestore" in production, "sqlite" or "memory" for local runs and tests
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "firestore")
+RESULT_CACHE_DB_PATH = os.getenv("RESULT_CACHE_DB_PATH", os.path.join(os.getcwd(), "data", "cache.sqlite3"))
+# How long a resolved query -> video ID mapping is trusted (seconds)
+RESOLVE_CACHE_TTL = int(os.getenv("RESOLVE_CACHE_TTL", "3600"))
+
+# Download Settings
+# "source" keeps YouTube's native audio stream (opus/m4a) without re-encoding;
+# "mp3" transcodes every download to 320k MP3
+DOWNLOAD_AUDIO_MODE = os.getenv("DOWNLOAD_AUDIO_MODE", "source")
+
+# Storage Settings
+# "gcs" in production; "local" emulates the bucket under LOCAL_STORAGE_DIR
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "gcs")
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", os.path.join(os.getcwd(), "data", "bucket"))
+# Max pooled HTTPS connections held by the shared GCS client
+GCS_HTTP_POOL_SIZE = int(os.getenv("GCS_HTTP_POOL_SIZE", "32"))
+# Resumable upload chunk size (must be a multiple of 256 KiB)
+GCS_UPLOAD_CHUNK_SIZE = int(os.getenv("GCS_UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# Files larger than this are uploaded/downloaded in parallel slices of this size
+TRANSFER_SLICE_SIZE = int(os.getenv("TRANSFER_SLICE_SIZE", str(32 * 1024 * 1024)))
+# Slices transferred at once per file
+TRANSFER_WORKERS = int(os.getenv("TRANSFER_WORKERS", "8"))
+# Attempts per slice before a transfer gives up (it can be resumed later)
+TRANSFER_ATTEMPTS = int(os.getenv("TRANSFER_ATTEMPTS", "3"))
+# Signed download URLs: lifetime, and how long before expiry a cached URL
+# stops being handed out (so a user never gets one that is about to lapse)
+SIGNED_URL_EXPIRATION = int(os.getenv("SIGNED_URL_EXPIRATION", "900"))
+SIGNED_URL_REFRESH_MARGIN = int(os.getenv("SIGNED_URL_REFRESH_MARGIN", "120"))
+SIGNED_URL_CACHE_SIZE = int(os.getenv("SIGNED_URL_CACHE_SIZE", "4096"))
+# Stream ZIPs straight into storage instead of building them in EXPORT_DIR first
+PACKAGE_STREAMING = os.getenv("PACKAGE_STREAMING", "1") == "1"
+# ZIP policy for WAV stems: "store", "fast" (deflate level 1) or "deflate" (level 6).
+# Already-compressed audio (mp3/opus/m4a/flac) is always stored.
+PACKAGE_COMPRESSION = os.getenv("PACKAGE_COMPRESSION", "fast")
+
+# Default stem format: wav, wav24, wav32f, flac, flac16, mp3[:kbps], opus[:kbps]
+STEM_FORMAT = os.getenv("STEM_FORMAT", "wav")
@@ -0,0 +1,18 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from config import IO_THREADS
+
+# Dedicated pool for blocking network clients (Firestore, GCS) called from
+# async handlers. Kept separate from the default executor so slow storage
+# round-trips cannot starve other offloaded work.
+_IO_EXECUTOR = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="stemsense-io")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking call on the I/O pool and await its result, so the event
+    loop keeps serving other requests meanwhile.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_IO_EXECUTOR, functools.partial(func, *args, **kwargs))
@@ -1,71 +1,385 @@
 import librosa
 import numpy as np
-import soundfile as sf
 import pyloudnorm as pyln
 import os
+import hashlib
+import itertools
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from core.audio import DecodedAudio, AudioStream
+from core.features import OnsetEnvelope, ChromaSum, IntegratedLoudness, StreamResampler, resample
+from core.cache import AnalysisCache, fingerprint_file
+from core.threads import ThreadBudget, get_thread_budget
+from config import (
+    ANALYSIS_MODE, ANALYSIS_STREAM_MIN_SECONDS, ANALYSIS_BLOCK_SECONDS, ANALYSIS_SAMPLE_RATE,
+    ANALYSIS_CACHE_BACKEND,
+)
+
+# Bump whenever a change can alter results for the same audio and settings;
+# it is part of every analysis cache key, so older results are ignored.
+ANALYZER_VERSION = 1
+
+# One analyzer per analyze_many worker process, built by _init_worker
+_WORKER = {}
+
+def _init_worker(settings, storage_kind, threads):
+    # Each worker process gets its share of the cores rather than all of them
+    budget = ThreadBudget(workers=1, threads=threads)
+    budget.apply_process_defaults()
+    _WORKER["analyzer"] = AudioAnalyzer(**settings, thread_budget=budget)
+    _WORKER["storage_kind"] = storage_kind
+
+def _analyze_in_worker(item):
+    analyzer = _WORKER["analyzer"]
+    if _WORKER["storage_kind"] is None:
+        return item, analyzer.analyze(item)
+
+    # Bucket objects are fetched into a scratch dir that is removed right after
+    try:
+        from core.storage import get_storage
+        with tempfile.TemporaryDirectory() as tmp:
+            local_path = os.path.join(tmp, os.path.basename(item))
+            get_storage(_WORKER["storage_kind"]).download_file(item, local_path)
+            return item, analyzer.analyze(local_path)
+    except Exception as e:
+        print(f"Error fetching {item}: {e}")
+        return item, None
 
 class AudioAnalyzer:
-    def __init__(self):
+    def __init__(self, mode=ANALYSIS_MODE, stream_min_seconds=ANALYSIS_STREAM_MIN_SECONDS,
+                 block_seconds=ANALYSIS_BLOCK_SECONDS, analysis_rate=ANALYSIS_SAMPLE_RATE, cache=None,
+                 thread_budget=None):
         """
         Initializes the AudioAnalyzer using librosa for musical features 
         and pyloudnorm for industrial loudness standards.
+
+        Args:
+            mode (str): "full" analyses the whole signal at once, "stream"
+                works through fixed-size blocks with bounded memory, "auto"
+                streams tracks longer than `stream_min_seconds`.
+            block_seconds (float): Block length for streaming analysis.
+            analysis_rate (int): Sample rate BPM and key are computed at
+                (e.g. 22050 or 11025; 0 = the file's native rate). Loudness
+                is always measured at the native rate.
+            cache (AnalysisCache): Where results are remembered across jobs
+                (built from ANALYSIS_CACHE_BACKEND if None; False disables).
+            thread_budget (ThreadBudget): Caps the BLAS/numba threads each
+                analysis uses; the process-wide one if None.
         """
+        if mode not in ("auto", "full", "stream"):
+            raise ValueError(f"Unknown analysis mode: {mode}")
+        self.mode = mode
+        self.stream_min_seconds = stream_min_seconds
+        self.block_seconds = block_seconds
+        self.analysis_rate = analysis_rate
+        if cache is None and ANALYSIS_CACHE_BACKEND != "none":
+            cache = AnalysisCache()
+        self.cache = cache or None
+        self.thread_budget = thread_budget
         # Mapping for librosa's numerical key output to human-readable strings
         self.key_map = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
 
-    def analyze(self, audio_path):
+    def analyze_many(self, paths, workers=None, storage_kind=None):
+        """
+        Analyzes many files across a process pool.
+
+        Each worker process keeps one analyzer for its whole life, so
+        librosa's warm-up (numba JIT, filter banks) is paid once per process
+        instead of once per file. At most 2 files per worker are in flight,
+        so `paths` may be a lazy iterable of any length.
+
+        Args:
+            paths (iterable): Local file paths, or object names if `storage_kind` is set.
+            workers (int): Worker processes (default: one per CPU core).
+            storage_kind (str): Fetch each item from this storage backend
+                ("gcs" or "local") before analyzing it.
+
+        Yields:
+            tuple: (path, results) in completion order; results is None if
+                the file could not be analyzed.
+        """
+        workers = workers or os.cpu_count() or 1
+        settings = {
+            "mode": self.mode,
+            "stream_min_seconds": self.stream_min_seconds,
+            "block_seconds": self.block_seconds,
+            "analysis_rate": self.analysis_rate,
+            # Workers open their own cache connection (or none if disabled here)
+            "cache": None if self.cache is not None else False,
+        }
+        # Split the cores between the worker processes
+        threads = ThreadBudget(workers=workers, threads=0).threads
+        paths = iter(paths)
+        # "spawn": forked children would inherit the parent's threads and
+        # cloud client sockets
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(settings, storage_kind, threads)) as pool:
+            pending = {pool.submit(_analyze_in_worker, path) for path in itertools.islice(paths, 2 * workers)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for path in itertools.islice(paths, 1):
+                        pending.add(pool.submit(_analyze_in_worker, path))
+                    yield future.result()
+
+    def _feature_rate(self, sr):
+        # Only ever downsample: tempo and key need no more than ~11 kHz of bandwidth
+        if self.analysis_rate and self.analysis_rate < sr:
+            return self.analysis_rate
+        return sr
+
+    def _use_streaming(self, duration):
+        if self.mode == "auto":
+            # Unknown length (some ffmpeg-only containers): stay on the safe side
+            return duration is None or duration > self.stream_min_seconds
+        return self.mode == "stream"
+
+    def _cache_key(self, kind, content_hash):
+        if self.cache is None or not content_hash:
+            return None
+        params = {
+            "kind": kind,
+            "mode": self.mode,
+            "stream_min_seconds": self.stream_min_seconds,
+            "block_seconds": self.block_seconds,
+            "analysis_rate": self.analysis_rate,
+        }
+        return AnalysisCache.key(content_hash, ANALYZER_VERSION, params)
+
+    def analyze(self, audio, content_hash=None):
         """
         Extracts BPM, Musical Key, and Loudness (LUFS) from an audio file.
         
         Args:
-            audio_path (str): Path to the audio file.
+            audio (str | DecodedAudio | AudioStream): Path to the audio
+                file, the job's already-decoded audio so nothing is decoded a
+                second time, or a stream of it (always analysed block by
+                block, so memory stays bounded).
+            content_hash (str): SHA-256 of the audio file, if the caller
+                already computed it (see core.cache.fingerprint_file).
             
         Returns:
             dict: A dictionary containing bpm, key, and loudness.
         """
-        if not os.path.exists(audio_path):
+        audio_path = audio.path if isinstance(audio, (DecodedAudio, AudioStream)) else audio
+        if not isinstance(audio, DecodedAudio) and not os.path.exists(audio_path):
             print(f"Error: File not found {audio_path}")
             return None
 
-        print(f"Analyzing audio: {os.path.basename(audio_path)}")
+        print(f"Analyzing audio: {os.path.basename(audio_path or 'buffer')}")
 
         try:
-            # 1. Load the audio file
-            # sr=None preserves the original sampling rate
-            y, sr = librosa.load(audio_path, sr=None)
-
-            # 2. Extract BPM (Tempo)
-            # onset_envelope helps find the rhythmic pulses
-            onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-            tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr)
-            # tempo is usually a 1D array, we take the first value
-            final_bpm = float(tempo[0]) if isinstance(tempo, (np.ndarray, list)) else float(tempo)
-
-            # 3. Extract Key
-            # We use a Chromagram to see the intensity of each note
-            chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-            chroma_mean = np.mean(chroma, axis=1)
-            
-            # Simple major/minor detection based on the strongest Chroma
-            key_index = int(np.argmax(chroma_mean))
-            detected_key = self.key_map[key_index]
-            
-            # 4. Extract Loudness (LUFS)
-            # pyloudnorm requires data in (samples, channels) format
-            # If mono, we reshape it
-            data, rate = sf.read(audio_path)
-            meter = pyln.Meter(rate) # create BS.1770 meter
-            loudness = meter.integrated_loudness(data)
-
-            results = {
-                "bpm": round(final_bpm, 2),
-                "key": detected_key,
-                "loudness_lufs": round(float(loudness), 2)
-            }
-            
+            # ♻️ Same file bytes decode to the same samples: check the cache
+            # before touching the audio itself
+            if self.cache is not None and content_hash is None:
+                if audio_path and os.path.exists(audio_path):
+                    content_hash = fingerprint_file(audio_path)
+                elif isinstance(audio, DecodedAudio):
+                    content_hash = hashlib.sha256(np.ascontiguousarray(audio.samples).tobytes()).hexdigest()
+            cache_key = self._cache_key("mix", content_hash)
+            cached = self.cache.get(cache_key) if cache_key else None
+            if cached:
+                print(f"♻️ Analysis cache hit: {cached}")
+                return cached
+
+            if isinstance(audio, (DecodedAudio, AudioStream)) or self.mode == "full":
+                source = audio
+            else:
+                # Only probe the file here; decoding happens per mode below
+                source = AudioStream(audio)
+
+            # 🧵 Stay within this job's thread budget while other jobs run
+            with (self.thread_budget or get_thread_budget()).allot():
+                if isinstance(audio, AudioStream) or (
+                        not isinstance(source, str) and self._use_streaming(source.duration)):
+                    results = self._analyze_stream(source)
+                else:
+                    if not isinstance(source, DecodedAudio):
+                        # 1. Load the audio file (once) unless the caller already decoded it
+                        source = DecodedAudio.load(audio)
+                    results = self._analyze_full(source)
+
             print(f"Analysis Complete: {results}")
+            if cache_key:
+                self.cache.set(cache_key, results)
             return results
 
         except Exception as e:
             print(f"Error during analysis: {e}")
             return None
+
+    @staticmethod
+    def _bpm(tempo):
+        # tempo is usually a 1D array, we take the first value
+        return float(tempo[0]) if isinstance(tempo, (np.ndarray, list)) else float(tempo)
+
+    def _results(self, tempo, chroma_mean, loudness):
+        final_bpm = self._bpm(tempo)
+
+        # Simple major/minor detection based on the strongest Chroma
+        key_index = int(np.argmax(chroma_mean))
+        detected_key = self.key_map[key_index]
+
+        return {
+            "bpm": round(final_bpm, 2),
+            "key": detected_key,
+            "loudness_lufs": round(float(loudness), 2)
+        }
+
+    def _analyze_full(self, audio):
+        """Whole-signal analysis of an already decoded track."""
+        # BPM and key run on a down-sampled mono copy (polyphase resampler)
+        sr = self._feature_rate(audio.sample_rate)
+        y = resample(audio.mono(), audio.sample_rate, sr)
+
+        # 1. Extract BPM (Tempo)
+        # onset_envelope helps find the rhythmic pulses
+        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
+        tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr)
+
+        # 2. Extract Key
+        # We use a Chromagram to see the intensity of each note
+        chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
+        chroma_mean = np.mean(chroma, axis=1)
+
+        # 3. Extract Loudness (LUFS)
+        # pyloudnorm requires data in (samples, channels) format,
+        # measured at the original rate from the same decoded buffer
+        meter = pyln.Meter(audio.sample_rate) # create BS.1770 meter
+        loudness = meter.integrated_loudness(audio.frames_first())
+
+        return self._results(tempo, chroma_mean, loudness)
+
+    def _analyze_stream(self, source):
+        """
+        Block-by-block analysis (see core.features): memory stays bounded by
+        the block size however long the track is.
+
+        Args:
+            source (DecodedAudio | AudioStream): Anything with sample_rate,
+                channels and blocks(block_frames).
+        """
+        native_sr = source.sample_rate
+        sr = self._feature_rate(native_sr)
+        resampler = StreamResampler(native_sr, sr)
+        onset = OnsetEnvelope(sr)
+        chroma = ChromaSum(sr, int(self.block_seconds * sr))
+        loudness = IntegratedLoudness(native_sr, source.channels)
+
+        for block in source.blocks(int(self.block_seconds * native_sr)):
+            loudness.update(block)
+            # Same down-mix as DecodedAudio.mono / librosa.to_mono
+            mono = np.mean(block, axis=0) if block.shape[0] > 1 else np.asarray(block[0])
+            mono = resampler.process(mono)
+            onset.update(mono)
+            chroma.update(mono)
+
+        tail = resampler.flush()
+        onset.update(tail)
+        chroma.update(tail)
+
+        tempo, _ = librosa.beat.beat_track(onset_envelope=onset.finish(), sr=sr)
+        return self._results(tempo, chroma.finish(), loudness.finish())
+
+    def analyze_stems(self, stems_dir):
+        """
+        Stem-aware analysis of a separated track.
+
+        - Loudness (LUFS) of every stem.
+        - Tempo and beat grid from the drums stem, where onsets are not
+          smeared by vocals and pads.
+        - Key from the bass and other stems (harmony without drums/vocals).
+
+        Each stem is decoded once, block by block, and every feature that
+        needs it is fed from those same blocks.
+
+        Args:
+            stems_dir (str): The folder returned by StemSeparator.separate.
+
+        Returns:
+            dict: bpm, beats (seconds), key and per-stem loudness, or None.
+        """
+        if not stems_dir or not os.path.isdir(stems_dir):
+            print(f"Error: Stems folder not found {stems_dir}")
+            return None
+
+        stems = {
+            os.path.splitext(filename)[0]: os.path.join(stems_dir, filename)
+            for filename in sorted(os.listdir(stems_dir))
+            if os.path.isfile(os.path.join(stems_dir, filename))
+        }
+        # Two-stem separations only have vocals / no_vocals
+        beat_stem = next((name for name in ("drums", "no_vocals") if name in stems), None)
+        harmonic_stems = ([name for name in ("bass", "other") if name in stems]
+                          or [name for name in stems if name not in ("vocals", "drums")])
+        print(f"Analyzing stems: {', '.join(stems)}")
+
+        try:
+            # Key on every stem's bytes: a different separation of the same
+            # track (model, format) is a different input
+            cache_key = None
+            if self.cache is not None:
+                digest = hashlib.sha256()
+                for name, path in stems.items():
+                    digest.update(f"{name}:{fingerprint_file(path)};".encode())
+                cache_key = self._cache_key("stems", digest.hexdigest())
+                cached = self.cache.get(cache_key)
+                if cached:
+                    print("♻️ Stem analysis cache hit")
+                    return cached
+
+            # 🧵 Stay within this job's thread budget while separation runs
+            with (self.thread_budget or get_thread_budget()).allot():
+                results = {"stems": {}}
+                chroma_total, chroma_frames = np.zeros(12), 0
+
+                for name, path in stems.items():
+                    source = AudioStream(path)
+                    native_sr = source.sample_rate
+                    sr = self._feature_rate(native_sr)
+                    loudness = IntegratedLoudness(native_sr, source.channels)
+                    onset = OnsetEnvelope(sr) if name == beat_stem else None
+                    chroma = ChromaSum(sr, int(self.block_seconds * sr)) if name in harmonic_stems else None
+                    resampler = StreamResampler(native_sr, sr) if (onset or chroma) else None
+
+                    def feed(mono):
+                        if onset:
+                            onset.update(mono)
+                        if chroma:
+                            chroma.update(mono)
+
+                    for block in source.blocks(int(self.block_seconds * native_sr)):
+                        loudness.update(block)
+                        if resampler:
+                            mono = np.mean(block, axis=0) if block.shape[0] > 1 else np.asarray(block[0])
+                            feed(resampler.process(mono))
+                    if resampler:
+                        feed(resampler.flush())
+
+                    lufs = loudness.finish()
+                    # Silent stems measure -inf, which JSON cannot represent
+                    results["stems"][name] = {"loudness_lufs": round(lufs, 2) if np.isfinite(lufs) else None}
+
+                    if onset:
+                        tempo, beats = librosa.beat.beat_track(onset_envelope=onset.finish(), sr=sr, units="time")
+                        results["bpm"] = round(self._bpm(tempo), 2)
+                        results["beats"] = [round(float(t), 3) for t in beats]
+                        results["beat_source"] = name
+                    if chroma:
+                        chroma.finish()
+                        chroma_total += chroma.total
+                        chroma_frames += chroma.frames
+
+                if chroma_frames:
+                    results["key"] = self.key_map[int(np.argmax(chroma_total))]
+                    results["key_source"] = "+".join(harmonic_stems)
+
+            print(f"Stem Analysis Complete: bpm={results.get('bpm')}, key={results.get('key')}")
+            if cache_key:
+                self.cache.set(cache_key, results)
+            return results
+
+        except Exception as e:
+            print(f"Error during stem analysis: {e}")
+            return None
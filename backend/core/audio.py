@@ -0,0 +1,153 @@
+import json
+import os
+import subprocess
+import tempfile
+import numpy as np
+
+
+class DecodedAudio:
+    def __init__(self, samples, sample_rate, path=None):
+        """
+        A track decoded exactly once per job and shared by every stage.
+
+        Args:
+            samples (np.ndarray): float32 buffer shaped (channels, frames).
+            sample_rate (int): Native sample rate of the source file.
+            path (str): The file the samples were decoded from.
+        """
+        self.samples = np.atleast_2d(samples).astype(np.float32, copy=False)
+        self.sample_rate = int(sample_rate)
+        self.path = path
+        self._memmap_path = None
+
+    @classmethod
+    def load(cls, path, memmap_dir=None):
+        """
+        Decode an audio file (ffmpeg/audioread via librosa) at its native rate.
+
+        Args:
+            path (str): Path to the audio file.
+            memmap_dir (str): If given, the decoded buffer is moved into a
+                memory-mapped temp file there instead of staying in RAM.
+
+        Returns:
+            DecodedAudio: The decoded track.
+        """
+        import librosa
+
+        # sr=None preserves the original sampling rate, mono=False keeps channels
+        y, sr = librosa.load(path, sr=None, mono=False)
+        audio = cls(y, sr, path=path)
+        if memmap_dir:
+            audio._move_to_memmap(memmap_dir)
+        return audio
+
+    def _move_to_memmap(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        fd, memmap_path = tempfile.mkstemp(suffix=".f32", dir=directory)
+        os.close(fd)
+        mapped = np.memmap(memmap_path, dtype=np.float32, mode="w+", shape=self.samples.shape)
+        mapped[:] = self.samples
+        mapped.flush()
+        self.samples = mapped
+        self._memmap_path = memmap_path
+
+    @property
+    def track_name(self):
+        return os.path.splitext(os.path.basename(self.path or "track"))[0]
+
+    @property
+    def channels(self):
+        return self.samples.shape[0]
+
+    @property
+    def frames(self):
+        return self.samples.shape[1]
+
+    @property
+    def duration(self):
+        return self.frames / float(self.sample_rate)
+
+    def mono(self):
+        """Down-mix to a 1D float32 signal (same as librosa.to_mono)."""
+        if self.channels == 1:
+            return np.asarray(self.samples[0])
+        return np.mean(self.samples, axis=0)
+
+    def blocks(self, block_frames):
+        """Yield consecutive (channels, <= block_frames) views of the buffer."""
+        for start in range(0, self.frames, block_frames):
+            yield self.samples[:, start:start + block_frames]
+
+    def frames_first(self):
+        """(frames, channels) view, the layout pyloudnorm and soundfile expect."""
+        return self.samples.T
+
+    def close(self):
+        """Release the buffer and remove the memory-mapped temp file, if any."""
+        self.samples = np.zeros((self.channels, 0), dtype=np.float32)
+        if self._memmap_path and os.path.exists(self._memmap_path):
+            os.remove(self._memmap_path)
+        self._memmap_path = None
+
+
+class AudioStream:
+    def __init__(self, path):
+        """
+        Decodes a file block by block instead of all at once, so tracks of
+        any length can be processed in bounded memory.
+
+        libsndfile is used when it can read the container (wav/flac/ogg/mp3);
+        anything else (m4a, webm) is decoded by ffmpeg into a float32 pipe.
+        """
+        self.path = path
+        self.sample_rate, self.channels, self.duration = self._probe()
+
+    def _probe(self):
+        try:
+            import soundfile as sf
+            info = sf.info(self.path)
+            self._reader = "soundfile"
+            return info.samplerate, info.channels, info.duration
+        except Exception:
+            self._reader = "ffmpeg"
+
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "a:0",
+             "-show_entries", "stream=sample_rate,channels:format=duration", "-of", "json", self.path],
+            capture_output=True, text=True, check=True,
+        )
+        info = json.loads(result.stdout)
+        stream = info["streams"][0]
+        duration = info.get("format", {}).get("duration")
+        return int(stream["sample_rate"]), int(stream["channels"]), float(duration) if duration else None
+
+    def blocks(self, block_frames):
+        """Yield float32 blocks shaped (channels, <= block_frames), in order."""
+        if self._reader == "soundfile":
+            import soundfile as sf
+            for block in sf.blocks(self.path, blocksize=block_frames, dtype="float32", always_2d=True):
+                yield block.T
+            return
+
+        process = subprocess.Popen(
+            ["ffmpeg", "-v", "error", "-i", self.path, "-f", "f32le",
+             "-ac", str(self.channels), "-ar", str(self.sample_rate), "pipe:1"],
+            stdout=subprocess.PIPE,
+        )
+        block_bytes = block_frames * self.channels * 4
+        try:
+            while True:
+                data = process.stdout.read(block_bytes)
+                if not data:
+                    break
+                usable = len(data) - len(data) % (4 * self.channels)
+                yield np.frombuffer(data[:usable], dtype="<f4").reshape(-1, self.channels).T
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+
+    def close(self):
+        """Nothing to release: blocks are decoded on demand (same API as DecodedAudio)."""
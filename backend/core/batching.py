@@ -0,0 +1,141 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from config import SEPARATION_BATCH_SIZE, SEPARATION_BATCH_WINDOW_SECONDS
+from core.cancellation import Cancelled, CancellationToken
+from core.pipeline import CANCEL_POLL_SECONDS
+
+
+class _Request:
+    def __init__(self, audio, output_format, profile, progress, token):
+        self.audio = audio
+        self.output_format = output_format
+        self.profile = profile
+        self.progress = progress
+        self.token = token
+        self.future = Future()
+
+
+class SeparationBatcher:
+    def __init__(self, separator, max_batch=SEPARATION_BATCH_SIZE, window=SEPARATION_BATCH_WINDOW_SECONDS):
+        """
+        Funnels separate() calls from concurrent jobs into batches.
+
+        A single dispatcher thread takes the first waiting track, collects
+        more for up to `window` seconds (or until `max_batch` are waiting),
+        then runs them through StemSeparator.separate_batch and hands each
+        job its own stems folder. One batch runs at a time, so this also
+        replaces the "separate" resource limit.
+
+        Args:
+            separator (StemSeparator): Does the actual separation.
+            max_batch (int): Most tracks per batch.
+            window (float): Seconds a batch waits for more tracks.
+        """
+        self.separator = separator
+        self.max_batch = max(1, max_batch)
+        self.window = window
+        self._pending = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="separation-batcher", daemon=True)
+                self._thread.start()
+
+    def separate(self, audio, output_format=None, progress=None, token=None, profile=None):
+        """
+        Same contract as StemSeparator.separate; blocks until this track's
+        batch is done. A cancelled job stops waiting straight away (its
+        stems are discarded once the batch finishes) and the batch itself is
+        only stopped once every track in it has been cancelled.
+        """
+        request = _Request(audio, output_format or self.separator.output_format,
+                           profile or self.separator.profile, progress, token)
+        self._ensure_started()
+        self._pending.put(request)
+        while True:
+            try:
+                return request.future.result(timeout=CANCEL_POLL_SECONDS)
+            except TimeoutError:
+                if token is not None and token.cancelled:
+                    raise Cancelled()
+
+    def _collect(self):
+        """Block for the first request, then gather more until the window closes."""
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = []
+            for request in self._collect():
+                if request.token is not None and request.token.cancelled:
+                    request.future.set_exception(Cancelled())
+                else:
+                    batch.append(request)
+            # A batch shares one output format and profile; mixes run back to back
+            groups = {}
+            for request in batch:
+                groups.setdefault((request.output_format, request.profile), []).append(request)
+            for (output_format, profile), group in groups.items():
+                self._run_group(output_format, profile, group)
+
+    def _run_group(self, output_format, profile, group):
+        print(f"📦 Separating a batch of {len(group)} track(s)")
+        # Stops the shared run only when nobody is waiting for it any more
+        token = CancellationToken()
+        for request in group:
+            if request.token is not None:
+                request.token.on_cancel(
+                    lambda: all(r.token is not None and r.token.cancelled for r in group) and token.cancel()
+                )
+
+        def progress(fraction):
+            for request in group:
+                if request.progress:
+                    request.progress(fraction)
+
+        try:
+            paths = self.separator.separate_batch(
+                [request.audio for request in group], output_format, progress, token, profile,
+            )
+        except Exception as e:
+            for request in group:
+                request.future.set_exception(e)
+            return
+
+        for request, path in zip(group, paths):
+            if request.token is not None and request.token.cancelled:
+                # Its job already gave up waiting
+                if path:
+                    self.separator._discard(path)
+                request.future.set_exception(Cancelled())
+            else:
+                request.future.set_result(path)
+
+
+# One batcher per process so every job's tracks can share a batch
+_BATCHER = None
+_BATCHER_LOCK = threading.Lock()
+
+
+def get_separation_batcher(storage=None):
+    global _BATCHER
+    with _BATCHER_LOCK:
+        if _BATCHER is None:
+            from core.stems import StemSeparator
+            _BATCHER = SeparationBatcher(StemSeparator(storage=storage))
+        return _BATCHER
@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from config import RESULT_CACHE_BACKEND, RESULT_CACHE_DB_PATH, ANALYSIS_CACHE_BACKEND, ANALYSIS_CACHE_DB_PATH
+
+# Matches the 11-character video ID in watch, short, embed and youtu.be URLs
+_VIDEO_ID_RE = re.compile(r"(?:v=|youtu\.be/|/shorts/|/embed/|/live/)([A-Za-z0-9_-]{11})")
+
+
+def fingerprint_file(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's bytes, read in chunks so memory stays flat."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extract_video_id(query):
+    """Return the YouTube video ID in `query` if it is a URL, else None."""
+    match = _VIDEO_ID_RE.search(query or "")
+    return match.group(1) if match else None
+
+
+class TTLCache:
+    def __init__(self, ttl, max_entries=1024, clock=time.monotonic):
+        """
+        A small thread-safe in-memory cache whose entries expire after `ttl`
+        seconds; the least recently used entry is evicted once `max_entries`
+        is reached.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if self._clock() >= expires_at:
+                del self._data[key]
+                return None
+            # Re-insert so dict order tracks recency
+            self._data[key] = self._data.pop(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data.pop(key, None)
+            if len(self._data) >= self.max_entries:
+                # Dicts keep insertion order, so the first key is the least recent
+                del self._data[next(iter(self._data))]
+            self._data[key] = (value, self._clock() + (self.ttl if ttl is None else ttl))
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class MemoryCacheBackend:
+    """Process-local dict store (tests and single-process dev runs)."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteCacheBackend:
+    """Local persistent store, shared between the API and worker processes."""
+
+    def __init__(self, db_path=RESULT_CACHE_DB_PATH):
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+
+class FirestoreCacheBackend:
+    """Production store: one Firestore document per cache key."""
+
+    def __init__(self, collection="stemsense_cache", client=None):
+        if client is None:
+            from core.clients import get_firestore_client
+            client = get_firestore_client()
+        self._collection = client.collection(collection)
+
+    def _doc(self, key):
+        # Firestore document IDs may not contain "/"
+        return self._collection.document(key.replace("/", "_"))
+
+    def get(self, key):
+        doc = self._doc(key).get()
+        return doc.to_dict() if doc.exists else None
+
+    def set(self, key, value):
+        self._doc(key).set(value)
+
+    def delete(self, key):
+        self._doc(key).delete()
+
+
+def make_backend(kind=RESULT_CACHE_BACKEND, db_path=RESULT_CACHE_DB_PATH, collection="stemsense_cache"):
+    """Build a cache backend by name: "memory", "sqlite" or "firestore"."""
+    if kind == "memory":
+        return MemoryCacheBackend()
+    if kind == "sqlite":
+        return SQLiteCacheBackend(db_path)
+    if kind == "firestore":
+        return FirestoreCacheBackend(collection)
+    raise ValueError(f"Unknown cache backend: {kind}")
+
+
+class ResultCache:
+    def __init__(self, backend=None):
+        """
+        Maps what we know about a track to its finished `exports/` ZIP.
+
+        A single result is stored under several keys: the raw input, the
+        YouTube video ID (known before downloading) and the SHA-256 of the
+        downloaded audio (catches different searches that land on the same
+        file).
+
+        Args:
+            backend: Any object with get/set/delete (see make_backend).
+        """
+        self.backend = backend or make_backend()
+
+    @staticmethod
+    def input_key(query):
+        return "input:" + " ".join((query or "").lower().split())
+
+    @staticmethod
+    def video_key(video_id):
+        return f"video:{video_id}" if video_id else None
+
+    @staticmethod
+    def audio_key(content_hash):
+        return f"audio:{content_hash}" if content_hash else None
+
+    @staticmethod
+    def scoped(key, variant=None):
+        """
+        Qualify a key with the job options that change the output (e.g.
+        "orig=mp3"), so different packages of one track never collide.
+        """
+        if not key or not variant:
+            return key
+        return f"{key}|{variant}"
+
+    def lookup(self, keys, exists=None, variant=None):
+        """
+        Return the cached result file for the first key that hits.
+
+        Args:
+            keys (list): Cache keys to try, in order (None entries are skipped).
+            exists (callable): Optional check that the result file still
+                exists; stale entries are deleted.
+            variant (str): Output options the result must have been built with.
+
+        Returns:
+            str: The result file name, or None on a miss.
+        """
+        for key in keys:
+            key = self.scoped(key, variant)
+            if not key:
+                continue
+            entry = self.backend.get(key)
+            if not entry:
+                continue
+            result_file = entry.get("result_file")
+            if exists is not None and not exists(result_file):
+                self.backend.delete(key)
+                continue
+            return result_file
+        return None
+
+    def store(self, result_file, keys, variant=None):
+        """Record `result_file` under every non-empty key."""
+        entry = {"result_file": result_file, "stored_at": time.time()}
+        for key in keys:
+            key = self.scoped(key, variant)
+            if key:
+                self.backend.set(key, entry)
+
+
+class AnalysisCache:
+    def __init__(self, backend=None):
+        """
+        Analysis results keyed by the audio's content hash, the analyzer's
+        algorithm version and its parameters.
+
+        Bumping the version or changing a parameter changes every key, so
+        results from an older algorithm are never served again.
+
+        Args:
+            backend: Any object with get/set/delete (see make_backend).
+        """
+        self.backend = backend or make_backend(
+            ANALYSIS_CACHE_BACKEND, db_path=ANALYSIS_CACHE_DB_PATH, collection="stemsense_analysis",
+        )
+
+    @staticmethod
+    def key(content_hash, version, params):
+        params_digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+        return f"analysis:v{version}:{params_digest}:{content_hash}"
+
+    def get(self, key):
+        # A broken cache must never fail the analysis itself
+        try:
+            entry = self.backend.get(key)
+        except Exception as e:
+            print(f"⚠️ Analysis cache read failed: {e}")
+            return None
+        return entry.get("results") if entry else None
+
+    def set(self, key, results):
+        try:
+            self.backend.set(key, {"results": results, "stored_at": time.time()})
+        except Exception as e:
+            print(f"⚠️ Analysis cache write failed: {e}")
@@ -0,0 +1,133 @@
+import threading
+
+
+class Cancelled(Exception):
+    """Raised inside a job once its cancellation token has fired."""
+
+
+class CancellationToken:
+    def __init__(self):
+        """
+        A thread-safe, one-way "stop now" flag for one job.
+
+        Long-running work either polls it (`raise_if_cancelled` between
+        blocks) or registers a callback that interrupts it directly, e.g.
+        killing a subprocess.
+        """
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """Fire the token (once) and run every registered callback."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ Cancellation callback failed: {e}")
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled()
+
+    def wait(self, timeout=None):
+        """Block until cancelled or `timeout` passes; True if cancelled."""
+        return self._event.wait(timeout)
+
+    def on_cancel(self, callback):
+        """
+        Run `callback` when the token fires (immediately if it already has).
+
+        Returns:
+            callable: Unregisters the callback; call it once the work it
+                would interrupt has finished.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+class CancellationRegistry:
+    def __init__(self):
+        """
+        Tokens of the jobs running in this process, by task ID, so the API
+        can stop an embedded worker's job without a round trip through the
+        task store.
+        """
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def open(self, task_id):
+        """Create the token for a job that is starting."""
+        token = CancellationToken()
+        with self._lock:
+            self._tokens[task_id] = token
+        return token
+
+    def get(self, task_id):
+        with self._lock:
+            return self._tokens.get(task_id)
+
+    def close(self, task_id):
+        """Forget a job that has finished."""
+        with self._lock:
+            self._tokens.pop(task_id, None)
+
+    def cancel(self, task_id):
+        """
+        Cancel a job running in this process.
+
+        Returns:
+            bool: True if the job was running here.
+        """
+        token = self.get(task_id)
+        if token is None:
+            return False
+        token.cancel()
+        return True
+
+    def watch(self, task_id, is_cancelled, interval):
+        """
+        Poll `is_cancelled()` every `interval` seconds on a background thread
+        and cancel the job's token when it returns True. For workers running
+        in a different process from the API, where cancel() can't reach them.
+        """
+        token = self.get(task_id)
+        if token is None or interval <= 0:
+            return
+
+        def poll():
+            # Stops once the job finishes (its token is closed) or fires
+            while not token.wait(interval) and self.get(task_id) is token:
+                try:
+                    if is_cancelled():
+                        token.cancel()
+                except Exception as e:
+                    print(f"⚠️ Cancellation check failed for {task_id}: {e}")
+
+        threading.Thread(target=poll, name=f"cancel-watch-{task_id}", daemon=True).start()
+
+
+# One registry per process: the API cancels, the embedded workers listen
+_REGISTRY = CancellationRegistry()
+
+
+def get_cancellations():
+    return _REGISTRY
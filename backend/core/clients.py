@@ -0,0 +1,80 @@
+"""
+Process-wide Google Cloud clients.
+
+Every client here is built once and shared by all threads, so requests and
+jobs reuse authenticated sessions and open connections instead of paying an
+auth handshake and TLS setup per call.
+"""
+import json
+import os
+import threading
+from config import GCS_HTTP_POOL_SIZE
+
+_CLIENTS = {}
+_LOCK = threading.Lock()
+
+
+def _shared(key, factory):
+    with _LOCK:
+        if key not in _CLIENTS:
+            _CLIENTS[key] = factory()
+        return _CLIENTS[key]
+
+
+def _load_signing_credentials():
+    sa_key_json = os.environ.get("GCP_SA_KEY")
+    if sa_key_json:
+        # ✅ Production: the JSON key injected from Secret Manager can sign URLs
+        from google.oauth2 import service_account
+        return service_account.Credentials.from_service_account_info(json.loads(sa_key_json))
+
+    # ⚠️ Fallback: default credentials (cannot sign on Cloud Run without IAM Signer)
+    print("⚠️ GCP_SA_KEY not found. Falling back to default credentials.")
+    import google.auth
+    credentials, _ = google.auth.default()
+    return credentials
+
+
+def get_signing_credentials():
+    """Credentials used to sign download URLs, parsed once per process."""
+    return _shared("signing-credentials", _load_signing_credentials)
+
+
+def _build_storage_client(credentials=None):
+    import google.auth
+    import requests
+    from google.auth.transport.requests import AuthorizedSession
+    from google.cloud import storage
+
+    project = None
+    if credentials is None:
+        credentials, project = google.auth.default()
+
+    # requests keeps 10 connections per host by default; the API's I/O pool
+    # and the job workers share this session, so allow more.
+    session = AuthorizedSession(credentials)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=GCS_HTTP_POOL_SIZE, pool_maxsize=GCS_HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    return storage.Client(project=project or getattr(credentials, "project_id", None),
+                          credentials=credentials, _http=session)
+
+
+def get_storage_client(signing=False):
+    """
+    The shared GCS client.
+
+    Args:
+        signing (bool): Return a client whose credentials can sign URLs
+            (the GCP_SA_KEY service account when one is configured).
+    """
+    if signing and os.environ.get("GCP_SA_KEY"):
+        return _shared("storage-signing", lambda: _build_storage_client(get_signing_credentials()))
+    return _shared("storage", _build_storage_client)
+
+
+def get_firestore_client():
+    """The shared Firestore client (gRPC channels are pooled inside it)."""
+    def build():
+        from google.cloud import firestore
+        return firestore.Client()
+    return _shared("firestore", build)
@@ -1,38 +1,64 @@
 import subprocess
 import os
+import glob
 import yt_dlp
-from config import DOWNLOAD_DIR
+from config import DOWNLOAD_DIR, RESOLVE_CACHE_TTL, DOWNLOAD_AUDIO_MODE
+from core.cache import TTLCache
+from core.cancellation import Cancelled
+from core.transfer import TransferManager
+
+# 🔎 Query -> resolved video, shared by every downloader in this process
+_RESOLVE_CACHE = TTLCache(ttl=RESOLVE_CACHE_TTL)
 
 class AudioDownloader:
-    def __init__(self, output_dir=DOWNLOAD_DIR):
+    def __init__(self, output_dir=DOWNLOAD_DIR, audio_mode=DOWNLOAD_AUDIO_MODE, storage=None):
         """
         The AudioDownloader handles fetching high-quality audio from YouTube
         using either a direct URL or a search query (Song Name).
+
+        Args:
+            output_dir (str): Where downloaded audio is stored.
+            audio_mode (str): "source" keeps the native bestaudio stream
+                (opus/m4a), only remuxing it out of its container;
+                "mp3" re-encodes to 320k MP3.
+            storage: Storage backend for archiving downloads (see
+                core.storage); the shared one if None.
         """
         self.output_dir = output_dir
+        self.audio_mode = audio_mode
+        self._storage = storage
+        # Metadata (video_id, title, duration) of the most recent download
+        self.last_info = None
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
-    def download(self, query: str):
-        """
-        Download high-quality MP3 audio from YouTube using yt-dlp.
-        
-        Args:
-            query (str): YouTube URL or Song Name.
-            
-        Returns:
-            str: The absolute path to the downloaded audio file, or None if failed.
-        """
-        print(f"Searching and downloading: {query}")
+    @property
+    def storage(self):
+        if self._storage is None:
+            from core.storage import get_storage
+            self._storage = get_storage()
+        return self._storage
 
+    def _build_opts(self):
         # yt-dlp options for high quality audio extraction with Anti-Bot measures
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'postprocessors': [{
+        if self.audio_mode == "mp3":
+            # Full re-encode of the whole song to 320k MP3
+            extract_audio = {
                 'key': 'FFmpegExtractAudio',
                 'preferredcodec': 'mp3',
                 'preferredquality': '320',
-            }],
+            }
+        else:
+            # 'best' copies the existing audio stream (no re-encode, no
+            # generation loss) and only changes the container if needed
+            extract_audio = {
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'best',
+            }
+
+        ydl_opts = {
+            'format': 'bestaudio/best',
+            'postprocessors': [extract_audio],
             'default_search': 'ytsearch',
             'outtmpl': os.path.join(self.output_dir, '%(title)s.%(ext)s'),
             'restrictfilenames': True,
@@ -64,10 +90,106 @@ class AudioDownloader:
         else:
             print("⚠️ No cookies.txt found. YouTube might block this request on Cloud IPs.")
 
+        return ydl_opts
+
+    @staticmethod
+    def _resolve_key(query):
+        return " ".join((query or "").lower().split())
+
+    def resolve(self, query: str):
+        """
+        Look up which video a query points to without downloading anything.
+
+        Args:
+            query (str): YouTube URL or Song Name.
+
+        Returns:
+            dict: video_id, title, duration and canonical url, or None if failed.
+        """
+        key = self._resolve_key(query)
+        cached = _RESOLVE_CACHE.get(key)
+        if cached:
+            return cached
+
+        ydl_opts = self._build_opts()
+        ydl_opts.update({
+            'quiet': True,
+            # Search results only need their IDs, not full format extraction
+            'extract_flat': 'in_playlist',
+            'skip_download': True,
+        })
+        # Resolving never post-processes, so don't set up ffmpeg
+        ydl_opts.pop('postprocessors', None)
+
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(query, download=False)
+                if 'entries' in info:
+                    entries = list(info['entries'])
+                    if not entries:
+                        print(f"No results found for: {query}")
+                        return None
+                    info = entries[0]
+
+                video_id = info.get("id")
+                if not video_id:
+                    return None
+
+                resolved = {
+                    "video_id": video_id,
+                    "title": info.get("title"),
+                    "duration": info.get("duration"),
+                    "url": f"https://www.youtube.com/watch?v={video_id}",
+                }
+                _RESOLVE_CACHE.set(key, resolved)
+                print(f"🔎 Resolved '{query}' -> {video_id} ({resolved['title']})")
+                return resolved
+
+        except Exception as e:
+            print(f"Error while resolving query: {e}")
+            return None
+
+    def download(self, query: str, resolved=None, token=None):
+        """
+        Download high-quality audio from YouTube using yt-dlp, either as the
+        untouched source stream or as a 320k MP3 (see `audio_mode`).
+        
+        Args:
+            query (str): YouTube URL or Song Name.
+            resolved (dict): Output of `resolve(query)`, if already known.
+            token (CancellationToken): Aborts the transfer at the next chunk;
+                partial files are deleted and Cancelled is raised.
+            
+        Returns:
+            str: The absolute path to the downloaded audio file, or None if failed.
+        """
+        print(f"Searching and downloading: {query}")
+
+        # Download the canonical video when we already resolved the query
+        if resolved is None:
+            resolved = _RESOLVE_CACHE.get(self._resolve_key(query))
+        target = resolved["url"] if resolved else query
+
+        ydl_opts = self._build_opts()
+
+        # Files yt-dlp has written so far, removed again if the job is cancelled
+        written = set()
+        if token is not None:
+            def stop_if_cancelled(status):
+                for key in ("filename", "tmpfilename"):
+                    if status.get(key):
+                        written.add(status[key])
+                if token.cancelled:
+                    raise yt_dlp.utils.DownloadCancelled("Job cancelled")
+
+            # Called for every downloaded chunk and around each post-processor
+            ydl_opts['progress_hooks'] = [stop_if_cancelled]
+            ydl_opts['postprocessor_hooks'] = [stop_if_cancelled]
+
         try:
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
                 # Extract info and download
-                info = ydl.extract_info(query, download=True)
+                info = ydl.extract_info(target, download=True)
                 
                 # Handle both direct URLs and search results
                 if 'entries' in info:
@@ -76,39 +198,71 @@ class AudioDownloader:
                 else:
                     # Case: Direct URL
                     video_info = info
+
+                self.last_info = {
+                    "video_id": video_info.get("id"),
+                    "title": video_info.get("title"),
+                    "duration": video_info.get("duration"),
+                }
                 
-                # Get the actual filename generated
-                base_filename = ydl.prepare_filename(video_info)
-                final_filename = os.path.splitext(base_filename)[0] + ".mp3"
+                # Get the actual filename generated (after post-processing)
+                final_filename = self._final_filename(ydl, video_info)
                 
-                if os.path.exists(final_filename):
+                if final_filename and os.path.exists(final_filename):
                     print(f"Download Finished: {final_filename}")
+                    if token is not None and token.cancelled:
+                        written.add(final_filename)
+                        raise yt_dlp.utils.DownloadCancelled("Job cancelled")
                     
                     # 🚀 NEW: Upload to Google Cloud Storage
                     try:
-                        from google.cloud import storage
-                        from config import GCS_BUCKET_NAME
-                        
-                        client = storage.Client()
-                        bucket = client.bucket(GCS_BUCKET_NAME)
                         blob_name = f"downloads/{os.path.basename(final_filename)}"
-                        blob = bucket.blob(blob_name)
                         
-                        print(f"📦 Uploading to GCS: gs://{GCS_BUCKET_NAME}/{blob_name}...")
-                        blob.upload_from_filename(final_filename)
-                        print("✅ GCS Upload Complete!")
+                        print(f"📦 Uploading to GCS: {self.storage.uri(blob_name)}...")
+                        # ⚡ Sliced, resumable and skipped if the object is already identical
+                        if TransferManager(self.storage).upload(final_filename, blob_name) == "uploaded":
+                            print("✅ GCS Upload Complete!")
                     except Exception as gcs_err:
                         print(f"⚠️ GCS Upload failed (but local download succeeded): {gcs_err}")
                         
                     return final_filename
                 else:
-                    print("Error: Post-processor failed to create MP3 file.")
+                    print("Error: Post-processor failed to create the audio file.")
                     return None
 
         except Exception as e:
+            if token is not None and token.cancelled:
+                print(f"🛑 Download cancelled: {query}")
+                self._discard(written)
+                raise Cancelled() from e
             print(f"Error during YouTube download: {e}")
             return None
 
+    @staticmethod
+    def _discard(filenames):
+        """Delete the partial (and fragment) files of a cancelled download."""
+        for filename in filenames:
+            for path in [filename, *glob.glob(glob.escape(filename) + ".part*"), filename + ".ytdl"]:
+                if os.path.isfile(path):
+                    os.remove(path)
+
+    def _final_filename(self, ydl, video_info):
+        if self.audio_mode == "mp3":
+            base_filename = ydl.prepare_filename(video_info)
+            return os.path.splitext(base_filename)[0] + ".mp3"
+
+        # yt-dlp records the post-processed path of each requested download
+        for download in video_info.get('requested_downloads') or []:
+            if download.get('filepath'):
+                return download['filepath']
+
+        # Fallback: the remuxed file keeps the template name with a new extension
+        base = os.path.splitext(ydl.prepare_filename(video_info))[0]
+        for ext in ('opus', 'm4a', 'ogg', 'webm', 'aac', 'mp3', 'flac', 'wav'):
+            if os.path.exists(f"{base}.{ext}"):
+                return f"{base}.{ext}"
+        return None
+
     def get_downloaded_files(self):
         """Return a list of files in the download directory."""
         return [os.path.join(self.output_dir, f) for f in os.listdir(self.output_dir) if os.path.isfile(os.path.join(self.output_dir, f))]
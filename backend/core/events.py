@@ -0,0 +1,89 @@
+import asyncio
+import queue
+import threading
+from core.cache import TTLCache
+
+# Statuses after which a task never changes again
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+class Subscription:
+    def __init__(self, bus, topic, loop=None):
+        """
+        One listener's inbox for a topic.
+
+        Args:
+            bus (LocalEventBus): The bus this subscription belongs to.
+            topic (str): Usually a task ID.
+            loop (asyncio.AbstractEventLoop): Deliver into an asyncio.Queue on
+                this loop (for async handlers) instead of a thread queue.
+        """
+        self.bus = bus
+        self.topic = topic
+        self._loop = loop
+        self._queue = asyncio.Queue() if loop else queue.Queue()
+
+    def _deliver(self, event):
+        if self._loop:
+            # Publishers run on worker threads; hop onto the handler's loop
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+        else:
+            self._queue.put(event)
+
+    def get(self, timeout=None):
+        """Blocking receive (thread queues). Raises queue.Empty on timeout."""
+        return self._queue.get(timeout=timeout)
+
+    async def aget(self, timeout=None):
+        """Async receive. Raises asyncio.TimeoutError on timeout."""
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class LocalEventBus:
+    def __init__(self, retain_seconds=3600):
+        """
+        In-process pub/sub for task progress.
+
+        The latest event per topic is retained for `retain_seconds` so a
+        client that connects mid-job immediately gets the current state.
+        """
+        self._subscribers = {}
+        self._last = TTLCache(ttl=retain_seconds, max_entries=10000)
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic, loop=None):
+        subscription = Subscription(self, topic, loop)
+        with self._lock:
+            self._subscribers.setdefault(topic, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.topic, [])
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.topic, None)
+
+    def publish(self, topic, event):
+        """Send `event` (a dict) to every current subscriber of `topic`."""
+        self._last.set(topic, event)
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, []))
+        for subscription in subscribers:
+            subscription._deliver(event)
+
+    def last(self, topic):
+        """The most recent event published on `topic`, if still retained."""
+        return self._last.get(topic)
+
+
+# One bus per process: the embedded workers publish, the API streams
+_BUS = LocalEventBus()
+
+
+def get_event_bus():
+    return _BUS
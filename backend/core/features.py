@@ -0,0 +1,277 @@
+"""
+Block-by-block versions of the features AudioAnalyzer extracts.
+
+Each accumulator is fed consecutive blocks of a track through update() and
+returns the whole-track result from finish(), holding only a small amount of
+state in between. Peak memory therefore depends on the block size, not on
+the track's duration.
+"""
+import math
+import numpy as np
+
+N_FFT = 2048
+HOP_LENGTH = 512
+
+
+def resample(y, sr, target_sr):
+    """
+    Polyphase resampling of a 1D signal (scipy.signal.resample_poly), e.g.
+    44.1 kHz -> 22.05 kHz is a 1:2 ratio and 48 kHz -> 22.05 kHz is 147:320.
+    """
+    from scipy.signal import resample_poly
+
+    if target_sr == sr:
+        return y
+    g = math.gcd(int(sr), int(target_sr))
+    return resample_poly(y, int(target_sr) // g, int(sr) // g).astype(np.float32)
+
+
+class StreamResampler:
+    def __init__(self, sr, target_sr):
+        """
+        resample() applied block by block with the same output as resampling
+        the whole signal at once.
+
+        Blocks are cut on multiples of the decimation factor and carry enough
+        context on both sides to cover the anti-aliasing filter, so no
+        transients appear at block boundaries.
+        """
+        g = math.gcd(int(sr), int(target_sr))
+        self.up = int(target_sr) // g
+        self.down = int(sr) // g
+        # resample_poly's default filter spans 10 * max(up, down) taps on
+        # each side at the upsampled rate
+        half_taps = 10 * max(self.up, self.down)
+        context = math.ceil(half_taps / self.up) + 1
+        self.context = math.ceil(context / self.down) * self.down
+        self._left = np.zeros(0, dtype=np.float32)
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def _run(self, take, right_context):
+        from scipy.signal import resample_poly
+
+        segment = np.concatenate([self._left, self._pending[:take + right_context]])
+        out = resample_poly(segment, self.up, self.down)
+        start = len(self._left) * self.up // self.down
+        count = math.ceil(take * self.up / self.down)
+        self._left = np.concatenate([self._left, self._pending[:take]])[-self.context:]
+        self._pending = self._pending[take:]
+        return out[start:start + count].astype(np.float32)
+
+    def process(self, block):
+        """Resample the next block; output lags input by about `context` samples."""
+        if self.up == self.down:
+            return block
+        self._pending = np.concatenate([self._pending, block])
+        take = (len(self._pending) - self.context) // self.down * self.down
+        if take <= 0:
+            return np.zeros(0, dtype=np.float32)
+        return self._run(take, self.context)
+
+    def flush(self):
+        """Resample whatever is still buffered (the end of the track)."""
+        if self.up == self.down or not len(self._pending):
+            return np.zeros(0, dtype=np.float32)
+        return self._run(len(self._pending), 0)
+
+
+class OnsetEnvelope:
+    def __init__(self, sr, n_fft=N_FFT, hop_length=HOP_LENGTH, top_db=80.0):
+        """
+        librosa.onset.onset_strength (mel spectral flux, lag 1) computed
+        incrementally.
+
+        Frames are cut exactly as librosa's centred STFT would cut them. The
+        one difference is the dB floor: librosa clips at the track's global
+        maximum minus `top_db`, here it is the running maximum so far, which
+        only changes near-silent frames.
+
+        Args:
+            sr (int): Sample rate of the mono blocks passed to update().
+        """
+        import librosa
+
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.top_db = top_db
+        self._mel_basis = librosa.filters.mel(sr=sr, n_fft=n_fft)
+        # Centre padding: the first frame is centred on sample 0
+        self._carry = np.zeros(n_fft // 2, dtype=np.float32)
+        self._prev_db = None
+        self._max_db = -np.inf
+        self._frames = 0
+        # librosa shifts the envelope by lag + n_fft // (2 * hop) frames
+        self._envelope = [np.zeros(1 + n_fft // (2 * hop_length), dtype=np.float32)]
+
+    def _process(self, buffer):
+        """Analyse every complete frame in `buffer`; return how many there were."""
+        import librosa
+
+        if len(buffer) < self.n_fft:
+            return 0
+        n_frames = 1 + (len(buffer) - self.n_fft) // self.hop_length
+        spectrum = librosa.stft(
+            buffer[:(n_frames - 1) * self.hop_length + self.n_fft],
+            n_fft=self.n_fft, hop_length=self.hop_length, center=False,
+        )
+        mel = self._mel_basis @ (np.abs(spectrum) ** 2)
+        db = 10.0 * np.log10(np.maximum(1e-10, mel))
+        self._max_db = max(self._max_db, float(db.max()))
+        db = np.maximum(db, self._max_db - self.top_db)
+
+        if self._prev_db is not None:
+            db_with_prev = np.concatenate([self._prev_db[:, None], db], axis=1)
+        else:
+            db_with_prev = db
+        flux = np.maximum(0.0, np.diff(db_with_prev, axis=1)).mean(axis=0)
+
+        self._envelope.append(flux.astype(np.float32))
+        self._prev_db = db[:, -1]
+        self._frames += n_frames
+        return n_frames
+
+    def update(self, mono):
+        buffer = np.concatenate([self._carry, mono])
+        consumed = self._process(buffer)
+        self._carry = buffer[consumed * self.hop_length:]
+
+    def finish(self):
+        """The onset strength envelope, one value per hop."""
+        self._process(np.concatenate([self._carry, np.zeros(self.n_fft // 2, dtype=np.float32)]))
+        return np.concatenate(self._envelope)[:self._frames]
+
+
+class ChromaSum:
+    def __init__(self, sr, block_frames, hop_length=HOP_LENGTH, context_seconds=2.0):
+        """
+        Running sum of librosa.feature.chroma_cqt frames.
+
+        Each block is analysed together with `context_seconds` of audio on
+        both sides, so the long low-frequency CQT filters see the same
+        signal they would in a whole-track pass; only the frames that belong
+        to the block itself are kept.
+
+        Args:
+            sr (int): Sample rate of the mono blocks passed to update().
+            block_frames (int): Samples analysed per CQT call.
+        """
+        self.sr = sr
+        self.hop_length = hop_length
+        self.block = max(hop_length, block_frames // hop_length * hop_length)
+        self.context = int(np.ceil(context_seconds * sr / hop_length)) * hop_length
+        self._left = np.zeros(0, dtype=np.float32)
+        self._pending = np.zeros(0, dtype=np.float32)
+        self.total = np.zeros(12)
+        self.frames = 0
+
+    def _accumulate(self, segment, first_frame, n_frames=None):
+        import librosa
+
+        chroma = librosa.feature.chroma_cqt(y=segment, sr=self.sr, hop_length=self.hop_length)
+        last_frame = chroma.shape[1] if n_frames is None else first_frame + n_frames
+        kept = chroma[:, first_frame:last_frame]
+        self.total += kept.sum(axis=1)
+        self.frames += kept.shape[1]
+
+    def update(self, mono):
+        self._pending = np.concatenate([self._pending, mono])
+        while len(self._pending) >= self.block + self.context:
+            segment = np.concatenate([self._left, self._pending[:self.block + self.context]])
+            self._accumulate(segment, len(self._left) // self.hop_length, self.block // self.hop_length)
+            self._left = np.concatenate([self._left, self._pending[:self.block]])[-self.context:]
+            self._pending = self._pending[self.block:]
+
+    def finish(self):
+        """Mean chroma vector (12 pitch classes) over the whole track."""
+        # A centred frame grid always has one more frame than full hops, so
+        # the tail is analysed even when no samples are pending
+        if len(self._left) or len(self._pending):
+            segment = np.concatenate([self._left, self._pending])
+            self._accumulate(segment, len(self._left) // self.hop_length)
+        return self.total / max(self.frames, 1)
+
+
+class IntegratedLoudness:
+    # ITU-R BS.1770 gating, as implemented by pyloudnorm
+    GATE_SECONDS = 0.4
+    STEP = 0.25
+    CHANNEL_GAINS = [1.0, 1.0, 1.0, 1.41, 1.41]
+    ABSOLUTE_GATE = -70.0
+
+    def __init__(self, sr, channels):
+        """
+        pyloudnorm's Meter.integrated_loudness fed block by block.
+
+        The K-weighting filters keep their state between blocks (lfilter
+        with zi) and only the energy per 100 ms gating step is kept, so the
+        result matches a whole-track measurement.
+
+        Args:
+            sr (int): Sample rate of the blocks passed to update().
+            channels (int): Channel count of those blocks (at most 5).
+        """
+        import pyloudnorm as pyln
+
+        self.sr = sr
+        self.channels = channels
+        # The same K-weighting stages Meter applies (high shelf, then high pass)
+        meter = pyln.Meter(sr)
+        self._stages = [(f.b, f.a, f.passband_gain) for f in meter._filters.values()]
+        self._zi = [np.zeros((channels, max(len(a), len(b)) - 1)) for b, a, _ in self._stages]
+        self._steps = []
+        self._current = np.zeros(channels)
+        self._samples = 0
+
+    def _boundary(self, step_index):
+        # Same expression pyloudnorm uses for the start of gating block j
+        return int(self.GATE_SECONDS * (step_index * self.STEP) * self.sr)
+
+    def update(self, block):
+        """Feed a (channels, frames) block."""
+        from scipy.signal import lfilter
+
+        filtered = np.asarray(block, dtype=np.float64)
+        for i, (b, a, gain) in enumerate(self._stages):
+            filtered, self._zi[i] = lfilter(b, a, filtered, axis=1, zi=self._zi[i])
+            filtered = gain * filtered
+
+        position = 0
+        squared = filtered ** 2
+        while position < squared.shape[1]:
+            boundary = self._boundary(len(self._steps) + 1)
+            take = min(squared.shape[1] - position, boundary - self._samples)
+            self._current += squared[:, position:position + take].sum(axis=1)
+            position += take
+            self._samples += take
+            if self._samples == boundary:
+                self._steps.append(self._current)
+                self._current = np.zeros(self.channels)
+
+    def finish(self):
+        """Integrated loudness in LUFS (-inf for digital silence)."""
+        duration = self._samples / self.sr
+        if duration <= self.GATE_SECONDS:
+            raise ValueError("Audio must have length greater than the block size.")
+
+        steps = self._steps + [self._current]
+        cumulative = np.concatenate([np.zeros((1, self.channels)), np.cumsum(steps, axis=0)])
+        steps_per_block = int(round(1 / self.STEP))
+        n_blocks = int(np.round((duration - self.GATE_SECONDS) / (self.GATE_SECONDS * self.STEP))) + 1
+        starts = np.minimum(np.arange(n_blocks), len(steps))
+        ends = np.minimum(starts + steps_per_block, len(steps))
+        z = (cumulative[ends] - cumulative[starts]) / (self.GATE_SECONDS * self.sr)
+
+        gains = np.array(self.CHANNEL_GAINS[:self.channels])
+        with np.errstate(divide="ignore"):
+            block_loudness = -0.691 + 10.0 * np.log10(z @ gains)
+
+            above_absolute = block_loudness >= self.ABSOLUTE_GATE
+            if not above_absolute.any():
+                return float("-inf")
+            relative_gate = -0.691 + 10.0 * np.log10(z[above_absolute].mean(axis=0) @ gains) - 10.0
+
+            gated = (block_loudness > relative_gate) & (block_loudness > self.ABSOLUTE_GATE)
+            if not gated.any():
+                return float("-inf")
+            return float(-0.691 + 10.0 * np.log10(z[gated].mean(axis=0) @ gains))
@@ -0,0 +1,119 @@
+import os
+import subprocess
+import numpy as np
+
+# Stem output formats selectable per job.
+# "bitrate" (kbps) applies to lossy codecs and can be overridden as "mp3:192".
+STEM_FORMATS = {
+    "wav": {"ext": "wav", "container": "WAV", "subtype": "PCM_16"},
+    "wav24": {"ext": "wav", "container": "WAV", "subtype": "PCM_24"},
+    "wav32f": {"ext": "wav", "container": "WAV", "subtype": "FLOAT"},
+    "flac": {"ext": "flac", "container": "FLAC", "subtype": "PCM_24"},
+    "flac16": {"ext": "flac", "container": "FLAC", "subtype": "PCM_16"},
+    "mp3": {"ext": "mp3", "codec": "libmp3lame", "bitrate": 320},
+    "opus": {"ext": "opus", "codec": "libopus", "bitrate": 160, "samplerate": 48000},
+}
+
+
+def parse_stem_format(spec):
+    """
+    Parse a format spec such as "flac", "wav24" or "opus:128".
+
+    Returns:
+        dict: The format settings plus "name", the canonical spec
+            ("mp3" and "mp3:320" both become "mp3:320").
+
+    Raises:
+        ValueError: For unknown formats or bad bitrates.
+    """
+    name, _, bitrate = (spec or "wav").strip().lower().partition(":")
+    if name not in STEM_FORMATS:
+        raise ValueError(f"Unknown stem format '{spec}'. Choose from: {', '.join(STEM_FORMATS)}")
+
+    fmt = dict(STEM_FORMATS[name])
+    if "bitrate" in fmt:
+        if bitrate:
+            if not bitrate.isdigit() or not 32 <= int(bitrate) <= 512:
+                raise ValueError(f"Bitrate must be between 32 and 512 kbps, got '{bitrate}'")
+            fmt["bitrate"] = int(bitrate)
+        fmt["name"] = f"{name}:{fmt['bitrate']}"
+    elif bitrate:
+        raise ValueError(f"Format '{name}' does not take a bitrate")
+    else:
+        fmt["name"] = name
+    return fmt
+
+
+class _SoundFileWriter:
+    """WAV/FLAC written block by block through libsndfile."""
+
+    def __init__(self, path, fmt, samplerate, channels):
+        import soundfile as sf
+        self._file = sf.SoundFile(
+            path, mode="w", samplerate=samplerate, channels=channels,
+            format=fmt["container"], subtype=fmt["subtype"],
+        )
+
+    def write(self, block):
+        self._file.write(np.ascontiguousarray(block.T))
+
+    def close(self):
+        self._file.close()
+
+
+class _FFmpegWriter:
+    """MP3/Opus encoded on the fly by piping raw float32 PCM into ffmpeg."""
+
+    def __init__(self, path, fmt, samplerate, channels):
+        command = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "f32le", "-ar", str(samplerate), "-ac", str(channels), "-i", "pipe:0",
+            "-c:a", fmt["codec"], "-b:a", f"{fmt['bitrate']}k",
+        ]
+        if fmt.get("samplerate"):
+            command += ["-ar", str(fmt["samplerate"])]
+        command.append(path)
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, block):
+        # (channels, frames) -> interleaved little-endian float32
+        self._process.stdin.write(np.ascontiguousarray(block.T, dtype="<f4").tobytes())
+
+    def close(self):
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with code {self._process.returncode}")
+
+    def abort(self):
+        self._process.kill()
+        self._process.wait()
+
+
+class _ClippingWriter:
+    def __init__(self, writer):
+        self._writer = writer
+
+    def write(self, block):
+        self._writer.write(np.clip(np.asarray(block, dtype=np.float32), -1.0, 1.0))
+
+    def close(self):
+        self._writer.close()
+
+    def abort(self):
+        if hasattr(self._writer, "abort"):
+            self._writer.abort()
+        else:
+            self._writer.close()
+
+
+def open_stem_writer(path, fmt, samplerate, channels):
+    """
+    Open a streaming writer for one stem. Call write() with float32 blocks
+    shaped (channels, frames), in order, then close().
+
+    Samples are hard-clipped to [-1, 1]; callers that hold the whole stem
+    should rescale it first (as the demucs CLI does) to avoid clipping.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    writer = _FFmpegWriter if "codec" in fmt else _SoundFileWriter
+    return _ClippingWriter(writer(path, fmt, samplerate, channels))
@@ -0,0 +1,305 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from config import QUEUE_DB_PATH, JOB_LEASE_SECONDS
+
+QUEUED = "queued"
+RUNNING = "running"
+
+
+class JobQueue:
+    def __init__(self, db_path=QUEUE_DB_PATH, lease_seconds=JOB_LEASE_SECONDS, clock=time.time):
+        """
+        A persistent FIFO job queue backed by a local SQLite file.
+
+        The file can be shared by the API process and separate worker
+        processes, and jobs survive restarts (see `requeue_running`). Each
+        JobQueue has its own worker ID; the jobs it claims are leased to it
+        and stay leased while it calls `heartbeat`.
+
+        Every request for a job is a subscriber of it: the request that
+        queued it and any deduplicated into it. A job is only worth running
+        while at least one subscriber has not cancelled.
+
+        Args:
+            db_path (str): SQLite database file (":memory:" for tests).
+            lease_seconds (float): How long a claimed job stays owned
+                without a heartbeat.
+            clock (callable): Wall-clock time (shared across processes).
+        """
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self._clock = clock
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # One connection guarded by a lock; SQLite serialises across processes
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id TEXT UNIQUE NOT NULL,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    started_at REAL,
+                    dedupe_key TEXT
+                )
+            """)
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+            if "dedupe_key" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN dedupe_key TEXT")
+            if "worker_id" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN worker_id TEXT")
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS subscribers (
+                    task_id TEXT PRIMARY KEY,
+                    job_id TEXT NOT NULL,
+                    active INTEGER NOT NULL DEFAULT 1
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS subscribers_job ON subscribers (job_id)")
+
+    def enqueue(self, task_id, payload, dedupe_key=None):
+        """
+        Append a job to the tail of the queue.
+
+        Args:
+            task_id (str): Task the job belongs to.
+            payload (dict): JSON-serialisable job arguments.
+            dedupe_key (str): If a queued or running job that someone still
+                wants already has this key (e.g. the same video ID), no new
+                job is added and `task_id` subscribes to that one instead.
+
+        Returns:
+            str: `task_id`, or the task ID of the job it was deduplicated into.
+        """
+        with self._available:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if dedupe_key:
+                    row = self._conn.execute(
+                        "SELECT task_id FROM jobs WHERE dedupe_key = ? AND EXISTS ("
+                        "SELECT 1 FROM subscribers WHERE job_id = jobs.task_id AND active = 1"
+                        ") ORDER BY seq LIMIT 1",
+                        (dedupe_key,),
+                    ).fetchone()
+                    if row:
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO subscribers (task_id, job_id) VALUES (?, ?)", (task_id, row[0])
+                        )
+                        self._conn.execute("COMMIT")
+                        return row[0]
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO jobs (task_id, payload, state, enqueued_at, dedupe_key) VALUES (?, ?, ?, ?, ?)",
+                    (task_id, json.dumps(payload), QUEUED, self._clock(), dedupe_key),
+                )
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO subscribers (task_id, job_id) VALUES (?, ?)", (task_id, task_id)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._available.notify()
+            return task_id
+
+    def claim(self, timeout=None):
+        """
+        Take the oldest queued job and mark it running.
+
+        Args:
+            timeout (float): Seconds to wait for a job (None = don't wait).
+
+        Returns:
+            tuple: (task_id, payload) or None if the queue stayed empty.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        with self._available:
+            while True:
+                job = self._claim_locked()
+                if job or deadline is None:
+                    return job
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                # Poll as well, so jobs enqueued by another process are seen
+                self._available.wait(min(remaining, 1.0))
+
+    def _claim_locked(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT task_id, payload FROM jobs WHERE state = ? ORDER BY seq LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row:
+                now = self._clock()
+                self._conn.execute(
+                    "UPDATE jobs SET state = ?, started_at = ?, worker_id = ?, heartbeat_at = ? WHERE task_id = ?",
+                    (RUNNING, now, self.worker_id, now, row[0]),
+                )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return (row[0], json.loads(row[1])) if row else None
+
+    def complete(self, task_id):
+        """Drop a finished (or failed) job, and its subscribers, from the queue."""
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE task_id = ?", (task_id,))
+            self._conn.execute("DELETE FROM subscribers WHERE job_id = ?", (task_id,))
+
+    def remove(self, task_id):
+        """
+        Remove a job that has not started yet.
+
+        Returns:
+            bool: True if a queued job was removed.
+        """
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM jobs WHERE task_id = ? AND state = ?", (task_id, QUEUED))
+            if cursor.rowcount:
+                self._conn.execute("DELETE FROM subscribers WHERE job_id = ?", (task_id,))
+            return cursor.rowcount > 0
+
+    def subscribers(self, job_id):
+        """
+        Requests still waiting on a job, in the order they arrived.
+
+        Returns:
+            list: Task IDs of the subscribers that have not cancelled, or
+                None if the job was not queued through this queue.
+        """
+        with self._lock:
+            return self._subscribers_locked(job_id)
+
+    def _subscribers_locked(self, job_id):
+        rows = self._conn.execute(
+            "SELECT task_id, active FROM subscribers WHERE job_id = ? ORDER BY rowid", (job_id,)
+        ).fetchall()
+        if not rows:
+            return None
+        return [task_id for task_id, active in rows if active]
+
+    def finish(self, job_id):
+        """
+        Close a job that has reached its final status to new subscribers
+        (later requests for the same key get a job of their own), so none
+        can join after its final status was sent out.
+
+        Returns:
+            list: The subscribers to send the final status to, as for
+                `subscribers`.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("UPDATE jobs SET dedupe_key = NULL WHERE task_id = ?", (job_id,))
+                subscribers = self._subscribers_locked(job_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return subscribers
+
+    def unsubscribe(self, task_id):
+        """
+        Withdraw one request from the job it is waiting on (on cancel).
+
+        Returns:
+            tuple: (job_id, remaining): the shared job and how many
+                subscribers still want it. The job should only be stopped
+                once `remaining` is 0.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT job_id FROM subscribers WHERE task_id = ?", (task_id,)).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return task_id, 0
+                self._conn.execute("UPDATE subscribers SET active = 0 WHERE task_id = ?", (task_id,))
+                remaining = self._conn.execute(
+                    "SELECT COUNT(*) FROM subscribers WHERE job_id = ? AND active = 1", (row[0],)
+                ).fetchone()[0]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return row[0], remaining
+
+    def heartbeat(self):
+        """Renew the lease on every job this queue's worker is running."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE state = ? AND worker_id = ?",
+                (self._clock(), RUNNING, self.worker_id),
+            )
+
+    def requeue_running(self):
+        """
+        Put jobs left 'running' by a crashed worker back in line: those
+        whose lease ran out. Jobs other live processes are running keep
+        their lease through heartbeats and are left alone.
+
+        Returns:
+            int: Jobs requeued.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET state = ?, started_at = NULL, worker_id = NULL, heartbeat_at = NULL "
+                "WHERE state = ? AND COALESCE(heartbeat_at, started_at, 0) < ?",
+                (QUEUED, RUNNING, self._clock() - self.lease_seconds),
+            )
+            return cursor.rowcount
+
+    def depth(self):
+        """Number of jobs waiting to start."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (QUEUED,)).fetchone()[0]
+
+    def running(self):
+        """Number of jobs currently being worked on."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (RUNNING,)).fetchone()[0]
+
+    def position(self, task_id):
+        """
+        1-based position of a queued job, or None if it is not waiting.
+        `task_id` may also be a request deduplicated into the job.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT seq FROM jobs WHERE task_id = COALESCE("
+                "(SELECT job_id FROM subscribers WHERE task_id = ?), ?) AND state = ?",
+                (task_id, task_id, QUEUED),
+            ).fetchone()
+            if not row:
+                return None
+            ahead = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = ? AND seq < ?", (QUEUED, row[0])
+            ).fetchone()[0]
+            return ahead + 1
+
+
+# One queue per process, shared by the API handlers, the workers and the
+# workflow (which reports progress to every subscriber of a job)
+_QUEUE = None
+_QUEUE_LOCK = threading.Lock()
+
+
+def get_job_queue():
+    global _QUEUE
+    with _QUEUE_LOCK:
+        if _QUEUE is None:
+            _QUEUE = JobQueue()
+        return _QUEUE
@@ -1,20 +1,198 @@
 import os
 import json
+import queue
+import subprocess
+import tempfile
+import threading
 import zipfile
 from datetime import datetime
-from config import EXPORT_DIR
+from config import EXPORT_DIR, PACKAGE_STREAMING, PACKAGE_COMPRESSION
+from core.cancellation import Cancelled
+from core.transfer import TransferManager
+
+# Lossy/lossless codecs and archives: deflate can't shrink them, only slow down
+COMPRESSED_EXTENSIONS = {".mp3", ".opus", ".ogg", ".m4a", ".aac", ".webm", ".flac", ".zip"}
+
+# How PCM (WAV) entries are stored: (compress_type, compresslevel)
+COMPRESSION_POLICIES = {
+    "store": (zipfile.ZIP_STORED, None),
+    "fast": (zipfile.ZIP_DEFLATED, 1),
+    "deflate": (zipfile.ZIP_DEFLATED, 6),
+}
+
+
+def compression_for(filename, policy=PACKAGE_COMPRESSION):
+    """
+    Pick the ZIP compression for one entry.
+
+    Already-compressed audio is always STORED; everything else (WAV stems)
+    follows `policy` ("store", "fast" or "deflate").
+
+    Returns:
+        tuple: (compress_type, compresslevel) for ZipFile.write.
+    """
+    if os.path.splitext(filename)[1].lower() in COMPRESSED_EXTENSIONS:
+        return COMPRESSION_POLICIES["store"]
+    if policy not in COMPRESSION_POLICIES:
+        raise ValueError(f"Unknown compression policy: {policy}")
+    return COMPRESSION_POLICIES[policy]
+
+
+class _PipeWriter:
+    def __init__(self, upload, buffer_size=1024 * 1024, max_pending=8, token=None):
+        """
+        Write-only, non-seekable file object for ZipFile.
+
+        Compressed bytes are batched into `buffer_size` chunks and handed to
+        a background thread that feeds `upload`, so deflating the next entry
+        overlaps with sending the previous bytes. At most `max_pending`
+        chunks are held in memory. Writes raise Cancelled once `token` fires.
+        """
+        self.upload = upload
+        self.token = token
+        self.buffer_size = buffer_size
+        self._buffer = bytearray()
+        self._chunks = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def write(self, data):
+        if self._error:
+            raise self._error
+        if self.token is not None:
+            self.token.raise_if_cancelled()
+        self._buffer += data
+        if len(self._buffer) >= self.buffer_size:
+            self._chunks.put(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _drain(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                return
+            if self._error:
+                continue  # Keep draining so the writer never blocks
+            try:
+                self.upload.write(chunk)
+            except Exception as e:
+                self._error = e
+
+    def _stop(self):
+        if self._buffer and not self._error:
+            self._chunks.put(bytes(self._buffer))
+        self._buffer.clear()
+        self._chunks.put(None)
+        self._thread.join()
+
+    def finish(self):
+        """Flush everything and commit the upload."""
+        self._stop()
+        if self._error:
+            self.upload.abort()
+            raise self._error
+        self.upload.commit()
+
+    def abort(self):
+        """Stop uploading and discard the partial object."""
+        self._stop()
+        self.upload.abort()
+
 
 class Packager:
-    def __init__(self, output_dir=EXPORT_DIR):
+    def __init__(self, output_dir=EXPORT_DIR, storage=None, streaming=PACKAGE_STREAMING,
+                 compression=PACKAGE_COMPRESSION):
         """
         The Packager handles the final step: bundling stems, metadata, and 
         the original track into a professional ZIP package.
+
+        Args:
+            output_dir (str): Local folder for ZIPs when not streaming.
+            storage: Storage backend (see core.storage); built on first use.
+            streaming (bool): Write the ZIP straight into storage without a
+                local copy in `output_dir`.
+            compression (str): Policy for WAV entries (see COMPRESSION_POLICIES).
         """
         self.output_dir = output_dir
+        self.compression = compression
+        self._storage = storage
+        self.streaming = streaming
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
-    def create_package(self, track_name, original_file, stems_dir, analysis_data):
+    @property
+    def storage(self):
+        if self._storage is None:
+            from core.storage import get_storage
+            self._storage = get_storage()
+        return self._storage
+
+    def _transcode_to_mp3(self, source_file):
+        """Encode the original to a temporary 320k MP3 with ffmpeg."""
+        fd, mp3_path = tempfile.mkstemp(suffix=".mp3", dir=self.output_dir)
+        os.close(fd)
+        command = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-i", source_file,
+            "-vn", "-codec:a", "libmp3lame", "-b:a", "320k",
+            mp3_path,
+        ]
+        subprocess.run(command, check=True)
+        return mp3_path
+
+    def _add_file(self, zipf, path, arcname):
+        compress_type, compresslevel = compression_for(arcname, self.compression)
+        zipf.write(path, arcname=arcname, compress_type=compress_type, compresslevel=compresslevel)
+
+    def _write_entries(self, zipf, original_file, stems_dir, analysis_data, original_format, token=None):
+        """
+        Adds the original, the stems and metadata.json to an open ZipFile,
+        checking `token` before each entry.
+
+        Returns:
+            str: A temporary transcoded file the caller must delete, or None.
+        """
+        transcoded_file = None
+        check = token.raise_if_cancelled if token is not None else (lambda: None)
+
+        try:
+            # 2. Add the original audio file
+            check()
+            if os.path.exists(original_file):
+                original_name = os.path.basename(original_file)
+                if original_format == "mp3" and not original_name.lower().endswith(".mp3"):
+                    transcoded_file = self._transcode_to_mp3(original_file)
+                    original_file = transcoded_file
+                    original_name = os.path.splitext(original_name)[0] + ".mp3"
+                # arcname is how the file appears inside the ZIP
+                self._add_file(zipf, original_file, f"00_Original_{original_name}")
+
+            # 3. Add all stems found in the stems directory
+            if os.path.exists(stems_dir):
+                for stem_file in sorted(os.listdir(stems_dir)):
+                    stem_path = os.path.join(stems_dir, stem_file)
+                    if os.path.isfile(stem_path):
+                        check()
+                        # We put stems in their own folder inside the ZIP
+                        self._add_file(zipf, stem_path, f"Stems/{stem_file}")
+
+            # 4. Add the metadata.json straight from memory
+            # This makes the results readable by other programs or users
+            zipf.writestr("metadata.json", json.dumps(analysis_data, indent=4))
+        except Exception:
+            if transcoded_file and os.path.exists(transcoded_file):
+                os.remove(transcoded_file)
+            raise
+
+        return transcoded_file
+
+    def create_package(self, track_name, original_file, stems_dir, analysis_data, original_format=None,
+                       stem_analysis=None, token=None):
         """
         Bundles everything into a single ZIP file.
         
@@ -23,64 +201,96 @@ class Packager:
             original_file (str): Path to the original audio file.
             stems_dir (str): Path to the folder containing stems.
             analysis_data (dict): Dictionary with BPM, Key, Loudness info.
+            original_format (str): "mp3" to ship the original as an MP3
+                (encoded here, only when asked for); otherwise the
+                downloaded file is packaged as-is.
+            stem_analysis (dict): Per-stem results (AudioAnalyzer.analyze_stems),
+                stored under "stem_analysis" in metadata.json.
+            token (CancellationToken): Stops packaging early; the partial ZIP
+                (local file or upload) is discarded and Cancelled is raised.
             
         Returns:
-            str: Path to the generated ZIP file.
+            str: Location of the ZIP (storage URI when streaming, else a local path).
         """
         # 1. Clean up the track name for use in a filename
         clean_name = track_name.replace(" ", "_").replace("/", "-")
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         zip_filename = f"StemSense_{clean_name}_{timestamp}.zip"
-        zip_path = os.path.join(self.output_dir, zip_filename)
 
         print(f"Creating package: {zip_filename}")
 
+        if stem_analysis:
+            analysis_data = {**(analysis_data or {}), "stem_analysis": stem_analysis}
+
+        if self.streaming:
+            return self._create_streaming(zip_filename, original_file, stems_dir, analysis_data, original_format, token)
+        return self._create_local(zip_filename, original_file, stems_dir, analysis_data, original_format, token)
+
+    def _create_streaming(self, zip_filename, original_file, stems_dir, analysis_data, original_format, token=None):
+        """Compress entries directly into a resumable upload; no local ZIP."""
+        blob_name = f"exports/{zip_filename}"
+        transcoded_file = None
+        pipe = None
+
+        try:
+            print(f"📦 Streaming ZIP to storage: {self.storage.uri(blob_name)}...")
+            pipe = _PipeWriter(self.storage.open_write(blob_name, content_type="application/zip"), token=token)
+            with zipfile.ZipFile(pipe, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                transcoded_file = self._write_entries(
+                    zipf, original_file, stems_dir, analysis_data, original_format, token)
+            pipe.finish()
+            pipe = None
+
+            print(f"✅ Package streamed successfully: {self.storage.uri(blob_name)}")
+            return self.storage.uri(blob_name)
+
+        except Cancelled:
+            print(f"🛑 Packaging cancelled: {zip_filename}")
+            if pipe is not None:
+                pipe.abort()
+            raise
+        except Exception as e:
+            print(f"Error during packaging: {e}")
+            if pipe is not None:
+                pipe.abort()
+            return None
+        finally:
+            if transcoded_file and os.path.exists(transcoded_file):
+                os.remove(transcoded_file)
+
+    def _create_local(self, zip_filename, original_file, stems_dir, analysis_data, original_format, token=None):
+        """Build the ZIP in output_dir, then archive a copy to storage."""
+        zip_path = os.path.join(self.output_dir, zip_filename)
+        transcoded_file = None
+
         try:
             with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                # 2. Add the original audio file
-                if os.path.exists(original_file):
-                    # arcname is how the file appears inside the ZIP
-                    zipf.write(original_file, arcname=f"00_Original_{os.path.basename(original_file)}")
-                
-                # 3. Add all stems found in the stems directory
-                if os.path.exists(stems_dir):
-                    for stem_file in os.listdir(stems_dir):
-                        stem_path = os.path.join(stems_dir, stem_file)
-                        if os.path.isfile(stem_path):
-                            # We put stems in their own folder inside the ZIP
-                            zipf.write(stem_path, arcname=f"Stems/{stem_file}")
-                
-                # 4. Create and add the metadata.json
-                # This makes the results readable by other programs or users
-                metadata_path = os.path.join(self.output_dir, f"{clean_name}_metadata.json")
-                with open(metadata_path, 'w') as f:
-                    json.dump(analysis_data, f, indent=4)
-                
-                zipf.write(metadata_path, arcname="metadata.json")
-                
-                # Cleanup the temporary metadata file after zipping
-                os.remove(metadata_path)
+                transcoded_file = self._write_entries(
+                    zipf, original_file, stems_dir, analysis_data, original_format, token)
 
             print(f"Package created successfully: {zip_path}")
+            if token is not None:
+                token.raise_if_cancelled()
             
-            # 🚀 NEW: Upload the final package to GCS
+            # 🚀 NEW: Upload the final package to storage
             try:
-                from google.cloud import storage
-                from config import GCS_BUCKET_NAME
-                
-                client = storage.Client()
-                bucket = client.bucket(GCS_BUCKET_NAME)
-                blob_name = f"exports/{os.path.basename(zip_path)}"
-                blob = bucket.blob(blob_name)
-                
-                print(f"📦 Archiving ZIP to GCS: gs://{GCS_BUCKET_NAME}/{blob_name}...")
-                blob.upload_from_filename(zip_path)
-                print("✅ GCS Archive Complete!")
+                blob_name = f"exports/{zip_filename}"
+                print(f"📦 Archiving ZIP to storage: {self.storage.uri(blob_name)}...")
+                if TransferManager(self.storage).upload(zip_path, blob_name) == "uploaded":
+                    print("✅ Storage Archive Complete!")
             except Exception as gcs_err:
-                print(f"⚠️ GCS Archive failed: {gcs_err}")
+                print(f"⚠️ Storage Archive failed: {gcs_err}")
 
             return zip_path
 
+        except Cancelled:
+            print(f"🛑 Packaging cancelled: {zip_filename}")
+            if os.path.exists(zip_path):
+                os.remove(zip_path)
+            raise
         except Exception as e:
             print(f"Error during packaging: {e}")
             return None
+        finally:
+            if transcoded_file and os.path.exists(transcoded_file):
+                os.remove(transcoded_file)
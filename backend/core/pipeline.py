@@ -0,0 +1,148 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from core.cancellation import Cancelled
+
+# How often a running job notices its token while waiting on stages (seconds)
+CANCEL_POLL_SECONDS = 0.2
+
+
+class PipelineCancelled(Cancelled):
+    """Raised when a cancellation checkpoint fires between stages."""
+
+
+class StageFailed(Exception):
+    def __init__(self, stage, message):
+        super().__init__(message)
+        self.stage = stage
+        self.message = message
+
+
+class Stage:
+    def __init__(self, name, func, requires=(), status=None, error=None, required=True, resource=None):
+        """
+        One step of a job's workflow.
+
+        Args:
+            name (str): Unique stage name; its return value is stored under it.
+            func (callable): Called as func(results) with the outputs of
+                every finished stage so far.
+            requires (tuple): Names of stages that must finish first.
+            status (str): Task status to report while this stage runs.
+            error (str): Failure message used when func returns None.
+            required (bool): If False, a None result does not fail the job.
+            resource (str): Resource class (e.g. "separate") whose limiter
+                slot must be held while the stage runs.
+        """
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.status = status
+        self.error = error or f"{name} failed"
+        self.required = required
+        self.resource = resource
+
+
+class StageExecutor:
+    def __init__(self, stages, is_cancelled=None, on_status=None, max_workers=2, limiter=None, token=None):
+        """
+        Runs a DAG of stages, starting each one as soon as its inputs exist,
+        so independent stages (e.g. separation and analysis) overlap.
+
+        Args:
+            stages (list[Stage]): Stages in their natural (reporting) order.
+            is_cancelled (callable): Checkpoint polled before a stage starts
+                and after each stage finishes.
+            on_status (callable): Receives the status of the earliest
+                still-running stage whenever it changes.
+            max_workers (int): Threads available for concurrent stages.
+            limiter (ResourceLimiter): Shared per-resource concurrency caps.
+            token (CancellationToken): The job's token. run() notices it
+                firing within CANCEL_POLL_SECONDS, starts no further stages,
+                waits for the running ones (stages that honour the token
+                return early) and raises PipelineCancelled.
+        """
+        self.stages = list(stages)
+        self.is_cancelled = is_cancelled or (lambda: False)
+        self.on_status = on_status or (lambda status: None)
+        self.max_workers = max_workers
+        self.limiter = limiter
+        self.token = token
+        self.results = {}
+        self._status = None
+
+        names = [stage.name for stage in self.stages]
+        for stage in self.stages:
+            missing = [r for r in stage.requires if r not in names]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' requires unknown stages: {missing}")
+
+    def _checkpoint(self):
+        if (self.token is not None and self.token.cancelled) or self.is_cancelled():
+            raise PipelineCancelled()
+
+    def _call(self, stage, results):
+        if self.limiter is None or stage.resource is None:
+            return stage.func(results)
+        with self.limiter.slot(stage.resource):
+            return stage.func(results)
+
+    def _report(self, running):
+        # While several stages overlap, show the earliest declared one so the
+        # task still walks through its statuses in the usual order.
+        active = [s for s in self.stages if s in running.values() and s.status]
+        if active and active[0].status != self._status:
+            self._status = active[0].status
+            self.on_status(self._status)
+
+    def run(self):
+        """
+        Execute every stage.
+
+        Returns:
+            dict: Stage name -> stage result.
+
+        Raises:
+            PipelineCancelled: If a checkpoint saw the task cancelled.
+            Cancelled: If a stage stopped early because the token fired.
+            StageFailed: If a required stage returned None.
+
+        run() only returns or raises once every stage it started has
+        returned, so a failed or cancelled job never leaves a stage holding
+        CPU, memory or a limiter slot behind it.
+        """
+        pending = list(self.stages)
+        running = {}
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+
+        try:
+            while pending or running:
+                ready = [s for s in pending if all(r in self.results for r in s.requires)]
+                for stage in ready:
+                    # 🛑 CHECKPOINT: before starting a stage
+                    self._checkpoint()
+                    pending.remove(stage)
+                    running[pool.submit(self._call, stage, dict(self.results))] = stage
+                self._report(running)
+
+                if not running:
+                    raise StageFailed(pending[0].name, f"Stage '{pending[0].name}' can never run")
+
+                timeout = CANCEL_POLL_SECONDS if self.token is not None else None
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    # 🛑 CHECKPOINT: the token fired while stages were running
+                    self._checkpoint()
+                    continue
+                for future in done:
+                    stage = running.pop(future)
+                    value = future.result()
+                    if value is None and stage.required:
+                        raise StageFailed(stage.name, stage.error)
+                    self.results[stage.name] = value
+
+                # 🛑 CHECKPOINT: after a stage finishes
+                self._checkpoint()
+
+            return self.results
+        finally:
+            # Drop stages that haven't started; wait for the running ones
+            pool.shutdown(wait=True, cancel_futures=True)
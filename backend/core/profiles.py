@@ -0,0 +1,108 @@
+from config import DEMUCS_MODEL
+
+# Pretrained Demucs models selectable per job (plus the configured DEMUCS_MODEL)
+SEPARATION_MODELS = ("htdemucs", "htdemucs_ft", "mdx_extra_q")
+
+# Longest segment (seconds) a Transformer model can run on: the length it was
+# trained on. Demucs refuses longer ones, so they are rejected up front.
+TRAINED_SEGMENT_SECONDS = {"htdemucs": 7.8, "htdemucs_ft": 7.8, "htdemucs_6s": 7.8}
+
+# Named separation presets (model None = the separator's default model). Any
+# setting can be overridden as "<profile>:<key>=<value>,...", e.g.
+# "standard:shifts=2"; a model name on its own means "standard" with it.
+SEPARATION_PROFILES = {
+    # Four stems with the default model; what every job got before profiles
+    "standard": {"model": None, "two_stems": None, "shifts": 1, "overlap": 0.25, "segment": None},
+    # Vocals + instrumental (no_vocals) only
+    "karaoke": {"model": None, "two_stems": "vocals", "shifts": 1, "overlap": 0.25, "segment": None},
+    # Fine-tuned model averaged over two shifts: best quality, ~8x the compute
+    "best": {"model": "htdemucs_ft", "two_stems": None, "shifts": 2, "overlap": 0.25, "segment": None},
+    # Quantized MDX model with less window overlap: quickest, lower quality
+    "fast": {"model": "mdx_extra_q", "two_stems": None, "shifts": 1, "overlap": 0.1, "segment": None},
+}
+DEFAULT_PROFILE = "standard"
+
+# Stems a two-stem separation can isolate (the rest is summed into no_<stem>)
+TWO_STEM_CHOICES = ("vocals", "drums", "bass", "other")
+
+
+def _setting(key, value, default_model):
+    """Validate and convert one `key=value` override."""
+    if key == "model":
+        if value not in SEPARATION_MODELS and value != default_model:
+            raise ValueError(f"Unknown model '{value}'. Choose from: {', '.join(SEPARATION_MODELS)}")
+        return value
+    if key == "two_stems":
+        if value in ("", "none"):
+            return None
+        if value not in TWO_STEM_CHOICES:
+            raise ValueError(f"two_stems must be one of: {', '.join(TWO_STEM_CHOICES)}")
+        return value
+    try:
+        if key == "shifts":
+            shifts = int(value)
+            if not 0 <= shifts <= 10:
+                raise ValueError
+            return shifts
+        if key == "overlap":
+            overlap = float(value)
+            if not 0.0 <= overlap < 1.0:
+                raise ValueError
+            return overlap
+        if key == "segment":
+            if value in ("", "none"):
+                return None
+            segment = float(value)
+            if segment <= 0:
+                raise ValueError
+            return segment
+    except ValueError:
+        raise ValueError(f"Bad value for {key}: '{value}'")
+    raise ValueError(f"Unknown separation setting '{key}'")
+
+
+def parse_separation_profile(spec, default_model=DEMUCS_MODEL):
+    """
+    Parse a profile spec such as "karaoke", "best", "htdemucs_ft" or
+    "standard:model=htdemucs_ft,shifts=2,two_stems=vocals".
+
+    Returns:
+        dict: model, two_stems, shifts, overlap and segment, plus "name",
+            the canonical spec: the model followed by every setting that
+            differs from the standard profile ("htdemucs", or
+            "htdemucs:two_stems=vocals" for "karaoke"). Specs that resolve to
+            the same settings share a name, and so share cached results.
+
+    Raises:
+        ValueError: For unknown profiles or settings and bad values,
+            including a segment longer than the model was trained on.
+    """
+    base, _, overrides = (spec or DEFAULT_PROFILE).strip().lower().partition(":")
+    # The default model is a valid base too, so canonical names parse back
+    if base in SEPARATION_MODELS or base == default_model:
+        profile = {**SEPARATION_PROFILES[DEFAULT_PROFILE], "model": base}
+    elif base in SEPARATION_PROFILES:
+        profile = dict(SEPARATION_PROFILES[base])
+    else:
+        raise ValueError(f"Unknown separation profile '{spec}'. "
+                         f"Choose from: {', '.join((*SEPARATION_PROFILES, *SEPARATION_MODELS))}")
+    profile["model"] = profile["model"] or default_model
+
+    for item in filter(None, (part.strip() for part in overrides.split(","))):
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"Expected key=value, got '{item}'")
+        profile[key.strip()] = _setting(key.strip(), value.strip(), default_model)
+
+    limit = TRAINED_SEGMENT_SECONDS.get(profile["model"])
+    if profile["segment"] is not None and limit is not None and profile["segment"] > limit:
+        raise ValueError(f"segment must be at most {limit} seconds for {profile['model']}")
+
+    standard = SEPARATION_PROFILES[DEFAULT_PROFILE]
+    changed = [
+        f"{key}={'none' if profile[key] is None else profile[key]}"
+        for key in ("two_stems", "shifts", "overlap", "segment")
+        if profile[key] != standard[key]
+    ]
+    profile["name"] = profile["model"] + (":" + ",".join(changed) if changed else "")
+    return profile
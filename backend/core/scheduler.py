@@ -0,0 +1,120 @@
+import threading
+import traceback
+from contextlib import contextmanager
+from config import RESOURCE_LIMITS, JOB_WORKERS
+
+
+class ResourceLimiter:
+    def __init__(self, limits=None):
+        """
+        Caps how many stages of each resource class run at once in this
+        process, e.g. {"download": 2, "separate": 1}.
+
+        Args:
+            limits (dict): Resource class -> maximum concurrent holders.
+                Classes that are not listed are unlimited.
+        """
+        self.limits = dict(RESOURCE_LIMITS if limits is None else limits)
+        self._semaphores = {name: threading.BoundedSemaphore(n) for name, n in self.limits.items()}
+        self._in_use = {name: 0 for name in self.limits}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, resource):
+        """Hold one slot of `resource` for the duration of the block."""
+        semaphore = self._semaphores.get(resource)
+        if semaphore is None:
+            yield
+            return
+
+        semaphore.acquire()
+        with self._lock:
+            self._in_use[resource] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_use[resource] -= 1
+            semaphore.release()
+
+    def in_use(self):
+        """Current holders per resource class."""
+        with self._lock:
+            return dict(self._in_use)
+
+
+# One limiter per process so every job competes for the same slots
+_LIMITER = None
+_LIMITER_LOCK = threading.Lock()
+
+
+def get_limiter():
+    global _LIMITER
+    with _LIMITER_LOCK:
+        if _LIMITER is None:
+            _LIMITER = ResourceLimiter()
+        return _LIMITER
+
+
+class WorkerPool:
+    def __init__(self, queue, handler, workers=JOB_WORKERS):
+        """
+        A fixed number of threads pulling jobs from a JobQueue in FIFO order.
+
+        Args:
+            queue (JobQueue): Where jobs come from.
+            handler (callable): Called as handler(task_id, payload).
+            workers (int): Maximum jobs in flight in this process.
+        """
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _recover(self):
+        recovered = self.queue.requeue_running()
+        if recovered:
+            print(f"🔁 Re-queued {recovered} job(s) whose worker stopped heartbeating.")
+
+    def start(self):
+        """Start the worker threads (recovering jobs orphaned by a crash)."""
+        self._recover()
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"stemsense-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name="stemsense-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        print(f"👷 Worker pool started with {self.workers} worker(s).")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _heartbeat(self):
+        """Keep this process's leases alive and pick up jobs of crashed peers."""
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            try:
+                self.queue.heartbeat()
+                self._recover()
+            except Exception as e:
+                print(f"⚠️ Queue heartbeat failed: {e}")
+
+    def _loop(self):
+        while not self._stop.is_set():
+            job = self.queue.claim(timeout=1.0)
+            if job is None:
+                continue
+
+            task_id, payload = job
+            try:
+                self.handler(task_id, payload)
+            except Exception:
+                print(f"❌ Job {task_id} crashed:")
+                traceback.print_exc()
+            finally:
+                self.queue.complete(task_id)
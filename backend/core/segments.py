@@ -0,0 +1,87 @@
+"""
+Overlap-add processing of long signals in fixed-size windows.
+
+Used by the segmented separation mode: the model only ever sees one window,
+and each finished region of output is handed on (written to disk) as soon as
+the window after it has been blended in, so memory does not grow with the
+length of the track.
+"""
+import numpy as np
+
+
+def crossfade(length, fade_in, fade_out):
+    """
+    Window weights: linear ramps over the first `fade_in` and last
+    `fade_out` frames. A fade-out and the next window's fade-in of the same
+    length sum to exactly 1 at every frame.
+    """
+    weights = np.ones(length, dtype=np.float32)
+    if fade_in:
+        weights[:fade_in] = (np.arange(fade_in, dtype=np.float32) + 0.5) / fade_in
+    if fade_out:
+        weights[length - fade_out:] *= 1.0 - (np.arange(fade_out, dtype=np.float32) + 0.5) / fade_out
+    return weights
+
+
+def iter_windows(blocks, segment, overlap):
+    """
+    Regroup (..., frames) blocks of any size, e.g. (channels, frames), into
+    windows of `segment` frames, each overlapping the previous one by
+    `overlap` frames.
+
+    Yields:
+        tuple: (start_frame, window, is_last). The last window may be shorter.
+    """
+    if not 0 <= overlap < segment:
+        raise ValueError("overlap must be shorter than the segment")
+    hop = segment - overlap
+    buffer = None
+    start = 0
+    for block in blocks:
+        buffer = block if buffer is None else np.concatenate([buffer, block], axis=-1)
+        # Strictly longer than a segment: another window follows this one
+        while buffer.shape[-1] > segment:
+            yield start, buffer[..., :segment], False
+            buffer = buffer[..., hop:]
+            start += hop
+    if buffer is not None and buffer.shape[-1]:
+        yield start, buffer, True
+
+
+def overlap_add(blocks, process, segment, overlap, progress=None, total_frames=None):
+    """
+    Run `process` over overlapping windows of a signal and blend the results.
+
+    Args:
+        blocks (iterable): Input blocks shaped (..., frames), in order.
+        process (callable): Maps a (..., n) window to an output shaped
+            (..., n), e.g. (channels, n) to (sources, channels, n) for a
+            separation model.
+        segment (int): Window length in frames.
+        overlap (int): Frames shared by consecutive windows (crossfaded).
+        progress (callable): Receives the completed fraction after each window.
+        total_frames (int): Expected input length, for progress reporting.
+
+    Yields:
+        np.ndarray: Consecutive finished output regions (..., frames); their
+            lengths add up to the input length.
+    """
+    tail = None
+    for start, window, is_last in iter_windows(blocks, segment, overlap):
+        out = np.asarray(process(window), dtype=np.float32)
+        length = out.shape[-1]
+        fade_in = overlap if start > 0 else 0
+        fade_out = 0 if is_last else overlap
+        out = out * crossfade(length, fade_in, fade_out)
+
+        if tail is not None:
+            out[..., :overlap] += tail
+        if is_last:
+            tail = None
+            yield out
+        else:
+            tail = out[..., length - overlap:].copy()
+            yield out[..., :length - overlap]
+
+        if progress and total_frames:
+            progress(min(1.0, (start + length) / total_frames))
@@ -1,33 +1,301 @@
+import math
 import os
+import shutil
 import subprocess
-from config import STEMS_DIR
+import threading
+import time
+import numpy as np
+from config import (
+    STEMS_DIR, DEMUCS_ENGINE, DEMUCS_MODEL, STEM_FORMAT, SEPARATION_MODE, SEPARATION_PROFILE,
+    SEPARATION_SEGMENTED_MIN_SECONDS, SEPARATION_SEGMENT_SECONDS, SEPARATION_OVERLAP_SECONDS,
+)
+from core.audio import DecodedAudio, AudioStream
+from core.cancellation import Cancelled
+from core.formats import parse_stem_format, open_stem_writer
+from core.profiles import parse_separation_profile
+from core.transfer import TransferManager
+
+# 🧠 Process-wide model cache
+# Loading htdemucs weights costs several seconds, so every StemSeparator in
+# this worker shares the same resident model per (model name, device).
+_MODEL_CACHE = {}
+_MODEL_LOCK = threading.Lock()
+
+
+def detect_device():
+    """Return "cuda" if torch can see a GPU, otherwise "cpu"."""
+    try:
+        import torch
+        if torch.cuda.is_available():
+            print("🚀 CUDA GPU detected! Using GPU for high-speed separation.")
+            return "cuda"
+        print("💻 GPU not detected or not supported. Falling back to CPU.")
+    except ImportError:
+        print("📦 Torch not found. Defaulting to CPU.")
+    return "cpu"
+
+
+def get_model(name=DEMUCS_MODEL, device="cpu"):
+    """
+    Load a pretrained Demucs model once per worker and keep it resident.
+
+    Returns:
+        The cached model, already moved to `device` and in eval mode.
+    """
+    key = (name, device)
+    with _MODEL_LOCK:
+        model = _MODEL_CACHE.get(key)
+        if model is None:
+            from demucs.pretrained import get_model as load_pretrained
+
+            print(f"🧠 Loading Demucs model '{name}' on {device}...")
+            model = load_pretrained(name)
+            model.to(device)
+            model.eval()
+            _MODEL_CACHE[key] = model
+        return model
+
+
+def _match_channels(block, channels):
+    """Channel conversion with the same rules as demucs' convert_audio_channels."""
+    if block.shape[0] == channels:
+        return block
+    if channels == 1:
+        return block.mean(axis=0, keepdims=True)
+    if block.shape[0] == 1:
+        return np.repeat(block, channels, axis=0)
+    return block[:channels]
+
+
+def _model_blocks(source, samplerate, channels, block_frames):
+    """
+    Yield blocks of `source` (DecodedAudio or AudioStream) converted to the
+    model's sample rate and channel count.
+    """
+    from core.features import StreamResampler
+
+    resamplers = None
+    if source.sample_rate != samplerate:
+        resamplers = [StreamResampler(source.sample_rate, samplerate) for _ in range(channels)]
+    for block in source.blocks(block_frames):
+        block = _match_channels(np.asarray(block, dtype=np.float32), channels)
+        if resamplers:
+            block = np.stack([r.process(channel) for r, channel in zip(resamplers, block)])
+        if block.shape[1]:
+            yield block
+    if resamplers:
+        tail = np.stack([r.flush() for r in resamplers])
+        if tail.shape[1]:
+            yield tail
+
+
+def _reference_stats(source, channels, block_frames):
+    """Mean and std of the mono reference, the statistics demucs normalises by."""
+    count, total, squares = 0, 0.0, 0.0
+    for block in source.blocks(block_frames):
+        ref = _match_channels(np.asarray(block, dtype=np.float32), channels).mean(axis=0, dtype=np.float64)
+        count += ref.size
+        total += float(ref.sum())
+        squares += float(np.dot(ref, ref))
+    mean = total / max(count, 1)
+    # Unbiased, like torch.Tensor.std()
+    variance = (squares - count * mean * mean) / max(count - 1, 1)
+    return mean, math.sqrt(max(variance, 0.0))
+
+
+def _run_model(model, mix, device, profile):
+    """apply_model on a (batch, channels, frames) mix with the profile's settings."""
+    from demucs.apply import apply_model
+
+    return apply_model(
+        model, mix, device=device, shifts=profile["shifts"], split=True,
+        overlap=profile["overlap"], segment=profile["segment"], progress=False,
+    )
+
+
+def _remove_partial(paths):
+    """Delete the stem files of a separation that did not finish."""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _stem_names(model, two_stems=None):
+    return [two_stems, f"no_{two_stems}"] if two_stems else list(model.sources)
+
+
+def _select_stems(sources, model, two_stems=None):
+    """
+    The stems to write for one track's (sources, channels, frames) output.
+
+    Returns:
+        tuple: (names, stems). Two-stem mode keeps `two_stems` and sums every
+            other source into "no_<stem>", like `demucs --two-stems`.
+    """
+    if not two_stems:
+        return _stem_names(model), sources
+    index = list(model.sources).index(two_stems)
+    return _stem_names(model, two_stems), [sources[index], sources.sum(0) - sources[index]]
+
 
 class StemSeparator:
-    def __init__(self, output_dir=STEMS_DIR):
+    def __init__(self, output_dir=STEMS_DIR, engine=DEMUCS_ENGINE, model_name=DEMUCS_MODEL,
+                 output_format=STEM_FORMAT, storage=None, mode=SEPARATION_MODE,
+                 segment_seconds=SEPARATION_SEGMENT_SECONDS, overlap_seconds=SEPARATION_OVERLAP_SECONDS,
+                 segmented_min_seconds=SEPARATION_SEGMENTED_MIN_SECONDS, profile=SEPARATION_PROFILE,
+                 thread_budget=None):
+        """
+        The StemSeparator splits a track into stems with Demucs.
+
+        Args:
+            output_dir (str): Root folder for stems (<output_dir>/<model>/<track>).
+            engine (str): "inprocess" runs a warm, shared model inside this
+                process; "cli" shells out to the `demucs` command per track.
+            model_name (str): Pretrained Demucs model used by profiles that
+                don't name one ("standard", "karaoke").
+            output_format (str): Default stem format spec (see core.formats).
+            storage: Storage backend used to recover missing downloads
+                (see core.storage); the shared one if None.
+            mode (str): "full", "segmented" or "auto" (segment tracks longer
+                than `segmented_min_seconds`); in-process engine only.
+            segment_seconds (float): Window length in segmented mode.
+            overlap_seconds (float): Crossfade between consecutive windows.
+            profile (str): Default separation profile spec (see core.profiles).
+            thread_budget (ThreadBudget): Caps the threads (and, for the CLI,
+                the CPUs) each separation uses; the process-wide one if None.
+        """
         self.output_dir = output_dir
+        self.engine = engine
+        self.model_name = model_name
+        self.output_format = output_format
+        self._storage = storage
+        self.mode = mode
+        self.segment_seconds = segment_seconds
+        self.overlap_seconds = overlap_seconds
+        self.segmented_min_seconds = segmented_min_seconds
+        self.profile = profile
+        self._thread_budget = thread_budget
+        # Per-phase timings (seconds) of the most recent separation
+        self.last_timings = {}
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
-    def separate(self, audio_path: str):
+    @property
+    def storage(self):
+        if self._storage is None:
+            from core.storage import get_storage
+            self._storage = get_storage()
+        return self._storage
+
+    @property
+    def thread_budget(self):
+        if self._thread_budget is None:
+            from core.threads import get_thread_budget
+            self._thread_budget = get_thread_budget()
+        return self._thread_budget
+
+    def preload(self):
+        """Warm the shared model so the first job does not pay the load cost."""
+        if self.engine == "inprocess":
+            get_model(self._profile()["model"], detect_device())
+
+    def _profile(self, spec=None):
+        return parse_separation_profile(spec or self.profile, default_model=self.model_name)
+
+    def separate(self, audio, output_format=None, progress=None, token=None, profile=None):
         """
         Separate audio into stems (vocals, drums, bass, other) using Demucs.
         Automatically detects and uses GPU (CUDA) if available.
+
+        Args:
+            audio (str | DecodedAudio | AudioStream): Path to the track, or
+                the job's decoded audio (the in-process engine then skips
+                decoding), or a stream of it (always separated in segments,
+                so memory stays bounded).
+            output_format (str): Stem format spec, e.g. "flac", "wav24" or
+                "opus:128" (defaults to the separator's output_format).
+            progress (callable): Receives the completed fraction (0.0-1.0).
+            token (CancellationToken): Stops the separation early (the CLI
+                process is killed, the in-process engine stops at the next
+                window or phase); partial stems are deleted and Cancelled is
+                raised.
+            profile (str): Separation profile spec, e.g. "karaoke" or
+                "best" (defaults to the separator's profile).
+        """
+        fmt = parse_stem_format(output_format or self.output_format)
+        profile = self._profile(profile)
+        located = self._locate(audio)
+        if located is None:
+            return None
+        audio_path, decoded = located
+
+        # Detect Device (GPU vs CPU)
+        device = detect_device()
+
+        print(f"Starting stem separation for: {audio_path}")
+        if device == "cpu":
+            print("⚠️ Running on CPU - this may take several minutes...")
+
+        # 🧵 One job's share of the CPU, so concurrent separations don't oversubscribe it
+        with self.thread_budget.allot() as allotment:
+            if self.engine == "inprocess":
+                return self._separate_inprocess(audio_path, device, fmt, profile, decoded, progress, token)
+            return self._separate_cli([audio_path], device, fmt, profile, token, allotment)[0]
+
+    def separate_batch(self, audios, output_format=None, progress=None, token=None, profile=None):
+        """
+        Separate several tracks together: one batched model pass (in-process)
+        or one `demucs` invocation with every track as an input (CLI), so the
+        model and its thread pool are shared instead of oversubscribing the CPU.
+
+        Args:
+            audios (list): Paths, DecodedAudio or AudioStream objects, as
+                for separate().
+            output_format (str): Stem format spec shared by the whole batch.
+            profile (str): Separation profile spec shared by the whole batch.
+            progress (callable): Receives the batch's completed fraction.
+            token (CancellationToken): Stops the whole batch.
+
+        Returns:
+            list: Stems folder per track (same order), None where it failed.
         """
-        if not os.path.exists(audio_path):
+        fmt = parse_stem_format(output_format or self.output_format)
+        profile = self._profile(profile)
+        located = [self._locate(audio) for audio in audios]
+        results = [None] * len(audios)
+        ready = [i for i, item in enumerate(located) if item is not None]
+        if not ready:
+            return results
+
+        device = detect_device()
+        print(f"Starting batched stem separation of {len(ready)} track(s)")
+        # One batch stands in for a job per track, so it gets their shares
+        with self.thread_budget.allot(jobs=len(ready)) as allotment:
+            if self.engine == "inprocess":
+                paths = self._separate_inprocess_batch([located[i] for i in ready], device, fmt, profile, progress, token)
+            else:
+                paths = self._separate_cli([located[i][0] for i in ready], device, fmt, profile, token, allotment)
+        for i, path in zip(ready, paths):
+            results[i] = path
+        return results
+
+    def _locate(self, audio):
+        """
+        Resolve `audio` to (audio_path, decoded), recovering a missing
+        download from storage. None if the file can't be found anywhere.
+        `decoded` is the DecodedAudio or AudioStream passed in, if any.
+        """
+        decoded = audio if isinstance(audio, (DecodedAudio, AudioStream)) else None
+        audio_path = decoded.path if decoded else audio
+
+        if not isinstance(decoded, DecodedAudio) and not os.path.exists(audio_path):
             print(f"⚠️ Audio file not found at {audio_path}. Attempting to recover from GCS...")
             try:
-                from google.cloud import storage
-                from config import GCS_BUCKET_NAME
-                
-                client = storage.Client()
-                bucket = client.bucket(GCS_BUCKET_NAME)
                 blob_name = f"downloads/{os.path.basename(audio_path)}"
-                blob = bucket.blob(blob_name)
-                
-                if blob.exists():
-                    print(f"🔄 Recovering from GCS: gs://{GCS_BUCKET_NAME}/{blob_name}...")
-                    os.makedirs(os.path.dirname(audio_path), exist_ok=True)
-                    blob.download_to_filename(audio_path)
+
+                if self.storage.exists(blob_name):
+                    print(f"🔄 Recovering from GCS: {self.storage.uri(blob_name)}...")
+                    TransferManager(self.storage).download(blob_name, audio_path)
                     print("✅ Recovery successful!")
                 else:
                     print(f"❌ File not found in GCS: {blob_name}")
@@ -35,22 +303,359 @@ class StemSeparator:
             except Exception as e:
                 print(f"❌ Recovery failed: {e}")
                 return None
+        return audio_path, decoded
 
-        # Detect Device (GPU vs CPU)
-        device = "cpu"
+    @staticmethod
+    def _folder_suffix(fmt=None, profile=None):
+        """
+        Track folder suffix for a non-WAV format and a profile's non-standard
+        settings ("" for WAV with the standard settings).
+        """
+        suffix = f"__{fmt['name'].replace(':', '_')}" if fmt and fmt["name"] != "wav" else ""
+        settings = profile["name"].partition(":")[2] if profile else ""
+        if settings:
+            suffix += f"__{settings.replace('=', '-').replace(',', '_')}"
+        return suffix
+
+    def _stems_path(self, audio_path, fmt=None, profile=None):
+        # Demucs creates a folder named after the model used (htdemucs)
+        # and then a folder named after the track. Non-WAV formats and
+        # non-standard profiles get their own folder so they never mix.
+        track_name = os.path.splitext(os.path.basename(audio_path))[0] + self._folder_suffix(fmt, profile)
+        model_name = profile["model"] if profile else self.model_name
+        return os.path.join(self.output_dir, model_name, track_name)
+
+    @staticmethod
+    def _discard(stems_path):
+        """Delete the partial stems of a cancelled separation."""
+        if os.path.isdir(stems_path):
+            shutil.rmtree(stems_path, ignore_errors=True)
+            print(f"🧹 Removed partial stems: {stems_path}")
+
+    def _separate_inprocess(self, audio_path, device, fmt, profile, decoded=None, progress=None, token=None):
+        """Run the shared, already-loaded model directly in this process."""
+        report = progress or (lambda fraction: None)
+        check = token.raise_if_cancelled if token is not None else (lambda: None)
+        stems_path = self._stems_path(audio_path, fmt, profile)
+        try:
+            # 1. Load (a no-op once the model is warm)
+            started = time.perf_counter()
+            model = get_model(profile["model"], device)
+            loaded = time.perf_counter()
+            report(0.05)
+
+            # Long tracks: bounded-memory windows instead of one huge tensor
+            source = self._segmented_source(audio_path, decoded)
+            if source is not None:
+                return self._separate_segmented(
+                    source, stems_path, model, device, fmt, profile, report, check, started, loaded)
+
+            check()
+
+            # 2. Inference (same normalisation as the demucs CLI)
+            wav = self._load_wav(audio_path, decoded, model)
+            ref = wav.mean(0)
+            wav = (wav - ref.mean()) / ref.std()
+            sources = self._infer(model, wav[None], device, profile, check,
+                                  lambda fraction: report(0.05 + 0.8 * fraction))[0]
+            sources = sources * ref.std() + ref.mean()
+            inferred = time.perf_counter()
+            report(0.85)
+            check()
+
+            # 3. Encode each stem straight to the requested format (no
+            #    intermediate WAV), laid out like the CLI output
+            names, stems = _select_stems(sources, model, profile["two_stems"])
+            self._write_stems(names, stems, model.samplerate, stems_path, fmt, check,
+                              lambda fraction: report(0.85 + 0.15 * fraction))
+            written = time.perf_counter()
+
+            self.last_timings = {
+                "load": round(loaded - started, 3),
+                "inference": round(inferred - loaded, 3),
+                "write": round(written - inferred, 3),
+            }
+            print(f"⏱️ Separation timings (s): {self.last_timings}")
+            print(f"Separation completed. Stems located in: {stems_path}")
+            return stems_path
+
+        except Cancelled:
+            print(f"🛑 Separation cancelled: {audio_path}")
+            self._discard(stems_path)
+            raise
+        except ImportError as e:
+            print(f"Error: Demucs is not importable ({e}). Please ensure it is installed.")
+            return None
+        except Exception as e:
+            print(f"Error during separation: {e}")
+            return None
+
+    def _infer(self, model, mix, device, profile, check, report=None):
+        """
+        Run the model over a (batch, channels, frames) mix already in memory,
+        in crossfaded windows of `segment_seconds` (like segmented mode), so
+        a cancelled job stops after the current window instead of after the
+        whole track, and `report` receives the inferred fraction after each
+        window. In "full" mode the whole mix goes through one model pass.
+
+        Returns:
+            torch.Tensor: (batch, sources, channels, frames) on the CPU.
+        """
+        import torch
+        from core.segments import overlap_add
+
+        if self.mode == "full":
+            check()
+            with torch.no_grad():
+                sources = _run_model(model, mix, device, profile).cpu()
+            check()
+            if report:
+                report(1.0)
+            return sources
+
+        def separate_window(window):
+            check()
+            with torch.no_grad():
+                sources = _run_model(model, torch.from_numpy(np.ascontiguousarray(window)), device, profile)
+            return sources.cpu().numpy()
+
+        chunks = list(overlap_add(
+            [mix.cpu().numpy()], separate_window,
+            int(self.segment_seconds * model.samplerate), int(self.overlap_seconds * model.samplerate),
+            progress=report, total_frames=mix.shape[-1],
+        ))
+        check()
+        return torch.from_numpy(np.concatenate(chunks, axis=-1))
+
+    def _segmented_source(self, audio_path, decoded):
+        """The input to stream through _separate_segmented, or None for a single pass."""
+        if self.mode == "full":
+            return None
+        if isinstance(decoded, AudioStream):
+            # The job chose not to hold the track in memory
+            return decoded
+        source = decoded if decoded is not None else AudioStream(audio_path)
+        if self.mode == "segmented" or (source.duration or 0) > self.segmented_min_seconds:
+            return source
+        return None
+
+    @staticmethod
+    def _load_wav(audio_path, decoded, model):
+        """The whole track as a (channels, frames) tensor at the model's rate."""
+        import torch
+        from demucs.audio import AudioFile, convert_audio
+
+        if isinstance(decoded, DecodedAudio):
+            # Reuse the job's decoded buffer instead of running ffmpeg again
+            return convert_audio(
+                torch.from_numpy(decoded.samples),
+                decoded.sample_rate, model.samplerate, model.audio_channels,
+            )
+        return AudioFile(audio_path).read(
+            streams=0,
+            samplerate=model.samplerate,
+            channels=model.audio_channels,
+        )
+
+    @staticmethod
+    def _write_stems(names, sources, samplerate, stems_path, fmt, check, report):
+        """
+        Encode one track's (channels, frames) stems, one file per name. If a
+        writer fails or the job is cancelled part-way, every file of the set
+        is deleted, so no half-written stems are left for a later job to reuse.
+        """
+        os.makedirs(stems_path, exist_ok=True)
+        paths, writer = [], None
+        try:
+            for index, (source, name) in enumerate(zip(sources, names)):
+                check()
+                source = source.cpu().numpy()
+                # Rescale instead of clipping, like the demucs CLI (clip="rescale")
+                peak = float(abs(source).max())
+                if peak > 1.0:
+                    source = source / (1.01 * peak)
+                paths.append(os.path.join(stems_path, f"{name}.{fmt['ext']}"))
+                writer = open_stem_writer(paths[-1], fmt, samplerate, source.shape[0])
+                writer.write(source)
+                writer.close()
+                writer = None
+                report((index + 1) / len(names))
+        except BaseException:
+            if writer is not None:
+                writer.abort()
+            _remove_partial(paths)
+            raise
+
+    def _separate_inprocess_batch(self, items, device, fmt, profile, progress=None, token=None):
+        """
+        Run several (audio_path, decoded) tracks through the shared model in
+        one batched apply_model call. Shorter tracks are zero-padded to the
+        longest one; tracks long enough for segmented mode are separated one
+        at a time instead.
+        """
+        check = token.raise_if_cancelled if token is not None else (lambda: None)
+        results = [None] * len(items)
+        finished = [0]
+
+        def share(count):
+            """Progress callback for the next `count` of the batch's tracks."""
+            offset = finished[0]
+            finished[0] += count
+            return lambda fraction: progress((offset + count * fraction) / len(items)) if progress else None
+
+        batch = [index for index, (audio_path, decoded) in enumerate(items)
+                 if len(items) > 1 and self._segmented_source(audio_path, decoded) is None]
+        for index, (audio_path, decoded) in enumerate(items):
+            if index not in batch:
+                results[index] = self._separate_inprocess(audio_path, device, fmt, profile, decoded, share(1), token)
+        if not batch:
+            return results
+        report = share(len(batch))
+
+        stems_paths = {index: self._stems_path(items[index][0], fmt, profile) for index in batch}
         try:
             import torch
-            if torch.cuda.is_available():
-                device = "cuda"
-                print("🚀 CUDA GPU detected! Using GPU for high-speed separation.")
-            else:
-                print("💻 GPU not detected or not supported. Falling back to CPU.")
-        except ImportError:
-            print("📦 Torch not found. Defaulting to CPU.")
 
-        print(f"Starting stem separation for: {audio_path}")
-        if device == "cpu":
-            print("⚠️ Running on CPU - this may take several minutes...")
+            started = time.perf_counter()
+            model = get_model(profile["model"], device)
+            loaded = time.perf_counter()
+            report(0.05)
+
+            # Same per-track normalisation as a single separation
+            wavs, stats = [], []
+            for index in batch:
+                check()
+                wav = self._load_wav(*items[index], model)
+                ref = wav.mean(0)
+                stats.append((ref.mean(), ref.std()))
+                wavs.append((wav - stats[-1][0]) / stats[-1][1])
+            lengths = [wav.shape[-1] for wav in wavs]
+            stacked = torch.stack([torch.nn.functional.pad(wav, (0, max(lengths) - n)) for wav, n in zip(wavs, lengths)])
+            del wavs[:]
+
+            sources = self._infer(model, stacked, device, profile, check,
+                                  lambda fraction: report(0.05 + 0.8 * fraction))
+            inferred = time.perf_counter()
+            report(0.85)
+
+            for position, (index, (mean, std)) in enumerate(zip(batch, stats)):
+                # Drop the padding before de-normalising and writing
+                track = sources[position][..., :lengths[position]]
+                names, stems = _select_stems(track * std + mean, model, profile["two_stems"])
+                self._write_stems(names, stems, model.samplerate, stems_paths[index], fmt, check,
+                                  lambda fraction: report(0.85 + 0.15 * (position + fraction) / len(batch)))
+                results[index] = stems_paths[index]
+            written = time.perf_counter()
+
+            self.last_timings = {
+                "load": round(loaded - started, 3),
+                "inference": round(inferred - loaded, 3),
+                "write": round(written - inferred, 3),
+                "tracks": len(batch),
+            }
+            print(f"⏱️ Batched separation timings (s): {self.last_timings}")
+            return results
+
+        except Cancelled:
+            print(f"🛑 Batched separation cancelled ({len(batch)} track(s))")
+            for stems_path in stems_paths.values():
+                self._discard(stems_path)
+            raise
+        except ImportError as e:
+            print(f"Error: Demucs is not importable ({e}). Please ensure it is installed.")
+            return results
+        except Exception as e:
+            print(f"Error during batched separation: {e}")
+            return results
+
+    def _separate_segmented(self, source, stems_path, model, device, fmt, profile, report, check, started, loaded):
+        """
+        Separate window by window and stream the crossfaded output to the stem
+        files, so only one window of audio and stems is ever held in memory.
+
+        The whole-track normalisation statistics come from a cheap first pass
+        over the input. Stems are not rescaled afterwards (their peak is only
+        known once everything has been written); the writers clip instead.
+        """
+        import torch
+        from core.segments import overlap_add
+
+        segment = int(self.segment_seconds * model.samplerate)
+        overlap = int(self.overlap_seconds * model.samplerate)
+        read_frames = int(self.segment_seconds * source.sample_rate)
+
+        mean, std = _reference_stats(source, model.audio_channels, read_frames)
+        std = std or 1.0
+
+        def separate_window(window):
+            check()
+            wav = torch.from_numpy(np.ascontiguousarray(window))
+            wav = (wav - mean) / std
+            with torch.no_grad():
+                sources = _run_model(model, wav[None], device, profile)[0]
+            return np.asarray(_select_stems((sources * std + mean).cpu().numpy(), model, profile["two_stems"])[1])
+
+        os.makedirs(stems_path, exist_ok=True)
+        paths = [os.path.join(stems_path, f"{name}.{fmt['ext']}") for name in _stem_names(model, profile["two_stems"])]
+        writers = [open_stem_writer(path, fmt, model.samplerate, model.audio_channels) for path in paths]
+        total_frames = int(source.duration * model.samplerate) if source.duration else None
+        try:
+            for chunk in overlap_add(
+                _model_blocks(source, model.samplerate, model.audio_channels, read_frames),
+                separate_window, segment, overlap,
+                progress=lambda fraction: report(0.05 + 0.95 * fraction),
+                total_frames=total_frames,
+            ):
+                for writer, stem in zip(writers, chunk):
+                    writer.write(stem)
+            for writer in writers:
+                writer.close()
+        except BaseException:
+            for writer in writers:
+                writer.abort()
+            _remove_partial(paths)
+            raise
+        report(1.0)
+
+        self.last_timings = {
+            "load": round(loaded - started, 3),
+            "separate": round(time.perf_counter() - loaded, 3),
+        }
+        print(f"⏱️ Segmented separation timings (s): {self.last_timings}")
+        print(f"Separation completed. Stems located in: {stems_path}")
+        return stems_path
+
+    def _separate_cli(self, audio_paths, device, fmt, profile, token=None, allotment=None):
+        """
+        Legacy path: `demucs` subprocesses. Every track in `audio_paths`
+        goes to the same invocation, which loads the model once for all.
+        `allotment` (core.threads) caps the subprocess's threads and CPUs.
+
+        Returns:
+            list: Stems folder per track, None where it is missing.
+        """
+        failed = [None] * len(audio_paths)
+        # Output flags the demucs CLI understands for each of our formats
+        cli_flags = {
+            "wav": [], "wav24": ["--int24"], "wav32f": ["--float32"],
+            "flac": ["--flac", "--int24"], "flac16": ["--flac"],
+            "mp3": ["--mp3", "--mp3-bitrate", str(fmt.get("bitrate"))],
+        }
+        base_name = fmt["name"].split(":")[0]
+        if base_name not in cli_flags:
+            print(f"Error: the demucs CLI cannot write '{fmt['name']}' stems; use the in-process engine.")
+            return failed
+
+        # The profile's settings; the CLI takes the segment in whole seconds
+        profile_flags = ["--shifts", str(profile["shifts"]), "--overlap", str(profile["overlap"])]
+        if profile["two_stems"]:
+            profile_flags += ["--two-stems", profile["two_stems"]]
+        if profile["segment"]:
+            profile_flags += ["--segment", str(max(1, int(profile["segment"])))]
+        suffix = self._folder_suffix(fmt, profile)
+        if suffix:
+            # Same folder layout as _stems_path (and the in-process engine)
+            profile_flags += ["--filename", f"{{track}}{suffix}/{{stem}}.{{ext}}"]
 
         try:
             # -n htdemucs: Use the hybrid transformer model (highest quality)
@@ -58,30 +663,49 @@ class StemSeparator:
             # --out: Specifies the output directory
             command = [
                 "demucs",
-                "-n", "htdemucs",
+                "-n", profile["model"],
                 "-d", device,
                 "--out", self.output_dir,
-                audio_path
+                *cli_flags[base_name],
+                *profile_flags,
+                *audio_paths
             ]
-            
-            # Execute demucs
-            subprocess.run(command, check=True)
-            
-            # Demucs creates a folder named after the model used (htdemucs) 
-            # and then a folder named after the track.
-            track_name = os.path.splitext(os.path.basename(audio_path))[0]
-            stems_path = os.path.join(self.output_dir, "htdemucs", track_name)
-            
-            if os.path.exists(stems_path):
-                print(f"Separation completed. Stems located in: {stems_path}")
-                return stems_path
+
+            # Execute demucs; a cancelled job kills it instead of waiting it out
+            started = time.perf_counter()
+            stems_paths = [self._stems_path(audio_path, fmt, profile) for audio_path in audio_paths]
+            if allotment is not None:
+                process = subprocess.Popen(command, env=allotment.env())
+                allotment.pin(process.pid)
             else:
-                print("Error: Stems directory was not created.")
-                return None
+                process = subprocess.Popen(command)
+            unregister = token.on_cancel(process.kill) if token is not None else (lambda: None)
+            try:
+                returncode = process.wait()
+            finally:
+                unregister()
+            if token is not None and token.cancelled:
+                print(f"🛑 Separation cancelled: {', '.join(audio_paths)}")
+                for stems_path in stems_paths:
+                    self._discard(stems_path)
+                raise Cancelled()
+            if returncode:
+                raise subprocess.CalledProcessError(returncode, command)
+            self.last_timings = {"total": round(time.perf_counter() - started, 3)}
+
+            results = []
+            for stems_path in stems_paths:
+                if os.path.exists(stems_path):
+                    print(f"Separation completed. Stems located in: {stems_path}")
+                    results.append(stems_path)
+                else:
+                    print(f"Error: Stems directory was not created: {stems_path}")
+                    results.append(None)
+            return results
 
         except subprocess.CalledProcessError as e:
             print(f"Error during separation: {e}")
-            return None
+            return failed
         except FileNotFoundError:
             print("Error: 'demucs' command not found. Please ensure it is installed.")
-            return None
+            return failed
@@ -0,0 +1,366 @@
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from core.cache import TTLCache
+from config import (
+    STORAGE_BACKEND, LOCAL_STORAGE_DIR, GCS_BUCKET_NAME, GCS_UPLOAD_CHUNK_SIZE,
+    SIGNED_URL_EXPIRATION, SIGNED_URL_REFRESH_MARGIN, SIGNED_URL_CACHE_SIZE,
+)
+
+# Uploads in progress live under this prefix until they are committed
+UPLOADS_PREFIX = "_uploads/"
+
+
+class _LocalUpload:
+    """Writes to a temp file that only becomes visible on commit()."""
+
+    def __init__(self, final_path):
+        self.final_path = final_path
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=os.path.dirname(final_path), suffix=".partial")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, data):
+        return self._file.write(data)
+
+    def commit(self):
+        self._file.close()
+        os.replace(self.temp_path, self.final_path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class _GCSUpload:
+    """
+    A resumable GCS upload session fed chunk by chunk. The bytes go to a
+    temporary object that only becomes visible under the final name on
+    commit(), like _LocalUpload's temp file.
+    """
+
+    def __init__(self, bucket, name, content_type=None):
+        self.blob = bucket.blob(name)
+        self.blob.content_type = content_type
+        self.temp_blob = bucket.blob(f"{UPLOADS_PREFIX}{uuid.uuid4().hex}/{name}")
+        self._writer = self.temp_blob.open("wb", chunk_size=GCS_UPLOAD_CHUNK_SIZE, content_type=content_type)
+
+    def write(self, data):
+        return self._writer.write(data)
+
+    def commit(self):
+        self._writer.close()
+        # Server-side copy into the final name (no size limit, one request)
+        self.blob.compose([self.temp_blob])
+        self._delete_temp()
+
+    def abort(self):
+        # BlobWriter has no abort and finalises on close/GC; that only ever
+        # produces the temporary object, which is deleted here
+        try:
+            self._writer.close()
+        except Exception as e:
+            print(f"⚠️ Could not close partial upload {self.temp_blob.name}: {e}")
+        self._delete_temp()
+
+    def _delete_temp(self):
+        try:
+            self.temp_blob.delete()
+        except Exception as e:
+            print(f"⚠️ Could not clean up partial upload {self.temp_blob.name}: {e}")
+
+
+class LocalStorage:
+    def __init__(self, root=LOCAL_STORAGE_DIR):
+        """
+        A bucket emulated on the local filesystem (dev runs and tests).
+        Object names such as "exports/x.zip" map to files under `root`.
+        """
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.split("/"))
+
+    def uri(self, name):
+        return self._path(name)
+
+    def exists(self, name):
+        return os.path.isfile(self._path(name))
+
+    def open_write(self, name, content_type=None):
+        return _LocalUpload(self._path(name))
+
+    def upload_file(self, local_path, name):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(local_path, path)
+
+    def download_file(self, name, local_path):
+        os.makedirs(os.path.dirname(os.path.abspath(local_path)), exist_ok=True)
+        shutil.copyfile(self._path(name), local_path)
+
+    def delete(self, name):
+        if self.exists(name):
+            os.remove(self._path(name))
+
+    def stat(self, name):
+        """Size, checksums and generation of an object; None if missing."""
+        path = self._path(name)
+        if not os.path.isfile(path):
+            return None
+        md5 = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                md5.update(chunk)
+        info = os.stat(path)
+        return {
+            "size": info.st_size,
+            "md5": base64.b64encode(md5.digest()).decode(),
+            "crc32c": None,
+            "generation": str(info.st_mtime_ns),
+        }
+
+    def upload_range(self, local_path, offset, length, name):
+        """Store `length` bytes of local_path starting at `offset` as `name`."""
+        upload = self.open_write(name)
+        try:
+            with open(local_path, "rb") as f:
+                f.seek(offset)
+                upload.write(f.read(length))
+        except Exception:
+            upload.abort()
+            raise
+        upload.commit()
+
+    def compose(self, part_names, name):
+        """Concatenate existing objects, in order, into `name`."""
+        upload = self.open_write(name)
+        try:
+            for part in part_names:
+                with open(self._path(part), "rb") as f:
+                    shutil.copyfileobj(f, upload)
+        except Exception:
+            upload.abort()
+            raise
+        upload.commit()
+
+    def download_range(self, name, start, length, local_path):
+        """Write bytes [start, start + length) of `name` at the same offset of local_path."""
+        with open(self._path(name), "rb") as source, open(local_path, "r+b") as target:
+            source.seek(start)
+            target.seek(start)
+            target.write(source.read(length))
+
+    def list(self, prefix=""):
+        """Names of all objects starting with `prefix`, sorted."""
+        names = []
+        for directory, _, files in os.walk(self.root):
+            for filename in files:
+                if filename.endswith(".partial"):
+                    continue  # Uncommitted uploads
+                relative = os.path.relpath(os.path.join(directory, filename), self.root)
+                name = relative.replace(os.sep, "/")
+                if name.startswith(prefix):
+                    names.append(name)
+        return sorted(names)
+
+    def signed_url(self, name, expiration):
+        # Local files have no URL; the API serves them directly
+        return None
+
+
+class GCSStorage:
+    def __init__(self, bucket_name=GCS_BUCKET_NAME, client=None):
+        """
+        Google Cloud Storage bucket access used in production.
+
+        Args:
+            bucket_name (str): Target bucket.
+            client (storage.Client): Existing client (the shared, pooled
+                client from core.clients if None).
+        """
+        if client is None:
+            from core.clients import get_storage_client
+            client = get_storage_client()
+        self.client = client
+        self.bucket_name = bucket_name
+        self.bucket = client.bucket(bucket_name)
+
+    def uri(self, name):
+        return f"gs://{self.bucket_name}/{name}"
+
+    def exists(self, name):
+        return self.bucket.blob(name).exists()
+
+    def open_write(self, name, content_type=None):
+        return _GCSUpload(self.bucket, name, content_type=content_type)
+
+    def upload_file(self, local_path, name):
+        self.bucket.blob(name).upload_from_filename(local_path)
+
+    def download_file(self, name, local_path):
+        self.bucket.blob(name).download_to_filename(local_path)
+
+    def delete(self, name):
+        self.bucket.blob(name).delete()
+
+    def stat(self, name):
+        """Size, checksums and generation of an object; None if missing."""
+        blob = self.bucket.get_blob(name)
+        if blob is None:
+            return None
+        # Composed objects only carry a CRC32C, never an MD5
+        return {"size": blob.size, "md5": blob.md5_hash, "crc32c": blob.crc32c, "generation": str(blob.generation)}
+
+    def upload_range(self, local_path, offset, length, name):
+        """
+        Upload `length` bytes of local_path starting at `offset` as `name`,
+        through a resumable session whose chunks are retried individually.
+        """
+        blob = self.bucket.blob(name, chunk_size=GCS_UPLOAD_CHUNK_SIZE)
+        with open(local_path, "rb") as f:
+            f.seek(offset)
+            blob.upload_from_file(f, size=length, checksum="md5")
+
+    def compose(self, part_names, name):
+        """Concatenate existing objects (at most 32), in order, into `name`."""
+        self.bucket.blob(name).compose([self.bucket.blob(part) for part in part_names])
+
+    def download_range(self, name, start, length, local_path):
+        """Write bytes [start, start + length) of `name` at the same offset of local_path."""
+        with open(local_path, "r+b") as f:
+            f.seek(start)
+            # Ranged reads can't be checked against the object checksum here;
+            # core.transfer verifies the whole file once every slice is in
+            self.bucket.blob(name).download_to_file(f, start=start, end=start + length - 1, checksum=None)
+
+    def list(self, prefix=""):
+        """Names of all objects starting with `prefix`, sorted."""
+        return sorted(blob.name for blob in self.client.list_blobs(self.bucket_name, prefix=prefix))
+
+    def signed_url(self, name, expiration):
+        """V4 GET URL; the client's credentials must be able to sign."""
+        return self.bucket.blob(name).generate_signed_url(
+            version="v4",
+            expiration=expiration,
+            method="GET",
+        )
+
+
+_STORAGES = {}
+_STORAGES_LOCK = threading.Lock()
+
+
+def _build_storage(kind):
+    if kind == "local":
+        return LocalStorage()
+    if kind == "gcs":
+        return GCSStorage()
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+def get_storage(kind=STORAGE_BACKEND):
+    """The process-wide storage backend: "gcs" or "local"."""
+    with _STORAGES_LOCK:
+        if kind not in _STORAGES:
+            _STORAGES[kind] = _build_storage(kind)
+        return _STORAGES[kind]
+
+
+def get_signing_storage(kind=STORAGE_BACKEND):
+    """Like get_storage, but GCS credentials are able to sign download URLs."""
+    if kind != "gcs":
+        return get_storage(kind)
+    with _STORAGES_LOCK:
+        if "gcs-signing" not in _STORAGES:
+            from core.clients import get_storage_client
+            _STORAGES["gcs-signing"] = GCSStorage(client=get_storage_client(signing=True))
+        return _STORAGES["gcs-signing"]
+
+
+class SignedURLCache:
+    def __init__(self, storage, expiration=SIGNED_URL_EXPIRATION, refresh_margin=SIGNED_URL_REFRESH_MARGIN,
+                 max_entries=SIGNED_URL_CACHE_SIZE, clock=time.monotonic):
+        """
+        Reuses signed download URLs per object instead of checking the object
+        and signing a new URL on every request.
+
+        Args:
+            storage: Backend with exists/signed_url/delete (see get_signing_storage).
+            expiration (int): Lifetime of each signed URL (seconds).
+            refresh_margin (int): Stop handing out a URL this many seconds
+                before it expires, so clients always get a usable link.
+            max_entries (int): Least recently used URLs are dropped beyond this.
+        """
+        if refresh_margin >= expiration:
+            raise ValueError("refresh_margin must be shorter than expiration")
+        self.storage = storage
+        self.expiration = expiration
+        self._urls = TTLCache(ttl=expiration - refresh_margin, max_entries=max_entries, clock=clock)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def url(self, name):
+        """
+        A signed GET URL for `name`, or None if the backend cannot sign
+        (local storage).
+
+        Raises:
+            FileNotFoundError: If the object does not exist.
+        """
+        url = self._urls.get(name)
+        with self._lock:
+            if url is not None:
+                self.hits += 1
+                return url
+            self.misses += 1
+
+        if not self.storage.exists(name):
+            raise FileNotFoundError(name)
+        url = self.storage.signed_url(name, timedelta(seconds=self.expiration))
+        if url is not None:
+            self._urls.set(name, url)
+        return url
+
+    def invalidate(self, name):
+        self._urls.delete(name)
+
+    def delete(self, name):
+        """Delete the object and forget its URL."""
+        self.invalidate(name)
+        self.storage.delete(name)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._urls)}
+
+
+_SIGNED_URLS = None
+
+
+def get_signed_url_cache():
+    """The process-wide signed URL cache over get_signing_storage()."""
+    global _SIGNED_URLS
+    with _STORAGES_LOCK:
+        if _SIGNED_URLS is not None:
+            return _SIGNED_URLS
+    cache = SignedURLCache(get_signing_storage())
+    with _STORAGES_LOCK:
+        if _SIGNED_URLS is None:
+            _SIGNED_URLS = cache
+        return _SIGNED_URLS
+
+
+def forget_signed_url(name):
+    """Drop a cached URL for `name` (e.g. once the object is found missing)."""
+    if _SIGNED_URLS is not None:
+        _SIGNED_URLS.invalidate(name)
@@ -0,0 +1,106 @@
+import copy
+import threading
+import time
+from core.aio import run_blocking
+from config import TASK_STORE_BACKEND
+
+TASKS_COLLECTION = "stemsense_tasks"
+
+
+class MemoryTaskStore:
+    def __init__(self, latency=0.0):
+        """
+        Process-local task store (tests, benchmarks and single-process dev runs).
+
+        Args:
+            latency (float): Seconds each call sleeps, to mimic a network
+                round-trip when benchmarking.
+        """
+        self.latency = latency
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get(self, task_id):
+        self._wait()
+        with self._lock:
+            task = self._tasks.get(task_id)
+        return copy.deepcopy(task)
+
+    def create(self, task_id, data):
+        self._wait()
+        with self._lock:
+            self._tasks[task_id] = copy.deepcopy(data)
+
+    def update(self, task_id, fields):
+        self._wait()
+        with self._lock:
+            if task_id not in self._tasks:
+                raise KeyError(task_id)
+            self._tasks[task_id].update(copy.deepcopy(fields))
+
+    def delete(self, task_id):
+        self._wait()
+        with self._lock:
+            self._tasks.pop(task_id, None)
+
+
+class FirestoreTaskStore:
+    """Production store: one Firestore document per task."""
+
+    def __init__(self, collection=TASKS_COLLECTION, client=None):
+        if client is None:
+            from core.clients import get_firestore_client
+            client = get_firestore_client()
+        self._collection = client.collection(collection)
+
+    def get(self, task_id):
+        doc = self._collection.document(task_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def create(self, task_id, data):
+        self._collection.document(task_id).set(data)
+
+    def update(self, task_id, fields):
+        self._collection.document(task_id).update(fields)
+
+    def delete(self, task_id):
+        self._collection.document(task_id).delete()
+
+
+class AsyncTaskStore:
+    def __init__(self, store):
+        """
+        Awaitable view of a task store for async request handlers.
+
+        Every call runs on the shared I/O pool (core.aio), so a slow
+        Firestore round-trip never blocks the event loop.
+
+        Args:
+            store: A MemoryTaskStore or FirestoreTaskStore.
+        """
+        self.store = store
+
+    async def get(self, task_id):
+        return await run_blocking(self.store.get, task_id)
+
+    async def create(self, task_id, data):
+        return await run_blocking(self.store.create, task_id, data)
+
+    async def update(self, task_id, fields):
+        return await run_blocking(self.store.update, task_id, fields)
+
+    async def delete(self, task_id):
+        return await run_blocking(self.store.delete, task_id)
+
+
+def make_task_store(kind=TASK_STORE_BACKEND):
+    """Build a task store by name: "memory" or "firestore"."""
+    if kind == "memory":
+        return MemoryTaskStore()
+    if kind == "firestore":
+        return FirestoreTaskStore()
+    raise ValueError(f"Unknown task store: {kind}")
@@ -0,0 +1,175 @@
+"""
+Per-job CPU budgets, so concurrent separations and analyses share the cores
+instead of each starting one thread per core.
+"""
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from config import JOB_WORKERS, THREADS_PER_JOB, CPU_AFFINITY
+
+# Environment variables read by the native thread pools (OpenMP, MKL,
+# OpenBLAS, numba) when a process starts
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMBA_NUM_THREADS")
+
+
+def available_cpus():
+    """CPUs this process may run on (respects cgroup/taskset masks)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class Allotment:
+    def __init__(self, threads, cpus):
+        """The threads and (optionally) CPUs one invocation may use."""
+        self.threads = threads
+        self.cpus = cpus
+
+    def env(self, base=None):
+        """Environment for a subprocess, with every native pool capped."""
+        env = dict(os.environ if base is None else base)
+        for name in THREAD_ENV_VARS:
+            env[name] = str(self.threads)
+        return env
+
+    def pin(self, pid):
+        """
+        Pin a freshly started subprocess to this allotment's CPUs, if any.
+        Done from the parent after Popen (preexec_fn is unsafe in a threaded
+        worker); the child has not started its thread pools by then, and
+        threads it starts later inherit the mask.
+        """
+        if not self.cpus or not hasattr(os, "sched_setaffinity"):
+            return
+        try:
+            os.sched_setaffinity(pid, set(self.cpus))
+        except OSError as e:
+            # The process may already have exited
+            print(f"⚠️ Could not pin process {pid} to CPUs {self.cpus}: {e}")
+
+
+class ThreadBudget:
+    def __init__(self, workers=JOB_WORKERS, threads=THREADS_PER_JOB, pin=CPU_AFFINITY, cpus=None):
+        """
+        Splits the machine's CPUs between `workers` concurrent jobs.
+
+        Subprocesses (the demucs CLI) get their own thread caps through the
+        environment and, with `pin`, a disjoint set of CPUs. In-process work
+        (torch, BLAS, numba) is capped with each library's own setter; torch
+        and BLAS pools are process-wide and sized for the largest share held
+        at the time. CPU pinning only applies to subprocesses, as in-process
+        jobs share their pools.
+
+        Args:
+            workers (int): Jobs expected to run at once (the worker pool size).
+            threads (int): Threads per job; 0 divides the CPUs evenly.
+            pin (bool): Also pin subprocesses to a CPU slice.
+            cpus (list): CPUs to share out (default: those available to us).
+        """
+        self.cpus = list(cpus) if cpus is not None else available_cpus()
+        self.workers = max(1, workers)
+        self.threads = threads or max(1, len(self.cpus) // self.workers)
+        self.pin = pin
+        # Contiguous CPU slices, one per concurrent job
+        size = max(1, len(self.cpus) // self.workers)
+        self._slices = [self.cpus[i * size:(i + 1) * size] or self.cpus for i in range(self.workers)]
+        self._holders = [0] * len(self._slices)
+        # Thread counts of the allotments currently held
+        self._active = []
+        self._lock = threading.Lock()
+
+    def apply_process_defaults(self):
+        """
+        Cap the native pools of this process. Call at startup, before numpy
+        or torch are imported, so pools are created at the right size.
+        """
+        for name in THREAD_ENV_VARS:
+            os.environ.setdefault(name, str(self.threads))
+        self._size_process_pools(self.threads)
+
+    @staticmethod
+    def _size_process_pools(threads):
+        """Resize torch's and the BLAS pools, which are shared by the whole process."""
+        # Only libraries that are already imported; never import torch here
+        if "torch" in sys.modules:
+            torch = sys.modules["torch"]
+            if torch.get_num_threads() != threads:
+                torch.set_num_threads(threads)
+        try:
+            from threadpoolctl import threadpool_limits
+            threadpool_limits(limits=threads)
+        except ImportError:
+            pass
+
+    @staticmethod
+    def _limit_calling_thread(threads):
+        """Cap numba, whose count is per thread; returns a restore callable."""
+        if "numba" in sys.modules:
+            numba = sys.modules["numba"]
+            try:
+                previous = numba.get_num_threads()
+                numba.set_num_threads(min(threads, numba.config.NUMBA_NUM_THREADS))
+                return lambda: numba.set_num_threads(previous)
+            except Exception:
+                pass
+        return lambda: None
+
+    def _resize_locked(self):
+        # Process-wide pools follow the largest share currently held, so a
+        # batch keeps its threads while smaller jobs come and go
+        self._size_process_pools(max(self._active, default=self.threads))
+
+    @contextmanager
+    def allot(self, jobs=1):
+        """
+        Hold a share of the CPUs for the duration of the block.
+
+        Args:
+            jobs (int): Jobs' worth of CPUs to take, e.g. the number of
+                tracks in a batched separation (capped at every CPU).
+
+        Yields:
+            Allotment: The thread count and, when pinning, the `jobs` CPU
+                slices with the fewest current holders.
+        """
+        jobs = max(1, min(jobs, self.workers))
+        threads = min(len(self.cpus), self.threads * jobs) if jobs > 1 else self.threads
+        with self._lock:
+            indexes = sorted(range(len(self._slices)), key=lambda i: self._holders[i])[:jobs]
+            for index in indexes:
+                self._holders[index] += 1
+            self._active.append(threads)
+            self._resize_locked()
+        restore = self._limit_calling_thread(threads)
+        cpus = sorted({cpu for index in indexes for cpu in self._slices[index]}) if self.pin else None
+        try:
+            yield Allotment(threads, cpus)
+        finally:
+            restore()
+            with self._lock:
+                for index in indexes:
+                    self._holders[index] -= 1
+                self._active.remove(threads)
+                self._resize_locked()
+
+    def describe(self):
+        return {
+            "cpus": len(self.cpus),
+            "workers": self.workers,
+            "threads_per_job": self.threads,
+            "pinned": self.pin,
+        }
+
+
+# One budget per process, sized for its worker pool
+_BUDGET = None
+_BUDGET_LOCK = threading.Lock()
+
+
+def get_thread_budget():
+    global _BUDGET
+    with _BUDGET_LOCK:
+        if _BUDGET is None:
+            _BUDGET = ThreadBudget()
+        return _BUDGET
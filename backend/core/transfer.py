@@ -0,0 +1,242 @@
+"""
+Parallel, resumable file transfers between local disk and a storage backend.
+
+Large files move in slices on a thread pool. Uploaded slices land as
+temporary part objects that are composed into the final object, so a failed
+upload resumes from the parts already stored. Downloads write slices into a
+local .partial file and record the finished ones next to it, so a failed
+download picks up where it stopped. Both go through the backends' stat /
+upload_range / compose / download_range (see core.storage), so they run
+against LocalStorage as well as GCS.
+"""
+import base64
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import TRANSFER_SLICE_SIZE, TRANSFER_WORKERS, TRANSFER_ATTEMPTS
+
+# Where upload parts wait to be composed; GCS composes at most 32 objects
+PARTS_PREFIX = "_transfers/"
+MAX_PARTS = 32
+
+
+def file_checksums(path, offset=0, length=None):
+    """
+    Base64 MD5 and CRC32C of a file (or of `length` bytes from `offset`),
+    encoded the way GCS reports them. crc32c is None without google_crc32c.
+    """
+    md5 = hashlib.md5()
+    try:
+        import google_crc32c
+        crc = google_crc32c.Checksum()
+    except ImportError:
+        crc = None
+
+    remaining = os.path.getsize(path) - offset if length is None else length
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while remaining > 0:
+            chunk = f.read(min(1024 * 1024, remaining))
+            if not chunk:
+                break
+            md5.update(chunk)
+            if crc is not None:
+                crc.update(chunk)
+            remaining -= len(chunk)
+    return {
+        "md5": base64.b64encode(md5.digest()).decode(),
+        "crc32c": base64.b64encode(crc.digest()).decode() if crc is not None else None,
+    }
+
+
+def same_content(size, checksums, remote):
+    """
+    True if a stored object (see stat()) holds exactly these bytes. CRC32C is
+    preferred since composed objects have no MD5; without a checksum both
+    sides know, the contents are assumed to differ.
+    """
+    if remote is None or remote["size"] != size:
+        return False
+    for kind in ("crc32c", "md5"):
+        if checksums.get(kind) and remote.get(kind):
+            return checksums[kind] == remote[kind]
+    return False
+
+
+def _mismatched(size, checksums, remote):
+    """True if the object provably differs (size, or a checksum both sides know)."""
+    if remote is None or remote["size"] != size:
+        return True
+    return any(checksums.get(kind) and remote.get(kind) and checksums[kind] != remote[kind]
+               for kind in ("crc32c", "md5"))
+
+
+class TransferManager:
+    def __init__(self, storage=None, slice_size=TRANSFER_SLICE_SIZE, workers=TRANSFER_WORKERS,
+                 attempts=TRANSFER_ATTEMPTS, retry_delay=0.5):
+        """
+        Moves files to and from a storage backend in parallel slices.
+
+        Args:
+            storage: Backend from core.storage (the shared one if None).
+            slice_size (int): Files up to this size go in one request; larger
+                ones are split into at most 32 slices of at least this size.
+            workers (int): Slices in flight at once.
+            attempts (int): Tries per slice before the transfer fails (a
+                later call resumes it).
+            retry_delay (float): First backoff between tries (doubles each time).
+        """
+        self._storage = storage
+        self.slice_size = max(1, slice_size)
+        self.workers = max(1, workers)
+        self.attempts = max(1, attempts)
+        self.retry_delay = retry_delay
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            from core.storage import get_storage
+            self._storage = get_storage()
+        return self._storage
+
+    def _slices(self, size):
+        """(offset, length) of each slice of a `size`-byte file."""
+        if size <= self.slice_size:
+            return [(0, size)]
+        count = min(MAX_PARTS, math.ceil(size / self.slice_size))
+        length = math.ceil(size / count)
+        return [(offset, min(length, size - offset)) for offset in range(0, size, length)]
+
+    def _retry(self, func, *args):
+        for attempt in range(self.attempts):
+            try:
+                return func(*args)
+            except Exception as e:
+                if attempt == self.attempts - 1:
+                    raise
+                delay = self.retry_delay * 2 ** attempt
+                print(f"🔁 {func.__name__} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _run_parallel(self, func, items):
+        """Call func(item) for every item on the pool; re-raises the first failure."""
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(items)) or 1) as pool:
+            for future in [pool.submit(func, item) for item in items]:
+                future.result()
+
+    def upload(self, local_path, name):
+        """
+        Upload local_path as `name`, unless the object already holds the same
+        bytes.
+
+        Returns:
+            str: "skipped" (identical object already stored) or "uploaded".
+
+        Raises:
+            Exception: The last error once a slice has used up its attempts.
+                The parts already stored are kept, so calling upload() again
+                only sends the missing ones.
+        """
+        size = os.path.getsize(local_path)
+        checksums = file_checksums(local_path)
+        if same_content(size, checksums, self.storage.stat(name)):
+            print(f"♻️ Already stored with identical content, skipping upload: {self.storage.uri(name)}")
+            return "skipped"
+
+        slices = self._slices(size)
+        if len(slices) == 1:
+            self._retry(self.storage.upload_file, local_path, name)
+            return "uploaded"
+
+        # Same file, destination and slicing -> same part names, which is
+        # what lets a retried upload find the parts it already sent
+        key = hashlib.sha1(f"{name}|{checksums['md5']}|{len(slices)}".encode()).hexdigest()[:20]
+        parts = [f"{PARTS_PREFIX}{key}/{index:02d}" for index in range(len(slices))]
+
+        def send(index):
+            offset, length = slices[index]
+            stored = self.storage.stat(parts[index])
+            if stored is not None and same_content(length, file_checksums(local_path, offset, length), stored):
+                return  # Sent by an earlier, interrupted attempt
+            self._retry(self.storage.upload_range, local_path, offset, length, parts[index])
+
+        print(f"📤 Uploading {len(slices)} slices in parallel: {self.storage.uri(name)}")
+        self._run_parallel(send, range(len(slices)))
+        self._retry(self.storage.compose, parts, name)
+
+        if _mismatched(size, checksums, self.storage.stat(name)):
+            self.storage.delete(name)
+            raise IOError(f"Checksum mismatch after composing {name}")
+        for part in parts:
+            try:
+                self.storage.delete(part)
+            except Exception as e:
+                print(f"⚠️ Could not delete upload part {part}: {e}")
+        return "uploaded"
+
+    def download(self, name, local_path):
+        """
+        Download `name` to local_path, verifying the result against the
+        object's checksum.
+
+        Raises:
+            FileNotFoundError: If the object does not exist.
+            Exception: The last error once a slice has used up its attempts.
+                Finished slices are remembered in <local_path>.partial.json,
+                so calling download() again only fetches the rest (as long as
+                the object has not changed in between).
+        """
+        remote = self.storage.stat(name)
+        if remote is None:
+            raise FileNotFoundError(name)
+        os.makedirs(os.path.dirname(os.path.abspath(local_path)), exist_ok=True)
+
+        slices = self._slices(remote["size"])
+        if len(slices) == 1:
+            self._retry(self.storage.download_file, name, local_path)
+            return local_path
+
+        partial = f"{local_path}.partial"
+        state_path = f"{partial}.json"
+        state = {"generation": remote["generation"], "size": remote["size"], "slices": len(slices), "done": []}
+        try:
+            with open(state_path) as f:
+                saved = json.load(f)
+            if (all(saved.get(k) == state[k] for k in ("generation", "size", "slices"))
+                    and os.path.getsize(partial) == remote["size"]):
+                state = saved
+        except (OSError, ValueError):
+            pass
+        if not state["done"]:
+            with open(partial, "wb") as f:
+                f.truncate(remote["size"])
+        else:
+            print(f"⏯️ Resuming download of {name}: {len(state['done'])}/{len(slices)} slices already here")
+
+        done = set(state["done"])
+        lock = threading.Lock()
+
+        def fetch(index):
+            offset, length = slices[index]
+            self._retry(self.storage.download_range, name, offset, length, partial)
+            with lock:
+                done.add(index)
+                state["done"] = sorted(done)
+                with open(f"{state_path}.tmp", "w") as f:
+                    json.dump(state, f)
+                os.replace(f"{state_path}.tmp", state_path)
+
+        print(f"📥 Downloading {len(slices) - len(done)} slices in parallel: {self.storage.uri(name)}")
+        self._run_parallel(fetch, [index for index in range(len(slices)) if index not in done])
+
+        corrupt = _mismatched(remote["size"], file_checksums(partial), remote)
+        os.remove(state_path)
+        if corrupt:
+            os.remove(partial)
+            raise IOError(f"Checksum mismatch after downloading {name}")
+        os.replace(partial, local_path)
+        return local_path
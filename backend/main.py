@@ -1,16 +1,119 @@
 import argparse
+import json
 import os
 import sys
+import time
 from core.downloader import AudioDownloader
 from core.stems import StemSeparator
 from core.analyzer import AudioAnalyzer
 from core.packager import Packager
+from core.audio import DecodedAudio
+from core.pipeline import Stage, StageExecutor, StageFailed
+from core.formats import parse_stem_format
+from core.profiles import parse_separation_profile
+from config import (
+    DECODE_TO_MEMMAP, DECODE_DIR, STEM_FORMAT, DOWNLOAD_DIR, STORAGE_BACKEND, ANALYZE_STEMS, SEPARATION_PROFILE,
+)
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".m4a", ".opus", ".ogg", ".webm", ".aac")
+
+def collect_audio_files(inputs):
+    """Expand directories (recursively) into the audio files they contain."""
+    for item in inputs:
+        if os.path.isdir(item):
+            for directory, _, files in sorted(os.walk(item)):
+                for filename in sorted(files):
+                    if filename.lower().endswith(AUDIO_EXTENSIONS):
+                        yield os.path.join(directory, filename)
+        else:
+            yield item
+
+def load_finished(output_path):
+    """Paths already analyzed successfully in a previous (interrupted) run."""
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+    with open(output_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Half-written last line of a killed run
+            if "analysis" in record:
+                finished.add(record["path"])
+    return finished
+
+def batch(argv):
+    """`python main.py batch ...`: analyze a whole library into JSON Lines."""
+    parser = argparse.ArgumentParser(prog="main.py batch",
+                                     description="StemSense: BPM, key and loudness for many files at once")
+    parser.add_argument("inputs", nargs="*", default=[DOWNLOAD_DIR],
+                        help=f"Audio files or folders (default: {DOWNLOAD_DIR})")
+    parser.add_argument("--from-storage", metavar="PREFIX",
+                        help="Analyze the objects under PREFIX (e.g. downloads/) in the configured bucket instead")
+    parser.add_argument("-o", "--output", default="analysis.jsonl",
+                        help="JSON Lines file; finished paths in it are skipped on the next run")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="Worker processes (default: one per CPU core)")
+    parser.add_argument("--restart", action="store_true", help="Ignore previous results and start over")
+    args = parser.parse_args(argv)
+
+    if args.from_storage is not None:
+        from core.storage import get_storage
+        paths, storage_kind = get_storage().list(args.from_storage), STORAGE_BACKEND
+        paths = [p for p in paths if p.lower().endswith(AUDIO_EXTENSIONS)]
+    else:
+        paths, storage_kind = list(collect_audio_files(args.inputs)), None
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    finished = load_finished(args.output)
+    todo = [p for p in paths if p not in finished]
+    print(f"📚 {len(paths)} files, {len(paths) - len(todo)} already done, "
+          f"{len(todo)} to analyze with {args.workers} workers -> {args.output}")
+
+    analyzer = AudioAnalyzer()
+    started = time.perf_counter()
+    done = failed = 0
+    with open(args.output, "a") as out:
+        try:
+            for path, analysis in analyzer.analyze_many(todo, workers=args.workers, storage_kind=storage_kind):
+                record = {"path": path, "analysis": analysis} if analysis else {"path": path, "error": "Analysis failed"}
+                out.write(json.dumps(record) + "\n")
+                out.flush()  # Every finished file survives an interruption
+                done += 1
+                failed += analysis is None
+                if done % 25 == 0 or done == len(todo):
+                    rate = done / (time.perf_counter() - started)
+                    print(f"⏱️ [{done}/{len(todo)}] {rate:.2f} files/s")
+        except KeyboardInterrupt:
+            print("\n\nInterrupted. Run the same command again to resume.")
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Analyzed {done} files ({failed} failed) in {elapsed:.1f}s: "
+          f"{done / elapsed if elapsed else 0:.2f} files/s")
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        return batch(sys.argv[2:])
+
     # 1. Set up Command Line Arguments
-    parser = argparse.ArgumentParser(description="StemSense: AI Audio Analysis & Separation Workflow")
+    parser = argparse.ArgumentParser(description="StemSense: AI Audio Analysis & Separation Workflow",
+                                     epilog="Use `main.py batch --help` to analyze a whole library.")
     parser.add_argument("input", help="Song name or YouTube URL")
+    parser.add_argument("--original-format", choices=["source", "mp3"], default="source",
+                        help="Package the original as downloaded (default) or encoded to MP3")
+    parser.add_argument("--format", dest="stem_format", default=STEM_FORMAT,
+                        help="Stem format: wav, wav24, wav32f, flac, flac16, mp3[:kbps] or opus[:kbps]")
+    parser.add_argument("--profile", default=SEPARATION_PROFILE,
+                        help="Separation profile: standard, karaoke, best, fast or a model name, "
+                             "with optional overrides, e.g. standard:two_stems=vocals,shifts=2")
     args = parser.parse_args()
+    try:
+        stem_format = parse_stem_format(args.stem_format)["name"]
+        profile = parse_separation_profile(args.profile)["name"]
+    except ValueError as e:
+        parser.error(str(e))
 
     print("\n" + "="*50)
     print("      🎵 WELCOME TO STEMSENSE 🎵")
@@ -20,55 +123,61 @@ def main():
     downloader = AudioDownloader()
     separator = StemSeparator()
     analyzer = AudioAnalyzer()
-    packager = Packager()
+    # The CLI keeps a local ZIP in EXPORT_DIR (and archives a copy to storage)
+    packager = Packager(streaming=False)
 
-    try:
-        # STEP 1: DOWNLOAD
-        print("[1/4] Starting Download...")
-        audio_path = downloader.download(args.input)
-        if not audio_path:
-            print("❌ Download failed. Exiting.")
-            return
-
-        track_filename = os.path.basename(audio_path)
-        track_name = os.path.splitext(track_filename)[0]
-
-        # STEP 2: SEPARATE STEMS
-        print("\n[2/4] Separating Stems (Vocals, Drums, Bass, Other)...")
-        # This will call Demucs
-        stems_dir = separator.separate(audio_path)
-        if not stems_dir:
-            print("❌ Stem separation failed. Exiting.")
-            return
-
-        # STEP 3: ANALYZE AUDIO
-        print("\n[3/4] Analyzing Audio DNA (BPM, Key, Loudness)...")
-        analysis_results = analyzer.analyze(audio_path)
+    def analyze(results):
+        analysis_results = analyzer.analyze(results["decode"])
         if not analysis_results:
             print("⚠️ Analysis failed. Continuing without metadata.")
             analysis_results = {"error": "Analysis failed"}
+        return analysis_results
 
-        # STEP 4: PACKAGE EVERYTHING
-        print("\n[4/4] Bundling everything into a ZIP...")
-        zip_path = packager.create_package(
-            track_name=track_name,
-            original_file=audio_path,
-            stems_dir=stems_dir,
-            analysis_data=analysis_results
-        )
-
-        if zip_path:
-            print("\n" + "="*50)
-            print("✨ SUCCESS: Workflow Complete!")
-            print(f"📦 Final Package: {zip_path}")
-            print("="*50 + "\n")
-        else:
-            print("❌ Packaging failed.")
+    # Separation and analysis both start as soon as the track is decoded
+    stages = [
+        Stage("download", lambda r: downloader.download(args.input),
+              status="[1/4] Starting Download...", error="Download failed"),
+        # Decode the track once and share it with separation and analysis
+        Stage("decode", lambda r: DecodedAudio.load(
+                  r["download"], memmap_dir=DECODE_DIR if DECODE_TO_MEMMAP else None),
+              requires=("download",), error="Decoding failed"),
+        Stage("separate", lambda r: separator.separate(r["decode"], output_format=stem_format, profile=profile),
+              requires=("decode",), status=f"[2/4] Separating Stems ({profile})...",
+              error="Stem separation failed"),
+        Stage("analyze", analyze,
+              requires=("decode",), status="[3/4] Analyzing Audio DNA (BPM, Key, Loudness)..."),
+        Stage("analyze_stems", lambda r: analyzer.analyze_stems(r["separate"]) if ANALYZE_STEMS else None,
+              requires=("separate",), required=False),
+        Stage("package", lambda r: packager.create_package(
+                  track_name=os.path.splitext(os.path.basename(r["download"]))[0],
+                  original_file=r["download"],
+                  stems_dir=r["separate"],
+                  analysis_data=r["analyze"],
+                  original_format=args.original_format,
+                  stem_analysis=r["analyze_stems"]),
+              requires=("separate", "analyze", "analyze_stems"), status="[4/4] Bundling everything into a ZIP...",
+              error="Packaging failed"),
+    ]
+    executor = StageExecutor(stages, on_status=lambda status: print(f"\n{status}"))
+
+    try:
+        results = executor.run()
+
+        print("\n" + "="*50)
+        print("✨ SUCCESS: Workflow Complete!")
+        print(f"📦 Final Package: {results['package']}")
+        print("="*50 + "\n")
 
+    except StageFailed as e:
+        print(f"❌ {e.message}. Exiting.")
     except KeyboardInterrupt:
         print("\n\nProcess interrupted by user. Cleaning up...")
     except Exception as e:
         print(f"\n❌ An unexpected error occurred: {e}")
+    finally:
+        audio = executor.results.get("decode")
+        if audio is not None:
+            audio.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: analysis speed and agreement per analysis sample rate.
+
+Builds a corpus of synthetic tracks (a click on every beat over a sustained
+major triad, at several tempos and keys) at 44.1 kHz, then analyses each one
+at the native rate and at each reduced rate. Reports the time per track and
+how often BPM (within 2%) and key agree with the native-rate result and with
+the ground truth.
+
+Usage:
+    python tests/bench_analysis_rate.py --seconds 60 --rates 22050 11025
+    python tests/bench_analysis_rate.py --mode stream
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.analyzer import AudioAnalyzer
+from core.audio import DecodedAudio
+
+SAMPLE_RATE = 44100
+KEYS = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+def make_track(seconds, bpm, key_index, seed):
+    """Stereo click track over a major triad rooted on `key_index` (octave 3)."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    root = 130.81 * 2 ** (key_index / 12)  # C3 shifted up
+    signal = sum(w * np.sin(2 * np.pi * root * 2 ** (semitones / 12) * t)
+                 for w, semitones in [(0.25, 0), (0.12, 4), (0.12, 7)])
+
+    click = np.exp(-np.arange(int(0.03 * SAMPLE_RATE)) / (0.004 * SAMPLE_RATE))
+    click *= rng.standard_normal(click.size)
+    for start in np.arange(0, seconds, 60.0 / bpm):
+        i = int(start * SAMPLE_RATE)
+        signal[i:i + click.size] += 0.5 * click[:signal.size - i]
+
+    stereo = np.stack([signal, 0.9 * signal]).astype(np.float32)
+    return DecodedAudio(stereo, SAMPLE_RATE)
+
+def bpm_matches(a, b):
+    return abs(a - b) <= 0.02 * b
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare BPM/key detection at reduced analysis rates")
+    parser.add_argument("--seconds", type=float, default=60, help="Length of each synthetic track")
+    parser.add_argument("--rates", type=int, nargs="+", default=[22050, 11025], help="Reduced rates to test")
+    parser.add_argument("--mode", choices=["full", "stream"], default="full")
+    args = parser.parse_args()
+
+    corpus = [
+        (bpm, key, make_track(args.seconds, bpm, key, seed=i))
+        for i, (bpm, key) in enumerate([(90, 0), (100, 2), (110, 4), (120, 5), (128, 7), (140, 9), (150, 11), (174, 3)])
+    ]
+    print(f"Corpus: {len(corpus)} tracks x {args.seconds:.0f}s at {SAMPLE_RATE} Hz ({args.mode} mode)\n")
+
+    reference = None
+    print(f"{'rate':>8} {'s/track':>8} {'speedup':>8} {'bpm=native':>11} {'key=native':>11} {'bpm=truth':>10} {'key=truth':>10}")
+    for rate in [0] + args.rates:
+        analyzer = AudioAnalyzer(mode=args.mode, analysis_rate=rate, cache=False)
+        results, elapsed = [], 0.0
+        for _, _, audio in corpus:
+            started = time.perf_counter()
+            results.append(analyzer.analyze(audio))
+            elapsed += time.perf_counter() - started
+        per_track = elapsed / len(corpus)
+
+        if reference is None:
+            reference = (results, per_track)
+        native, native_time = reference
+        n = len(corpus)
+        bpm_native = sum(bpm_matches(r["bpm"], ref["bpm"]) for r, ref in zip(results, native))
+        key_native = sum(r["key"] == ref["key"] for r, ref in zip(results, native))
+        bpm_truth = sum(bpm_matches(r["bpm"], bpm) for r, (bpm, _, _) in zip(results, corpus))
+        key_truth = sum(r["key"] == KEYS[key] for r, (_, key, _) in zip(results, corpus))
+
+        label = "native" if rate == 0 else str(rate)
+        print(f"{label:>8} {per_track:>8.2f} {native_time / per_track:>7.1f}x "
+              f"{bpm_native:>5}/{n:<5} {key_native:>5}/{n:<5} {bpm_truth:>4}/{n:<5} {key_truth:>4}/{n:<5}")
+
+if __name__ == "__main__":
+    main()
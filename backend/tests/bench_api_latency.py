@@ -0,0 +1,138 @@
+"""
+Load test: GET /tasks/{id} latency while submissions are pouring in.
+
+Runs the real FastAPI app in-process on an in-memory task store that sleeps
+--latency-ms per call (a stand-in for a Firestore round-trip), with search
+resolution stubbed out and no workers. Submitter threads POST /process in a
+loop while poller threads hammer GET /tasks/{id}.
+
+Pass --inline to run the store calls directly on the event loop, as the
+handlers used to, and compare the percentiles.
+
+Usage:
+    python tests/bench_api_latency.py --latency-ms 50 --duration 20
+    python tests/bench_api_latency.py --latency-ms 50 --duration 20 --inline
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else float("nan")
+
+class InlineTaskStore:
+    """The old behaviour: blocking store calls made straight from the handler."""
+
+    def __init__(self, store):
+        self.store = store
+
+    async def get(self, task_id):
+        return self.store.get(task_id)
+
+    async def create(self, task_id, data):
+        return self.store.create(task_id, data)
+
+    async def update(self, task_id, fields):
+        return self.store.update(task_id, fields)
+
+    async def delete(self, task_id):
+        return self.store.delete(task_id)
+
+def fake_resolve(self, query):
+    video_id = hashlib.sha1(query.encode()).hexdigest()[:11]
+    return {"video_id": video_id, "title": query, "duration": 180,
+            "url": f"https://www.youtube.com/watch?v={video_id}"}
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure GET /tasks/{id} latency under load")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Simulated task-store round-trip")
+    parser.add_argument("--submitters", type=int, default=8, help="Threads posting /process")
+    parser.add_argument("--pollers", type=int, default=16, help="Threads polling /tasks/{id}")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds to run")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--inline", action="store_true", help="Block the event loop like the old handlers")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="stemsense_bench_")
+    os.environ.update({
+        "TASK_STORE_BACKEND": "memory",
+        "RESULT_CACHE_BACKEND": "memory",
+        "STORAGE_BACKEND": "local",
+        "LOCAL_STORAGE_DIR": os.path.join(tmp, "bucket"),
+        "QUEUE_DB_PATH": os.path.join(tmp, "queue.sqlite3"),
+        "EMBEDDED_WORKER": "0",
+    })
+
+    import uvicorn
+    import api
+    from core.taskstore import MemoryTaskStore, AsyncTaskStore
+
+    store = MemoryTaskStore(latency=args.latency_ms / 1000)
+    api.tasks = InlineTaskStore(store) if args.inline else AsyncTaskStore(store)
+    api.AudioDownloader.resolve = fake_resolve
+
+    server = uvicorn.Server(uvicorn.Config(api.app, port=args.port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    base = f"http://127.0.0.1:{args.port}"
+    deadline = time.time() + args.duration
+    task_ids, get_ms, post_ms = [], [], []
+    lock = threading.Lock()
+
+    def submitter(worker):
+        n = 0
+        while time.time() < deadline:
+            body = urllib.parse.urlencode({"input": f"bench song {worker}-{n}"}).encode()
+            started = time.perf_counter()
+            with urllib.request.urlopen(f"{base}/process", data=body) as response:
+                task_id = json.load(response)["task_id"]
+            with lock:
+                post_ms.append((time.perf_counter() - started) * 1000)
+                task_ids.append(task_id)
+            n += 1
+
+    def poller():
+        while time.time() < deadline:
+            with lock:
+                task_id = random.choice(task_ids) if task_ids else None
+            if task_id is None:
+                time.sleep(0.01)
+                continue
+            started = time.perf_counter()
+            with urllib.request.urlopen(f"{base}/tasks/{task_id}") as response:
+                response.read()
+            with lock:
+                get_ms.append((time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=submitter, args=(i,)) for i in range(args.submitters)]
+    threads += [threading.Thread(target=poller) for _ in range(args.pollers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    server.should_exit = True
+
+    mode = "inline (blocking)" if args.inline else "offloaded"
+    print(f"Task store: {mode}, {args.latency_ms:.0f} ms per call, "
+          f"{args.submitters} submitters, {args.pollers} pollers, {args.duration:.0f}s\n")
+    print(f"{'endpoint':<16} {'requests':>9} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9}")
+    for name, values in [("GET /tasks/{id}", get_ms), ("POST /process", post_ms)]:
+        print(f"{name:<16} {len(values):>9} {percentile(values, 50):>9.1f} {percentile(values, 95):>9.1f} "
+              f"{percentile(values, 99):>9.1f} {max(values, default=float('nan')):>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: separation throughput (tracks/hour) with and without batching.
+
+Separates the same set of tracks in three ways, all with N jobs arriving at
+once:
+  - per-job:  one `demucs` process per job, all running in parallel (the
+              behaviour without batching)
+  - cli-batch: SeparationBatcher with the CLI engine (one `demucs` run with
+              every track as an input)
+  - batch:    SeparationBatcher with the in-process engine (one batched
+              model pass)
+
+Usage:
+    python tests/bench_separation_batch.py track1.mp3 track2.mp3 track3.mp3 track4.mp3
+    python tests/bench_separation_batch.py data/downloads/*.opus --modes per-job batch
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.batching import SeparationBatcher
+from core.stems import StemSeparator
+
+MODES = ["per-job", "cli-batch", "batch"]
+
+def run_concurrently(func, tracks):
+    """Call func(track) for every track on its own thread (jobs arriving together)."""
+    results = [None] * len(tracks)
+
+    def run(index):
+        results[index] = func(tracks[index])
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(tracks))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def bench(mode, tracks, output_format, output_dir):
+    if mode == "per-job":
+        separator = StemSeparator(output_dir=output_dir, engine="cli")
+        separate = lambda track: separator.separate(track, output_format=output_format)
+    else:
+        engine = "cli" if mode == "cli-batch" else "inprocess"
+        separator = StemSeparator(output_dir=output_dir, engine=engine)
+        if engine == "inprocess":
+            separator.preload()  # Warm the model, as a long-running worker would
+        batcher = SeparationBatcher(separator, max_batch=len(tracks), window=1.0)
+        separate = lambda track: batcher.separate(track, output_format=output_format)
+
+    started = time.perf_counter()
+    results = run_concurrently(separate, tracks)
+    elapsed = time.perf_counter() - started
+    return elapsed, sum(1 for r in results if r)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare batched and per-job Demucs separation throughput")
+    parser.add_argument("tracks", nargs="+", help="Audio files; all are submitted at once")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--format", default="wav", help="Stem format (the CLI modes need a CLI-supported one)")
+    args = parser.parse_args()
+
+    tracks = [os.path.abspath(track) for track in args.tracks]
+    print(f"{len(tracks)} track(s), submitted concurrently\n")
+    print(f"{'mode':>10} {'ok':>4} {'seconds':>9} {'tracks/hour':>12} {'speedup':>8}")
+
+    baseline = None
+    for mode in args.modes:
+        output_dir = tempfile.mkdtemp(prefix=f"stemsense-bench-{mode}-")
+        try:
+            elapsed, ok = bench(mode, tracks, args.format, output_dir)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        per_hour = ok * 3600.0 / elapsed if elapsed else 0.0
+        baseline = baseline or per_hour
+        speedup = per_hour / baseline if baseline else 0.0
+        print(f"{mode:>10} {ok:>4} {elapsed:>9.1f} {per_hour:>12.1f} {speedup:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
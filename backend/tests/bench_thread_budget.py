@@ -0,0 +1,103 @@
+"""
+Benchmark: separation throughput (jobs/hour) at 1, 2 and 4 concurrent jobs,
+with and without per-job thread budgets.
+
+  - unbudgeted: every job may use all CPUs (torch/OpenMP defaults), so N
+                concurrent jobs start N x cores threads
+  - budgeted:   each job gets cores / N threads (THREADS_PER_JOB=0)
+  - pinned:     as budgeted, plus a disjoint CPU slice per job (CLI engine
+                only; in-process jobs share one process's pools)
+
+Each configuration runs in a fresh Python process, because torch and BLAS
+thread pools are process-wide and keep their size once created.
+
+Usage:
+    python tests/bench_thread_budget.py track.mp3
+    python tests/bench_thread_budget.py track.mp3 --engine cli --concurrency 1 2 4 --modes budgeted pinned
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+MODES = ["unbudgeted", "budgeted", "pinned"]
+
+def child(args):
+    """Run one configuration in this (fresh) process and print its result as JSON."""
+    from core.threads import ThreadBudget, available_cpus
+    cpus = available_cpus()
+    threads = len(cpus) if args.mode == "unbudgeted" else 0
+    budget = ThreadBudget(workers=args.jobs, threads=threads, pin=args.mode == "pinned", cpus=cpus)
+    budget.apply_process_defaults()
+
+    from core.stems import StemSeparator
+    output_dir = tempfile.mkdtemp(prefix=f"stemsense-bench-threads-{args.mode}-")
+    try:
+        separator = StemSeparator(output_dir=output_dir, engine=args.engine, thread_budget=budget)
+        if args.engine == "inprocess":
+            separator.preload()  # Warm the model, as a long-running worker would
+
+        # Each job separates its own copy so nothing is shared on disk
+        tracks = []
+        for index in range(args.jobs):
+            name, ext = os.path.splitext(os.path.basename(args.track))
+            tracks.append(os.path.join(output_dir, f"{name}-{index}{ext}"))
+            shutil.copyfile(args.track, tracks[-1])
+
+        results = [None] * args.jobs
+        def run(index):
+            results[index] = separator.separate(tracks[index], output_format="wav")
+
+        started = time.perf_counter()
+        workers = [threading.Thread(target=run, args=(i,)) for i in range(args.jobs)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    print(json.dumps({"elapsed": elapsed, "ok": sum(1 for r in results if r), "threads": budget.threads}))
+
+def bench(track, engine, mode, jobs):
+    command = [sys.executable, os.path.abspath(__file__), track, "--engine", engine,
+               "--child", mode, "--jobs", str(jobs)]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare separation throughput with and without per-job thread budgets")
+    parser.add_argument("track", help="Audio file each job separates")
+    parser.add_argument("--engine", choices=["inprocess", "cli"], default="inprocess")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--child", choices=MODES, dest="mode", help=argparse.SUPPRESS)
+    parser.add_argument("--jobs", type=int, default=1, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.track = os.path.abspath(args.track)
+
+    if args.mode:
+        child(args)
+        return
+
+    print(f"{os.cpu_count()} CPU(s), engine={args.engine}\n")
+    print(f"{'mode':>11} {'jobs':>5} {'threads':>8} {'ok':>4} {'seconds':>9} {'jobs/hour':>10}")
+    for jobs in args.concurrency:
+        for mode in args.modes:
+            if mode == "pinned" and args.engine != "cli":
+                continue
+            result = bench(args.track, args.engine, mode, jobs)
+            per_hour = result["ok"] * 3600.0 / result["elapsed"] if result["elapsed"] else 0.0
+            print(f"{mode:>11} {jobs:>5} {result['threads']:>8} {result['ok']:>4} "
+                  f"{result['elapsed']:>9.1f} {per_hour:>10.1f}")
+
+if __name__ == "__main__":
+    main()
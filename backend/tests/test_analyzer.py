@@ -6,6 +6,25 @@ import pytest
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from core.analyzer import AudioAnalyzer
+from core.audio import DecodedAudio
+
+@pytest.fixture(autouse=True)
+def no_analysis_cache(monkeypatch):
+    """Every test analyzes for real (spawned analyze_many workers read the env)."""
+    monkeypatch.setattr("core.analyzer.ANALYSIS_CACHE_BACKEND", "none")
+    monkeypatch.setenv("ANALYSIS_CACHE_BACKEND", "none")
+
+def synthetic_track(seconds=40, sr=22050, bpm=120):
+    """Stereo A3/A4 tones with a click on every beat."""
+    np = pytest.importorskip("numpy")
+    t = np.arange(int(seconds * sr)) / sr
+    signal = 0.2 * np.sin(2 * np.pi * 220 * t) + 0.1 * np.sin(2 * np.pi * 440 * t)
+    click = np.exp(-np.arange(int(0.03 * sr)) / (0.005 * sr))
+    for start in np.arange(0, seconds, 60 / bpm):
+        i = int(start * sr)
+        signal[i:i + len(click)] += 0.6 * click[:len(signal) - i]
+    stereo = np.stack([signal, 0.8 * signal]).astype(np.float32)
+    return DecodedAudio(stereo, sr)
 
 def test_audio_analysis():
     """
@@ -38,6 +57,169 @@ def test_audio_analysis():
     print(f"Key: {results['key']}")
     print(f"Loudness: {results['loudness_lufs']} LUFS")
 
+def test_streaming_matches_full_analysis():
+    pytest.importorskip("librosa")
+    pytest.importorskip("pyloudnorm")
+    audio = synthetic_track()
+
+    full = AudioAnalyzer(mode="full").analyze(audio)
+    # 7 s blocks: several block boundaries inside the track
+    streamed = AudioAnalyzer(mode="stream", block_seconds=7).analyze(audio)
+
+    assert streamed["key"] == full["key"] == "A"
+    assert abs(streamed["bpm"] - full["bpm"]) < 1.0
+    assert abs(streamed["loudness_lufs"] - full["loudness_lufs"]) < 0.05
+
+def test_streaming_features_match_librosa_and_pyloudnorm():
+    librosa = pytest.importorskip("librosa")
+    pyln = pytest.importorskip("pyloudnorm")
+    import numpy as np
+    from core.features import OnsetEnvelope, ChromaSum, IntegratedLoudness
+
+    audio = synthetic_track(seconds=25)
+    sr, y = audio.sample_rate, audio.mono()
+    onset = OnsetEnvelope(sr)
+    chroma = ChromaSum(sr, block_frames=5 * sr)
+    loudness = IntegratedLoudness(sr, audio.channels)
+    for block in audio.blocks(3 * sr + 123):  # Deliberately not hop-aligned
+        mono = block.mean(axis=0)
+        onset.update(mono)
+        chroma.update(mono)
+        loudness.update(block)
+
+    expected_onset = librosa.onset.onset_strength(y=y, sr=sr)
+    streamed_onset = onset.finish()
+    assert streamed_onset.shape == expected_onset.shape
+    assert np.allclose(streamed_onset, expected_onset, atol=1e-2)
+
+    expected_chroma = librosa.feature.chroma_cqt(y=y, sr=sr).mean(axis=1)
+    assert np.allclose(chroma.finish(), expected_chroma, atol=1e-2)
+
+    expected_lufs = pyln.Meter(sr).integrated_loudness(audio.frames_first())
+    assert abs(loudness.finish() - expected_lufs) < 0.01
+
+def test_analyze_many_uses_a_process_pool(tmp_path):
+    sf = pytest.importorskip("soundfile")
+    pytest.importorskip("librosa")
+    paths = []
+    for i in range(3):
+        path = str(tmp_path / f"track_{i}.wav")
+        audio = synthetic_track(seconds=10, bpm=100 + 10 * i)
+        sf.write(path, audio.frames_first(), audio.sample_rate)
+        paths.append(path)
+    missing = str(tmp_path / "missing.wav")
+
+    results = dict(AudioAnalyzer().analyze_many(paths + [missing], workers=2))
+
+    assert set(results) == set(paths) | {missing}
+    assert results[missing] is None
+    assert all(results[p]["key"] == "A" for p in paths)
+
+def test_stem_analysis_uses_drums_for_beats_and_harmony_for_key(tmp_path):
+    sf = pytest.importorskip("soundfile")
+    pytest.importorskip("librosa")
+    import numpy as np
+    from core.features import HOP_LENGTH
+
+    sr = 22050
+    # librosa's tempo estimate snaps to 60 * sr / (hop * lag), so 120 BPM is
+    # not reachable; clicks exactly 22 hops apart (~117.45 BPM) are
+    period = 22 * HOP_LENGTH / sr
+    t = np.arange(20 * sr) / sr
+    click = np.zeros_like(t)
+    for i in range(0, len(t), 22 * HOP_LENGTH):
+        click[i:i + 200] = np.hanning(200)[:len(t) - i]
+    stems = {
+        "drums": click,
+        "bass": 0.3 * np.sin(2 * np.pi * 110 * t),   # A2
+        "other": 0.2 * np.sin(2 * np.pi * 440 * t),  # A4
+        "vocals": np.zeros_like(t),                  # Instrumental track
+    }
+    for name, signal in stems.items():
+        sf.write(str(tmp_path / f"{name}.wav"), np.stack([signal, signal], axis=1), sr)
+
+    results = AudioAnalyzer().analyze_stems(str(tmp_path))
+
+    assert abs(results["bpm"] - 60 / period) < 0.1
+    assert results["beat_source"] == "drums"
+    # Beats are reported on the frame grid: one hop of slack
+    intervals = np.diff(results["beats"])
+    assert np.allclose(intervals, period, atol=HOP_LENGTH / sr)
+    # The reported tempo agrees with the reported beat grid
+    assert abs(60 / np.median(intervals) - results["bpm"]) < 1
+    assert results["key"] == "A" and results["key_source"] == "bass+other"
+    assert results["stems"]["vocals"]["loudness_lufs"] is None
+    assert set(results["stems"]) == set(stems)
+
+def test_cached_analysis_skips_decoding(tmp_path, monkeypatch):
+    sf = pytest.importorskip("soundfile")
+    pytest.importorskip("librosa")
+    from core.cache import AnalysisCache, MemoryCacheBackend
+
+    audio = synthetic_track(seconds=10)
+    path = str(tmp_path / "track.wav")
+    sf.write(path, audio.frames_first(), audio.sample_rate)
+
+    analyzer = AudioAnalyzer(mode="full", cache=AnalysisCache(MemoryCacheBackend()))
+    first = analyzer.analyze(path)
+
+    def no_decoding(*args, **kwargs):
+        raise AssertionError("audio was decoded on a cache hit")
+    monkeypatch.setattr(DecodedAudio, "load", no_decoding)
+    assert analyzer.analyze(path) == first
+
+def test_audio_stream_is_analysed_block_by_block(tmp_path, monkeypatch):
+    sf = pytest.importorskip("soundfile")
+    pytest.importorskip("librosa")
+    pytest.importorskip("pyloudnorm")
+    from core.audio import AudioStream
+
+    audio = synthetic_track(seconds=20)
+    path = str(tmp_path / "track.wav")
+    sf.write(path, audio.frames_first(), audio.sample_rate)
+    full = AudioAnalyzer(mode="full").analyze(audio)
+
+    def no_decoding(*args, **kwargs):
+        raise AssertionError("the whole track was decoded")
+    monkeypatch.setattr(DecodedAudio, "load", no_decoding)
+    # Even in "full" mode a stream is never decoded in one piece
+    streamed = AudioAnalyzer(mode="full", block_seconds=7).analyze(AudioStream(path))
+
+    assert streamed["key"] == full["key"]
+    assert abs(streamed["bpm"] - full["bpm"]) < 1.0
+    assert abs(streamed["loudness_lufs"] - full["loudness_lufs"]) < 0.05
+
+def test_stem_analysis_runs_within_the_thread_budget(tmp_path):
+    sf = pytest.importorskip("soundfile")
+    pytest.importorskip("librosa")
+    import contextlib
+
+    class RecordingBudget:
+        def __init__(self):
+            self.active = 0
+            self.seen = []
+
+        @contextlib.contextmanager
+        def allot(self, jobs=1):
+            self.active += 1
+            try:
+                yield None
+            finally:
+                self.active -= 1
+
+    budget = RecordingBudget()
+    audio = synthetic_track(seconds=5)
+    for name in ("drums", "bass", "other", "vocals"):
+        sf.write(str(tmp_path / f"{name}.wav"), audio.frames_first(), audio.sample_rate)
+
+    analyzer = AudioAnalyzer(thread_budget=budget)
+    real_feature_rate = analyzer._feature_rate
+    analyzer._feature_rate = lambda rate: budget.seen.append(budget.active) or real_feature_rate(rate)
+
+    assert analyzer.analyze_stems(str(tmp_path))["key"] == "A"
+    # Every stem was analysed inside an allotment
+    assert budget.seen == [1, 1, 1, 1]
+
 if __name__ == "__main__":
     # This allows running the test script directly
     test_audio_analysis()
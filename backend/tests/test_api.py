@@ -0,0 +1,79 @@
+import asyncio
+import importlib
+import os
+import sys
+
+import pytest
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+URL = "https://www.youtube.com/watch?v=4NRXx6U8ABQ"
+
+@pytest.fixture
+def api(monkeypatch):
+    """The API module on in-memory stores, with no embedded workers running."""
+    pytest.importorskip("fastapi")
+    pytest.importorskip("python_multipart")
+    import core.cache
+    import core.jobqueue
+    import core.taskstore
+    from core.cache import ResultCache, MemoryCacheBackend
+    from core.downloader import AudioDownloader
+    from core.jobqueue import JobQueue
+    from core.taskstore import MemoryTaskStore, AsyncTaskStore
+
+    # Importing api/workflow builds their stores; keep them off Firestore
+    queue = JobQueue(":memory:")
+    monkeypatch.setattr(core.jobqueue, "_QUEUE", queue)
+    monkeypatch.setattr(core.taskstore, "make_task_store", lambda *args, **kwargs: MemoryTaskStore())
+    monkeypatch.setattr(core.cache, "make_backend", lambda *args, **kwargs: MemoryCacheBackend())
+    module = importlib.import_module("api")
+    workflow = importlib.import_module("workflow")
+
+    store = MemoryTaskStore()
+    cache = ResultCache(MemoryCacheBackend())
+    monkeypatch.setattr(workflow, "task_store", store)
+    monkeypatch.setattr(module, "tasks", AsyncTaskStore(store))
+    monkeypatch.setattr(module, "job_queue", queue)
+    monkeypatch.setattr(module, "result_cache", cache)
+    monkeypatch.setattr(AudioDownloader, "resolve", lambda self, query: {"video_id": "4NRXx6U8ABQ"})
+    return module, workflow, store
+
+def submit(api):
+    return asyncio.run(api.process_audio(
+        input=URL, original_format="source", stem_format="wav", separation_profile="standard",
+    ))["task_id"]
+
+def test_request_joining_after_the_original_cancelled_is_not_cancelled(api):
+    api, workflow, store = api
+    first = submit(api)
+    workflow.update_task(first, {"status": "separating"})
+    second = submit(api)
+    assert store.get(second)["status"] == "separating"
+
+    # The first requester leaves; the job carries on for the second...
+    asyncio.run(api.cancel_task(first))
+    # ...so a third request joins it without inheriting the cancel
+    third = submit(api)
+    assert store.get(third)["status"] == "queued"
+    assert api.job_queue.subscribers(first) == [second, third]
+
+    workflow.update_task(first, {"status": "completed", "result_file": "x.zip"})
+    assert store.get(first)["status"] == "cancelled"
+    for task_id in (second, third):
+        assert store.get(task_id)["status"] == "completed"
+        assert store.get(task_id)["result_file"] == "x.zip"
+
+def test_request_after_the_original_completed_is_not_completed_without_a_file(api):
+    api, workflow, store = api
+    first = submit(api)
+    api.job_queue.claim()
+    # Finished, but the worker has not dropped the job from the queue yet
+    workflow.update_task(first, {"status": "completed", "result_file": "x.zip"})
+
+    second = submit(api)
+    assert second != first
+    assert store.get(second)["status"] == "queued"
+    assert api.job_queue.subscribers(second) == [second]
+    assert api.job_queue.position(second) == 1
@@ -0,0 +1,118 @@
+import os
+import sys
+import threading
+import time
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.batching import SeparationBatcher
+from core.cancellation import Cancelled, CancellationToken
+
+class FakeSeparator:
+    """Records each batch and 'writes' stems for every track after `delay` seconds."""
+    output_format = "wav"
+    profile = "standard"
+    discarded_paths = []
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+        self.stopped = False
+
+    def separate_batch(self, audios, output_format=None, progress=None, token=None, profile=None):
+        self.batches.append((list(audios), output_format, profile))
+        deadline = time.monotonic() + self.delay
+        while time.monotonic() < deadline:
+            if token is not None and token.cancelled:
+                self.stopped = True
+                raise Cancelled()
+            time.sleep(0.01)
+        return [f"stems/{audio}__{output_format}" for audio in audios]
+
+    @staticmethod
+    def _discard(path):
+        FakeSeparator.discarded_paths.append(path)
+
+def submit_all(batcher, tracks, **kwargs):
+    results, errors = {}, {}
+
+    def run(track):
+        try:
+            results[track] = batcher.separate(track, **kwargs.get(track, {}))
+        except Exception as e:
+            errors[track] = e
+
+    threads = [threading.Thread(target=run, args=(track,)) for track in tracks]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+def test_concurrent_tracks_share_one_batch_and_get_their_own_stems():
+    separator = FakeSeparator()
+    batcher = SeparationBatcher(separator, max_batch=4, window=0.3)
+
+    threads, results, errors = submit_all(batcher, ["a", "b", "c"])
+    for thread in threads:
+        thread.join(5)
+
+    assert not errors
+    assert len(separator.batches) == 1
+    assert sorted(separator.batches[0][0]) == ["a", "b", "c"]
+    assert results == {t: f"stems/{t}__wav" for t in "abc"}
+
+def test_batches_are_capped_and_split_by_format_and_profile():
+    separator = FakeSeparator()
+    batcher = SeparationBatcher(separator, max_batch=2, window=0.3)
+
+    threads, results, errors = submit_all(
+        batcher, ["a", "b", "c", "d"], c={"output_format": "flac"}, d={"profile": "karaoke"},
+    )
+    for thread in threads:
+        thread.join(5)
+
+    assert not errors
+    assert results["c"] == "stems/c__flac"
+    assert all(len(audios) <= 2 for audios, _, _ in separator.batches)
+    assert sorted((a, fmt, profile) for audios, fmt, profile in separator.batches for a in audios) == [
+        ("a", "wav", "standard"), ("b", "wav", "standard"), ("c", "flac", "standard"), ("d", "wav", "karaoke"),
+    ]
+
+def test_cancelled_job_stops_waiting_but_batch_continues():
+    FakeSeparator.discarded_paths.clear()
+    separator = FakeSeparator(delay=1.0)
+    batcher = SeparationBatcher(separator, max_batch=2, window=0.2)
+    token = CancellationToken()
+
+    threads, results, errors = submit_all(batcher, ["a", "b"], a={"token": token})
+    time.sleep(0.4)  # Both are in the running batch now
+    token.cancel()
+    threads[0].join(0.5)
+    assert not threads[0].is_alive()
+    assert isinstance(errors["a"], Cancelled)
+
+    threads[1].join(5)
+    assert results["b"] == "stems/b__wav"
+    # The cancelled track's stems are thrown away once the batch finishes
+    assert FakeSeparator.discarded_paths == ["stems/a__wav"]
+
+def test_batch_stops_when_every_track_is_cancelled():
+    separator = FakeSeparator(delay=5.0)
+    batcher = SeparationBatcher(separator, max_batch=2, window=0.1)
+    tokens = {"a": CancellationToken(), "b": CancellationToken()}
+
+    threads, _, errors = submit_all(batcher, ["a", "b"], a={"token": tokens["a"]}, b={"token": tokens["b"]})
+    time.sleep(0.3)
+    tokens["a"].cancel()
+    time.sleep(0.2)
+    assert not separator.stopped  # "b" still wants its stems
+    tokens["b"].cancel()
+
+    for thread in threads:
+        thread.join(1)
+    assert all(isinstance(errors[t], Cancelled) for t in "ab")
+    # The shared run was stopped long before its 5 s were up
+    deadline = time.monotonic() + 1.0
+    while not separator.stopped and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert separator.stopped
@@ -0,0 +1,95 @@
+import os
+import sys
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.cache import (
+    ResultCache, AnalysisCache, MemoryCacheBackend, SQLiteCacheBackend, TTLCache,
+    fingerprint_file, extract_video_id,
+)
+
+def test_extract_video_id():
+    assert extract_video_id("https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=10") == "dQw4w9WgXcQ"
+    assert extract_video_id("https://youtu.be/dQw4w9WgXcQ") == "dQw4w9WgXcQ"
+    assert extract_video_id("https://youtube.com/shorts/dQw4w9WgXcQ") == "dQw4w9WgXcQ"
+    assert extract_video_id("the weeknd blinding lights") is None
+
+def test_fingerprint_is_content_based(tmp_path):
+    a = tmp_path / "a.mp3"
+    b = tmp_path / "Blinding_Lights.mp3"
+    a.write_bytes(b"same audio bytes")
+    b.write_bytes(b"same audio bytes")
+
+    assert fingerprint_file(str(a)) == fingerprint_file(str(b))
+
+def test_different_inputs_share_one_result():
+    cache = ResultCache(MemoryCacheBackend())
+    cache.store("StemSense_Blinding_Lights.zip", [
+        cache.input_key("Blinding Lights"),
+        cache.video_key("4NRXx6U8ABQ"),
+        cache.audio_key("abc123"),
+        cache.video_key(None),  # Unknown keys are skipped
+    ])
+
+    # Input text is normalised for case and whitespace
+    assert cache.lookup([cache.input_key("  blinding   LIGHTS ")]) == "StemSense_Blinding_Lights.zip"
+    # A different search that resolves to the same audio
+    assert cache.lookup([cache.input_key("the weeknd blinding lights"), cache.audio_key("abc123")]) == "StemSense_Blinding_Lights.zip"
+    assert cache.lookup([cache.video_key(extract_video_id("https://youtu.be/4NRXx6U8ABQ"))]) == "StemSense_Blinding_Lights.zip"
+    assert cache.lookup([cache.input_key("something else")]) is None
+
+def test_stale_entries_are_dropped(tmp_path):
+    cache = ResultCache(SQLiteCacheBackend(str(tmp_path / "cache.sqlite3")))
+    cache.store("gone.zip", [cache.video_key("4NRXx6U8ABQ")])
+
+    assert cache.lookup([cache.video_key("4NRXx6U8ABQ")], exists=lambda f: False) is None
+    assert cache.backend.get(cache.video_key("4NRXx6U8ABQ")) is None
+
+def test_ttl_cache_expires_and_evicts():
+    now = [0.0]
+    cache = TTLCache(ttl=60, max_entries=2, clock=lambda: now[0])
+    cache.set("blinding lights", {"video_id": "4NRXx6U8ABQ"})
+    assert cache.get("blinding lights") == {"video_id": "4NRXx6U8ABQ"}
+
+    now[0] = 61
+    assert cache.get("blinding lights") is None
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)  # Evicts the oldest entry
+    assert cache.get("a") is None
+    assert len(cache) == 2
+
+def test_variants_do_not_collide():
+    cache = ResultCache(MemoryCacheBackend())
+    cache.store("source.zip", [cache.video_key("4NRXx6U8ABQ")])
+    cache.store("mp3.zip", [cache.video_key("4NRXx6U8ABQ")], variant="orig=mp3")
+
+    assert cache.lookup([cache.video_key("4NRXx6U8ABQ")]) == "source.zip"
+    assert cache.lookup([cache.video_key("4NRXx6U8ABQ")], variant="orig=mp3") == "mp3.zip"
+
+def test_analysis_cache_keys_on_version_and_params(tmp_path):
+    cache = AnalysisCache(SQLiteCacheBackend(str(tmp_path / "analysis.sqlite3")))
+    params = {"kind": "mix", "mode": "auto", "analysis_rate": 22050}
+    key = AnalysisCache.key("abc123", 1, params)
+    cache.set(key, {"bpm": 120.0, "key": "A", "loudness_lufs": -9.5})
+
+    assert cache.get(key) == {"bpm": 120.0, "key": "A", "loudness_lufs": -9.5}
+    # Same params in another order: same key
+    assert AnalysisCache.key("abc123", 1, dict(reversed(list(params.items())))) == key
+    # New algorithm version or settings: old results are not served
+    assert cache.get(AnalysisCache.key("abc123", 2, params)) is None
+    assert cache.get(AnalysisCache.key("abc123", 1, {**params, "analysis_rate": 11025})) is None
+
+def test_broken_analysis_cache_is_a_miss():
+    class Broken:
+        def get(self, key):
+            raise ConnectionError("firestore unavailable")
+
+        def set(self, key, value):
+            raise ConnectionError("firestore unavailable")
+
+    cache = AnalysisCache(Broken())
+    assert cache.get("analysis:v1:x:y") is None
+    cache.set("analysis:v1:x:y", {"bpm": 1.0})  # Swallowed
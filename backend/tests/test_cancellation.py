@@ -0,0 +1,162 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.cancellation import Cancelled, CancellationToken, CancellationRegistry
+from core.pipeline import Stage, StageExecutor, PipelineCancelled
+
+def test_token_runs_callbacks_once():
+    token = CancellationToken()
+    calls = []
+    token.on_cancel(lambda: calls.append("kill"))
+    unregister = token.on_cancel(lambda: calls.append("removed"))
+    unregister()
+
+    token.cancel()
+    token.cancel()
+
+    assert calls == ["kill"]
+    with pytest.raises(Cancelled):
+        token.raise_if_cancelled()
+    # Registering after the fact runs the callback straight away
+    token.on_cancel(lambda: calls.append("late"))
+    assert calls == ["kill", "late"]
+
+def test_registry_reaches_running_jobs_only():
+    registry = CancellationRegistry()
+    token = registry.open("task-1")
+
+    assert registry.cancel("task-1") is True
+    assert token.cancelled
+    registry.close("task-1")
+    assert registry.cancel("task-1") is False
+
+def test_watch_polls_for_remote_cancellation():
+    registry = CancellationRegistry()
+    token = registry.open("task-1")
+    remote = threading.Event()
+    registry.watch("task-1", remote.is_set, interval=0.01)
+
+    remote.set()
+    assert token.wait(2.0)
+
+def test_executor_waits_for_running_stages_once_token_fires():
+    token = CancellationToken()
+    started, finished = threading.Event(), threading.Event()
+    ran = []
+
+    def separate(results):
+        token.wait(5)
+        token.raise_if_cancelled()
+
+    def analyze(results):
+        # Ignores the token entirely, like a stage stuck in native code
+        started.set()
+        threading.Event().wait(0.5)
+        finished.set()
+        return {"bpm": 120.0}
+
+    stages = [
+        Stage("separate", separate),
+        Stage("analyze", analyze),
+        Stage("package", lambda r: ran.append("package") or "zip", requires=("separate", "analyze")),
+    ]
+    threading.Thread(target=lambda: started.wait(5) and token.cancel()).start()
+
+    with pytest.raises(Cancelled):
+        StageExecutor(stages, token=token).run()
+
+    # The stage that ignored the token had returned before run() did
+    assert finished.is_set()
+    assert ran == []
+
+def test_stage_cancellation_propagates():
+    token = CancellationToken()
+
+    def separate(results):
+        token.cancel()
+        token.raise_if_cancelled()
+
+    with pytest.raises(Cancelled):
+        StageExecutor([Stage("separate", separate)], token=token).run()
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs a POSIX shell script")
+def test_cli_separation_is_killed_and_cleaned_up(tmp_path, monkeypatch):
+    pytest.importorskip("numpy")
+    from core.stems import StemSeparator
+
+    # A fake `demucs` that writes a partial stem and then hangs
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake = bin_dir / "demucs"
+    fake.write_text(
+        "#!/bin/sh\n"
+        "for last; do :; done\n"
+        'name=$(basename "${last%.*}")\n'
+        f'mkdir -p "{tmp_path}/stems/htdemucs/$name"\n'
+        f'echo partial > "{tmp_path}/stems/htdemucs/$name/vocals.wav"\n'
+        "exec sleep 30\n"
+    )
+    fake.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    audio = tmp_path / "track.wav"
+    audio.write_bytes(b"RIFF")
+    separator = StemSeparator(output_dir=str(tmp_path / "stems"), engine="cli", model_name="htdemucs")
+    token = CancellationToken()
+    threading.Timer(0.5, token.cancel).start()
+
+    started = time.monotonic()
+    with pytest.raises(Cancelled):
+        separator.separate(str(audio), output_format="wav", token=token)
+
+    assert time.monotonic() - started < 10
+    assert not os.path.exists(tmp_path / "stems" / "htdemucs" / "track")
+
+def test_inprocess_inference_stops_between_windows(tmp_path, monkeypatch):
+    torch = pytest.importorskip("torch")
+    import core.stems
+    from core.stems import StemSeparator
+
+    class FakeModel:
+        samplerate = 100
+
+    token = CancellationToken()
+    windows = []
+
+    def run_model(model, mix, device, profile):
+        windows.append(mix.shape[-1])
+        token.cancel()  # The job is cancelled while the first window runs
+        return torch.stack([mix, mix], dim=1)
+
+    monkeypatch.setattr(core.stems, "_run_model", run_model)
+    separator = StemSeparator(output_dir=str(tmp_path), segment_seconds=1, overlap_seconds=0.1)
+    mix = torch.zeros(1, 2, 1000)  # Ten seconds: ~11 windows
+
+    with pytest.raises(Cancelled):
+        separator._infer(FakeModel(), mix, "cpu", {}, token.raise_if_cancelled)
+    assert windows == [100]
+
+
+def test_inprocess_inference_reports_progress_per_window(tmp_path, monkeypatch):
+    torch = pytest.importorskip("torch")
+    import core.stems
+    from core.stems import StemSeparator
+
+    class FakeModel:
+        samplerate = 100
+
+    monkeypatch.setattr(core.stems, "_run_model", lambda model, mix, device, profile: torch.stack([mix, mix], dim=1))
+    separator = StemSeparator(output_dir=str(tmp_path), segment_seconds=2, overlap_seconds=0.5)
+    fractions = []
+
+    sources = separator._infer(FakeModel(), torch.ones(1, 2, 1000), "cpu", {}, lambda: None, fractions.append)
+
+    assert sources.shape == (1, 2, 2, 1000)
+    assert len(fractions) > 3 and fractions == sorted(fractions) and fractions[-1] == 1.0
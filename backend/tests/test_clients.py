@@ -0,0 +1,39 @@
+import os
+import sys
+import threading
+import time
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import core.clients as clients
+import core.storage as storage_module
+
+def test_shared_client_is_built_once_across_threads(monkeypatch):
+    monkeypatch.setattr(clients, "_CLIENTS", {})
+    builds = []
+
+    def build():
+        builds.append(1)
+        time.sleep(0.05)  # A slow auth handshake
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(clients._shared("storage", build))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(builds) == 1
+    assert all(r is results[0] for r in results)
+
+def test_get_storage_reuses_one_backend(monkeypatch, tmp_path):
+    monkeypatch.setattr(storage_module, "_STORAGES", {})
+    local_storage = storage_module.LocalStorage
+    monkeypatch.setattr(storage_module, "LocalStorage", lambda: local_storage(str(tmp_path)))
+
+    first = storage_module.get_storage("local")
+    assert storage_module.get_storage("local") is first
+    # Local files need no signing credentials
+    assert storage_module.get_signing_storage("local") is first
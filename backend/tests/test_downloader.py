@@ -11,7 +11,7 @@ def test_yt_downloader_search():
     """
     Test the new yt-dlp based downloader with a search query.
     """
-    downloader = AudioDownloader()
+    downloader = AudioDownloader(audio_mode="mp3")
     query = "Lofi Hip Hop Short Loop"
     print(f"\nTesting Search: {query}")
     file_path = downloader.download(query)
@@ -25,7 +25,7 @@ def test_yt_downloader_url():
     """
     Test the yt-dlp based downloader with a specific YouTube URL.
     """
-    downloader = AudioDownloader()
+    downloader = AudioDownloader(audio_mode="mp3")
     url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ" # Never Gonna Give You Up
     print(f"\nTesting URL: {url}")
     file_path = downloader.download(url)
@@ -35,6 +35,20 @@ def test_yt_downloader_url():
     assert file_path.endswith(".mp3")
     print(f"URL Test Successful! File saved at: {file_path}")
 
+def test_yt_downloader_keeps_source_stream():
+    """
+    In "source" mode the native audio stream is kept (no MP3 re-encode).
+    """
+    downloader = AudioDownloader(audio_mode="source")
+    url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+    print(f"\nTesting source-stream download: {url}")
+    file_path = downloader.download(url)
+
+    assert file_path is not None
+    assert os.path.exists(file_path)
+    assert os.path.splitext(file_path)[1] in (".opus", ".m4a", ".ogg", ".webm", ".aac")
+    print(f"Source Test Successful! File saved at: {file_path}")
+
 if __name__ == "__main__":
     # You can run either or both
     test_yt_downloader_search()
@@ -0,0 +1,49 @@
+import asyncio
+import os
+import sys
+import threading
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.events import LocalEventBus
+
+def test_subscribers_receive_events_for_their_topic():
+    bus = LocalEventBus()
+    mine = bus.subscribe("task-a")
+    other = bus.subscribe("task-b")
+
+    bus.publish("task-a", {"status": "separating"})
+
+    assert mine.get(timeout=1) == {"status": "separating"}
+    assert other._queue.empty()
+
+def test_last_event_is_retained_for_late_subscribers():
+    bus = LocalEventBus()
+    bus.publish("task-a", {"status": "downloading"})
+    bus.publish("task-a", {"status": "separating", "progress": 0.4})
+
+    assert bus.last("task-a") == {"status": "separating", "progress": 0.4}
+    assert bus.last("task-b") is None
+
+def test_closed_subscription_stops_receiving():
+    bus = LocalEventBus()
+    subscription = bus.subscribe("task-a")
+    subscription.close()
+
+    bus.publish("task-a", {"status": "completed"})
+    assert subscription._queue.empty()
+    assert bus._subscribers == {}
+
+def test_async_subscriber_gets_events_from_worker_threads():
+    bus = LocalEventBus()
+
+    async def listen():
+        subscription = bus.subscribe("task-a", loop=asyncio.get_running_loop())
+        for status in ["separating", "packaging", "completed"]:
+            threading.Thread(target=bus.publish, args=("task-a", {"status": status})).start()
+        received = [(await subscription.aget(timeout=2))["status"] for _ in range(3)]
+        subscription.close()
+        return received
+
+    assert sorted(asyncio.run(listen())) == ["completed", "packaging", "separating"]
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+from core.features import StreamResampler, resample
+
+@pytest.mark.parametrize("sr, target_sr", [(44100, 22050), (48000, 22050), (44100, 11025)])
+def test_stream_resampler_matches_whole_signal(sr, target_sr):
+    rng = np.random.default_rng(0)
+    y = rng.standard_normal(3 * sr + 321).astype(np.float32)
+
+    resampler = StreamResampler(sr, target_sr)
+    pieces = [resampler.process(y[i:i + 7777]) for i in range(0, len(y), 7777)]
+    pieces.append(resampler.flush())
+    streamed = np.concatenate(pieces)
+
+    expected = resample(y, sr, target_sr)
+    assert streamed.shape == expected.shape
+    assert np.allclose(streamed, expected, atol=1e-5)
+
+def test_same_rate_is_a_no_op():
+    y = np.ones(100, dtype=np.float32)
+    assert resample(y, 22050, 22050) is y
+    assert StreamResampler(22050, 22050).process(y) is y
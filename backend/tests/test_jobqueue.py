@@ -0,0 +1,150 @@
+import os
+import sys
+import threading
+import time
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.jobqueue import JobQueue
+from core.scheduler import ResourceLimiter, WorkerPool
+
+def test_queue_is_fifo_and_reports_depth():
+    queue = JobQueue(":memory:")
+    for task_id in ["a", "b", "c"]:
+        queue.enqueue(task_id, {"input": f"song {task_id}"})
+
+    assert queue.depth() == 3
+    assert queue.position("c") == 3
+
+    assert queue.claim() == ("a", {"input": "song a"})
+    assert queue.depth() == 2
+    assert queue.running() == 1
+    assert queue.position("a") is None
+    assert queue.position("c") == 2
+
+def test_queue_survives_restart(tmp_path):
+    db_path = str(tmp_path / "queue.sqlite3")
+    now = [1000.0]
+    queue = JobQueue(db_path, lease_seconds=60, clock=lambda: now[0])
+    queue.enqueue("a", {"input": "x"})
+    queue.enqueue("b", {"input": "y"})
+    queue.claim()  # "a" was running when the worker died
+
+    reopened = JobQueue(db_path, lease_seconds=60, clock=lambda: now[0])
+    assert reopened.requeue_running() == 0  # Lease still valid
+    now[0] += 61
+    assert reopened.requeue_running() == 1
+    assert reopened.claim()[0] == "a"
+    assert reopened.claim()[0] == "b"
+
+def test_other_workers_jobs_are_not_requeued_while_heartbeating(tmp_path):
+    db_path = str(tmp_path / "queue.sqlite3")
+    now = [1000.0]
+    api = JobQueue(db_path, lease_seconds=60, clock=lambda: now[0])
+    api.enqueue("a", {})
+    assert api.claim()[0] == "a"
+
+    # Another worker process starts (or restarts) while "a" is running
+    worker = JobQueue(db_path, lease_seconds=60, clock=lambda: now[0])
+    for _ in range(3):
+        now[0] += 40
+        api.heartbeat()
+        assert worker.requeue_running() == 0
+    assert worker.running() == 1 and worker.claim() is None
+
+def test_remove_only_drops_queued_jobs():
+    queue = JobQueue(":memory:")
+    queue.enqueue("a", {})
+    queue.enqueue("b", {})
+    queue.claim()
+
+    assert queue.remove("a") is False  # Already running
+    assert queue.remove("b") is True
+    assert queue.depth() == 0
+
+def test_limiter_caps_concurrency():
+    limiter = ResourceLimiter({"separate": 2})
+    peak = []
+    active = [0]
+    lock = threading.Lock()
+
+    def job():
+        with limiter.slot("separate"):
+            with lock:
+                active[0] += 1
+                peak.append(active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=job) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert max(peak) == 2
+    assert limiter.in_use() == {"separate": 0}
+
+def test_worker_pool_drains_queue():
+    queue = JobQueue(":memory:")
+    done = []
+    finished = threading.Event()
+
+    def handler(task_id, payload):
+        done.append(task_id)
+        if len(done) == 3:
+            finished.set()
+
+    for task_id in ["a", "b", "c"]:
+        queue.enqueue(task_id, {})
+
+    pool = WorkerPool(queue, handler, workers=1)
+    pool.start()
+    assert finished.wait(5)
+    pool.stop(timeout=5)
+
+    assert done == ["a", "b", "c"]
+    assert queue.depth() == 0 and queue.running() == 0
+
+def test_same_video_is_deduplicated_while_active():
+    queue = JobQueue(":memory:")
+    assert queue.enqueue("a", {}, dedupe_key="video:4NRXx6U8ABQ") == "a"
+    assert queue.enqueue("b", {}, dedupe_key="video:4NRXx6U8ABQ") == "a"
+    assert queue.depth() == 1
+
+    queue.claim()
+    queue.complete("a")
+    # Once the first job is done a new request queues normally again
+    assert queue.enqueue("c", {}, dedupe_key="video:4NRXx6U8ABQ") == "c"
+
+def test_deduplicated_requests_share_the_job_until_all_cancel():
+    queue = JobQueue(":memory:")
+    assert queue.enqueue("a", {}, dedupe_key="video:4NRXx6U8ABQ") == "a"
+    assert queue.enqueue("b", {}, dedupe_key="video:4NRXx6U8ABQ") == "a"
+    assert queue.subscribers("a") == ["a", "b"]
+    assert queue.position("b") == 1
+
+    # The first requester leaves: the job carries on for the second
+    assert queue.unsubscribe("a") == ("a", 1)
+    assert queue.subscribers("a") == ["b"]
+    assert queue.unsubscribe("b") == ("a", 0)
+    assert queue.subscribers("a") == []
+
+    # Nobody is waiting on "a" any more, so a new request gets its own job
+    assert queue.enqueue("c", {}, dedupe_key="video:4NRXx6U8ABQ") == "c"
+    assert queue.remove("a") is True
+    assert queue.subscribers("a") is None
+
+def test_finished_job_takes_no_new_subscribers():
+    queue = JobQueue(":memory:")
+    queue.enqueue("a", {}, dedupe_key="video:4NRXx6U8ABQ")
+    queue.enqueue("b", {}, dedupe_key="video:4NRXx6U8ABQ")
+    queue.claim()
+
+    # The final status goes to both; a request arriving after that (before
+    # the worker drops the job) starts a job of its own
+    assert queue.finish("a") == ["a", "b"]
+    assert queue.enqueue("c", {}, dedupe_key="video:4NRXx6U8ABQ") == "c"
+    assert queue.subscribers("a") == ["a", "b"]
@@ -7,15 +7,15 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from core.packager import Packager
 
-def test_packaging():
-    packager = Packager()
+def test_packaging(tmp_path):
+    packager = Packager(streaming=False)
     
     # We will use the existing audio file and some dummy metadata
     track_name = "Ek Raat"
     original_file = "e:/Projects/Spotify_Project/data/downloads/Ek Raat - Vilen.mp3"
     
     # Since we haven't run stems yet, we'll create a dummy stems folder for testing
-    dummy_stems_dir = os.path.join(os.getcwd(), "data", "dummy_stems")
+    dummy_stems_dir = str(tmp_path / "dummy_stems")
     os.makedirs(dummy_stems_dir, exist_ok=True)
     
     # Create a dummy file in it
@@ -40,10 +40,108 @@ def test_packaging():
     
     print(f"\n--- Packager Test Successful ---")
     print(f"ZIP File: {zip_path}")
-    
-    # Cleanup dummy data
-    os.remove(os.path.join(dummy_stems_dir, "vocals.wav"))
-    os.rmdir(dummy_stems_dir)
+
+def _make_job_files(tmp_path):
+    original = tmp_path / "Ek_Raat.opus"
+    original.write_bytes(os.urandom(64 * 1024))
+    stems_dir = tmp_path / "stems"
+    stems_dir.mkdir()
+    for stem in ["vocals", "drums", "bass", "other"]:
+        (stems_dir / f"{stem}.wav").write_bytes(b"RIFF" + bytes(256 * 1024))
+    return str(original), str(stems_dir)
+
+def test_streaming_package_to_local_bucket(tmp_path):
+    """
+    The streaming packager writes the ZIP straight into storage: nothing is
+    left in the export folder and metadata.json comes from memory.
+    """
+    import json
+    import zipfile
+    from core.storage import LocalStorage
+
+    original, stems_dir = _make_job_files(tmp_path)
+    export_dir = tmp_path / "exports"
+    storage = LocalStorage(str(tmp_path / "bucket"))
+    packager = Packager(output_dir=str(export_dir), storage=storage, streaming=True)
+
+    analysis_data = {"bpm": 89.29, "key": "E", "loudness_lufs": -8.13}
+    uri = packager.create_package("Ek Raat", original, stems_dir, analysis_data)
+
+    assert uri is not None
+    assert storage.exists(f"exports/{os.path.basename(uri)}")
+    assert os.listdir(export_dir) == []
+
+    with zipfile.ZipFile(uri) as zipf:
+        assert zipf.testzip() is None
+        names = zipf.namelist()
+        assert "00_Original_Ek_Raat.opus" in names
+        assert sorted(n for n in names if n.startswith("Stems/")) == [
+            "Stems/bass.wav", "Stems/drums.wav", "Stems/other.wav", "Stems/vocals.wav",
+        ]
+        assert json.loads(zipf.read("metadata.json")) == analysis_data
+
+def test_stem_analysis_is_added_to_metadata(tmp_path):
+    import json
+    import zipfile
+    from core.storage import LocalStorage
+
+    original, stems_dir = _make_job_files(tmp_path)
+    storage = LocalStorage(str(tmp_path / "bucket"))
+    packager = Packager(output_dir=str(tmp_path / "exports"), storage=storage, streaming=True)
+
+    analysis_data = {"bpm": 89.29, "key": "E", "loudness_lufs": -8.13}
+    stem_analysis = {"bpm": 89.1, "beats": [0.52, 1.19], "key": "E",
+                     "stems": {"vocals": {"loudness_lufs": -12.4}, "drums": {"loudness_lufs": None}}}
+    uri = packager.create_package("Ek Raat", original, stems_dir, analysis_data, stem_analysis=stem_analysis)
+
+    with zipfile.ZipFile(uri) as zipf:
+        metadata = json.loads(zipf.read("metadata.json"))
+    assert metadata == {**analysis_data, "stem_analysis": stem_analysis}
+    assert "stem_analysis" not in analysis_data  # Caller's dict is untouched
+
+def test_streaming_package_failure_leaves_no_object(tmp_path):
+    from core.storage import LocalStorage
+
+    original, stems_dir = _make_job_files(tmp_path)
+    storage = LocalStorage(str(tmp_path / "bucket"))
+    packager = Packager(output_dir=str(tmp_path / "exports"), storage=storage, streaming=True)
+
+    # Not JSON-serialisable: fails after the audio entries were streamed
+    assert packager.create_package("Ek Raat", original, stems_dir, {"bad": object()}) is None
+    assert not os.path.exists(os.path.join(storage.root, "exports")) or os.listdir(os.path.join(storage.root, "exports")) == []
+
+def test_compression_policy_per_entry():
+    import zipfile
+    from core.packager import compression_for
+
+    # Lossy originals are never deflated
+    assert compression_for("00_Original_song.mp3", "deflate") == (zipfile.ZIP_STORED, None)
+    assert compression_for("00_Original_song.opus", "fast") == (zipfile.ZIP_STORED, None)
+    # WAV stems follow the policy
+    assert compression_for("Stems/vocals.wav", "store") == (zipfile.ZIP_STORED, None)
+    assert compression_for("Stems/vocals.wav", "fast") == (zipfile.ZIP_DEFLATED, 1)
+    assert compression_for("Stems/vocals.wav", "deflate") == (zipfile.ZIP_DEFLATED, 6)
+
+def test_cancelled_package_leaves_no_zip(tmp_path):
+    from core.cancellation import Cancelled, CancellationToken
+    from core.storage import LocalStorage
+
+    original, stems_dir = _make_job_files(tmp_path)
+    export_dir = tmp_path / "exports"
+    storage = LocalStorage(str(tmp_path / "bucket"))
+    token = CancellationToken()
+    token.cancel()
+
+    for streaming in (True, False):
+        packager = Packager(output_dir=str(export_dir), storage=storage, streaming=streaming)
+        with pytest.raises(Cancelled):
+            packager.create_package("Ek Raat", original, stems_dir, {"bpm": 89.29}, token=token)
+
+    assert os.listdir(export_dir) == []
+    bucket_exports = os.path.join(storage.root, "exports")
+    assert not os.path.exists(bucket_exports) or os.listdir(bucket_exports) == []
 
 if __name__ == "__main__":
-    test_packaging()
+    import tempfile
+    from pathlib import Path
+    test_packaging(Path(tempfile.mkdtemp()))
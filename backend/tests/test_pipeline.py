@@ -0,0 +1,98 @@
+import os
+import sys
+import threading
+import time
+import pytest
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.pipeline import Stage, StageExecutor, StageFailed, PipelineCancelled
+
+def test_independent_stages_overlap():
+    """Separation and analysis should run at the same time, not back to back."""
+    both_running = threading.Barrier(2, timeout=5)
+
+    def slow(value):
+        def run(results):
+            both_running.wait()  # Deadlocks (times out) if run sequentially
+            return value
+        return run
+
+    stages = [
+        Stage("decode", lambda r: "audio"),
+        Stage("separate", slow("stems"), requires=("decode",)),
+        Stage("analyze", slow({"bpm": 120.0}), requires=("decode",)),
+        Stage("package", lambda r: f"{r['separate']}+{r['analyze']['bpm']}", requires=("separate", "analyze")),
+    ]
+
+    results = StageExecutor(stages).run()
+
+    assert results["package"] == "stems+120.0"
+
+def test_status_follows_declared_order():
+    statuses = []
+    stages = [
+        Stage("separate", lambda r: time.sleep(0.1) or "stems", status="separating"),
+        Stage("analyze", lambda r: "analysis", status="analyzing"),
+        Stage("package", lambda r: "zip", requires=("separate", "analyze"), status="packaging"),
+    ]
+
+    StageExecutor(stages, on_status=statuses.append).run()
+
+    # Analysis finishing first must not flip the task to "analyzing"
+    assert statuses == ["separating", "packaging"]
+
+def test_failure_waits_for_running_stages():
+    started, finished = threading.Event(), threading.Event()
+
+    def analyze(results):
+        started.set()
+        threading.Event().wait(0.5)
+        finished.set()
+        return {"bpm": 120.0}
+
+    stages = [
+        # Fails once analysis is under way
+        Stage("separate", lambda r: started.wait(5) and None, error="Stem separation failed"),
+        Stage("analyze", analyze),
+    ]
+
+    with pytest.raises(StageFailed):
+        StageExecutor(stages).run()
+    # Nothing is left running behind the failed job
+    assert finished.is_set()
+
+def test_required_stage_failure():
+    stages = [
+        Stage("download", lambda r: None, error="Download failed"),
+        Stage("package", lambda r: "zip", requires=("download",)),
+    ]
+
+    with pytest.raises(StageFailed) as excinfo:
+        StageExecutor(stages).run()
+
+    assert excinfo.value.stage == "download"
+    assert excinfo.value.message == "Download failed"
+
+def test_optional_stage_may_return_none():
+    stages = [
+        Stage("analyze", lambda r: None, required=False),
+        Stage("package", lambda r: r["analyze"] or {"note": "analysis failed"}, requires=("analyze",)),
+    ]
+
+    assert StageExecutor(stages).run()["package"] == {"note": "analysis failed"}
+
+def test_cancellation_checkpoint_stops_later_stages():
+    cancelled = threading.Event()
+    ran = []
+
+    stages = [
+        Stage("download", lambda r: cancelled.set() or "track.mp3"),
+        Stage("separate", lambda r: ran.append("separate") or "stems", requires=("download",)),
+    ]
+
+    with pytest.raises(PipelineCancelled):
+        StageExecutor(stages, is_cancelled=cancelled.is_set).run()
+
+    assert ran == []
@@ -0,0 +1,63 @@
+import os
+import sys
+
+import pytest
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.profiles import parse_separation_profile
+
+def test_named_profiles():
+    standard = parse_separation_profile("standard", default_model="htdemucs")
+    assert standard["name"] == "htdemucs"
+    assert (standard["shifts"], standard["overlap"], standard["two_stems"]) == (1, 0.25, None)
+
+    karaoke = parse_separation_profile("karaoke", default_model="htdemucs")
+    assert karaoke["two_stems"] == "vocals"
+    assert karaoke["name"] == "htdemucs:two_stems=vocals"
+
+    assert parse_separation_profile("best")["model"] == "htdemucs_ft"
+    assert parse_separation_profile("fast")["model"] == "mdx_extra_q"
+
+def test_equivalent_specs_share_a_cache_name():
+    # The canonical name is what job_variant (and so the cache key) uses
+    names = {
+        parse_separation_profile(spec, default_model="htdemucs")["name"]
+        for spec in ["karaoke", "standard:two_stems=vocals", "htdemucs:two_stems=vocals", " KARAOKE "]
+    }
+    assert names == {"htdemucs:two_stems=vocals"}
+    # ...and every canonical name parses back to itself
+    for spec in ["standard", "karaoke", "best", "fast", "standard:segment=7,overlap=0.5"]:
+        name = parse_separation_profile(spec)["name"]
+        assert parse_separation_profile(name)["name"] == name
+
+def test_names_parse_back_with_a_configured_model_outside_the_list():
+    for spec in ["standard", "karaoke", "standard:shifts=2", "htdemucs_6s", "best"]:
+        first = parse_separation_profile(spec, default_model="htdemucs_6s")
+        assert parse_separation_profile(first["name"], default_model="htdemucs_6s") == first
+    assert parse_separation_profile("standard", default_model="htdemucs_6s")["name"] == "htdemucs_6s"
+
+def test_segment_longer_than_the_trained_length_is_rejected():
+    assert parse_separation_profile("standard:segment=7.8", default_model="htdemucs")["segment"] == 7.8
+    with pytest.raises(ValueError):
+        parse_separation_profile("standard:segment=8", default_model="htdemucs")
+    with pytest.raises(ValueError):
+        parse_separation_profile("best:segment=10")
+    # Non-Transformer models have no trained-length limit
+    assert parse_separation_profile("fast:segment=10")["segment"] == 10.0
+
+def test_different_settings_never_collide():
+    names = [
+        parse_separation_profile(spec, default_model="htdemucs")["name"]
+        for spec in ["standard", "karaoke", "best", "fast", "htdemucs_ft", "standard:shifts=2",
+                     "standard:two_stems=drums", "standard:overlap=0.5", "standard:segment=7"]
+    ]
+    assert len(set(names)) == len(names)
+
+def test_bad_profiles_are_rejected():
+    for bad in ["turbo", "standard:model=spleeter", "standard:two_stems=piano",
+                "standard:shifts=-1", "standard:overlap=1.5", "standard:segment=0", "standard:shifts",
+                "standard:colour=blue"]:
+        with pytest.raises(ValueError):
+            parse_separation_profile(bad)
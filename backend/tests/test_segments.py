@@ -0,0 +1,91 @@
+import os
+import sys
+
+import pytest
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+
+from core.segments import crossfade, iter_windows, overlap_add
+
+SR = 8000
+
+def synthetic_stereo(seconds=5.3, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SR)) / SR
+    left = 0.5 * np.sin(2 * np.pi * 220 * t) + 0.1 * rng.standard_normal(len(t))
+    right = 0.5 * np.sin(2 * np.pi * 331 * t) + 0.1 * rng.standard_normal(len(t))
+    return np.stack([left, right]).astype(np.float32)
+
+def as_blocks(signal, size):
+    return (signal[:, i:i + size] for i in range(0, signal.shape[1], size))
+
+def gains_model(window):
+    """Fake two-source 'model' that is linear and pointwise."""
+    return np.stack([0.3 * window, 0.7 * window])
+
+def smoothing_model(window, taps=32):
+    """Fake linear model with a receptive field (moving average), like a real
+    network it gives slightly different output near the edges of its input."""
+    kernel = np.ones(taps, dtype=np.float32) / taps
+    smoothed = np.stack([np.convolve(channel, kernel, mode="same") for channel in window])
+    return np.stack([smoothed, window - smoothed])
+
+def smoothing_model_batch(windows):
+    return np.stack([smoothing_model(window) for window in windows])
+
+def run_segmented(signal, model, segment, overlap, block):
+    chunks = list(overlap_add(as_blocks(signal, block), model, segment, overlap))
+    return np.concatenate(chunks, axis=-1)
+
+def test_crossfades_sum_to_one():
+    fade_out = crossfade(100, 0, 20)[-20:]
+    fade_in = crossfade(100, 20, 0)[:20]
+    assert np.allclose(fade_out + fade_in, 1.0)
+
+@pytest.mark.parametrize("block", [1000, 4096, 50000])
+@pytest.mark.parametrize("seconds", [5.3, 4.0, 0.7])
+def test_pointwise_model_is_reconstructed_exactly(block, seconds):
+    signal = synthetic_stereo(seconds)
+    segmented = run_segmented(signal, gains_model, segment=SR, overlap=SR // 4, block=block)
+    assert segmented.shape == (2, 2, signal.shape[1])
+    assert np.allclose(segmented, gains_model(signal), atol=1e-6)
+
+def test_seams_match_whole_file_separation():
+    signal = synthetic_stereo()
+    whole = smoothing_model(signal)
+    segmented = run_segmented(signal, smoothing_model, segment=SR, overlap=SR // 4, block=3000)
+
+    assert segmented.shape == whole.shape
+    # Edge effects only reach 16 samples into each window, where the
+    # crossfade weight is below 16 / 2000, so the seams are inaudible
+    assert np.abs(segmented - whole).max() < 1e-2
+    # Away from the seams the result is identical
+    assert np.allclose(segmented[..., :SR - SR // 4], whole[..., :SR - SR // 4], atol=1e-6)
+
+def test_model_never_sees_more_than_one_segment():
+    signal = synthetic_stereo()
+    seen = []
+
+    def model(window):
+        seen.append(window.shape[1])
+        return gains_model(window)
+
+    fractions = []
+    list(overlap_add(as_blocks(signal, 30000), model, SR, SR // 8,
+                     progress=fractions.append, total_frames=signal.shape[1]))
+    assert max(seen) == SR
+    assert fractions[-1] == 1.0
+
+def test_batched_windows_match_per_track_windows():
+    batch = np.stack([synthetic_stereo(seed=0), synthetic_stereo(seed=1)])
+    batched = np.concatenate(list(overlap_add([batch], smoothing_model_batch, SR, SR // 4)), axis=-1)
+    for index in range(len(batch)):
+        single = run_segmented(batch[index], smoothing_model, segment=SR, overlap=SR // 4, block=batch.shape[-1])
+        assert np.allclose(batched[index], single, atol=1e-6)
+
+def test_overlap_must_be_shorter_than_segment():
+    with pytest.raises(ValueError):
+        list(iter_windows(iter([np.zeros((1, 10))]), 4, 4))
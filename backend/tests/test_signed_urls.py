@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.storage import SignedURLCache
+
+class FakeBucket:
+    """Counts the round-trips the cache is supposed to save."""
+
+    def __init__(self, names):
+        self.names = set(names)
+        self.exists_calls = 0
+        self.signed = 0
+
+    def exists(self, name):
+        self.exists_calls += 1
+        return name in self.names
+
+    def signed_url(self, name, expiration):
+        self.signed += 1
+        return f"https://signed.example/{name}?sig={self.signed}&ttl={int(expiration.total_seconds())}"
+
+    def delete(self, name):
+        self.names.discard(name)
+
+def test_url_is_reused_until_refresh_margin():
+    now = [0]
+    bucket = FakeBucket(["exports/a.zip"])
+    cache = SignedURLCache(bucket, expiration=900, refresh_margin=120, clock=lambda: now[0])
+
+    first = cache.url("exports/a.zip")
+    assert first.endswith("sig=1&ttl=900")
+    now[0] = 779
+    assert cache.url("exports/a.zip") == first
+    assert bucket.exists_calls == 1 and bucket.signed == 1
+
+    now[0] = 780  # Only 2 minutes of validity left: sign a fresh one
+    assert cache.url("exports/a.zip").endswith("sig=2&ttl=900")
+    assert cache.stats() == {"hits": 1, "misses": 2, "entries": 1}
+
+def test_missing_export_raises_and_is_not_cached():
+    bucket = FakeBucket([])
+    cache = SignedURLCache(bucket)
+    with pytest.raises(FileNotFoundError):
+        cache.url("exports/missing.zip")
+    assert cache.stats()["entries"] == 0
+
+def test_delete_invalidates_url():
+    bucket = FakeBucket(["exports/a.zip"])
+    cache = SignedURLCache(bucket)
+    cache.url("exports/a.zip")
+
+    cache.delete("exports/a.zip")
+    with pytest.raises(FileNotFoundError):
+        cache.url("exports/a.zip")
+
+def test_least_recently_used_url_is_evicted():
+    bucket = FakeBucket(["exports/a.zip", "exports/b.zip", "exports/c.zip"])
+    cache = SignedURLCache(bucket, max_entries=2)
+    cache.url("exports/a.zip")
+    cache.url("exports/b.zip")
+    cache.url("exports/a.zip")  # a is now the most recent
+    cache.url("exports/c.zip")  # evicts b
+
+    signed = bucket.signed
+    cache.url("exports/a.zip")
+    assert bucket.signed == signed
+    cache.url("exports/b.zip")
+    assert bucket.signed == signed + 1
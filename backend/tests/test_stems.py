@@ -34,3 +34,114 @@ def test_separate_stems(separator):
         print(f"File: {stem:<12} | Size: {size_mb:>6.2f} MB")
 
     print(f"\n[SUCCESS] All 4 stems verified in: {stems_path}")
+
+def test_parse_stem_format():
+    from core.formats import parse_stem_format
+
+    assert parse_stem_format("flac")["ext"] == "flac"
+    assert parse_stem_format("wav24")["subtype"] == "PCM_24"
+    # Lossy formats are canonicalised with their bitrate
+    assert parse_stem_format("mp3")["name"] == "mp3:320"
+    assert parse_stem_format("OPUS:128")["name"] == "opus:128"
+
+    for bad in ["aiff", "opus:9999", "flac:320"]:
+        with pytest.raises(ValueError):
+            parse_stem_format(bad)
+
+def test_cli_engine_keeps_formats_in_separate_folders(tmp_path, monkeypatch):
+    import core.stems
+    from core.formats import parse_stem_format
+    from core.profiles import parse_separation_profile
+
+    commands = []
+
+    class FakeDemucs:
+        """Records the command and writes the folder its --filename asks for."""
+        def __init__(self, command, **kwargs):
+            commands.append(command)
+            template = command[command.index("--filename") + 1] if "--filename" in command else "{track}/{stem}.{ext}"
+            folder = template.split("/")[0].format(track="song")
+            os.makedirs(tmp_path / "stems" / "htdemucs" / folder, exist_ok=True)
+
+        def wait(self):
+            return 0
+
+    monkeypatch.setattr(core.stems.subprocess, "Popen", FakeDemucs)
+    separator = StemSeparator(output_dir=str(tmp_path / "stems"), engine="cli")
+    profile = parse_separation_profile("standard", default_model="htdemucs")
+
+    wav = separator._separate_cli(["/in/song.opus"], "cpu", parse_stem_format("wav"), profile)[0]
+    flac = separator._separate_cli(["/in/song.opus"], "cpu", parse_stem_format("flac"), profile)[0]
+
+    assert "--filename" not in commands[0]
+    assert commands[1][commands[1].index("--filename") + 1] == "{track}__flac/{stem}.{ext}"
+    assert wav != flac
+    assert flac == separator._stems_path("/in/song.opus", parse_stem_format("flac"), profile)
+
+def test_window_seams_match_a_single_full_pass(monkeypatch):
+    np = pytest.importorskip("numpy")
+    torch = pytest.importorskip("torch")
+    import core.stems
+
+    class FakeModel:
+        samplerate = 100
+
+    calls = []
+
+    def run_model(model, mix, device, profile):
+        # Deterministic and pointwise, so windowing must not change a sample
+        calls.append(mix.shape[-1])
+        return torch.stack([torch.tanh(mix), mix - torch.tanh(mix)], dim=1)
+
+    monkeypatch.setattr(core.stems, "_run_model", run_model)
+    mix = torch.from_numpy(np.random.default_rng(0).standard_normal((1, 2, 1000)).astype(np.float32))
+
+    windowed = StemSeparator(mode="auto", segment_seconds=1, overlap_seconds=0.2)._infer(
+        FakeModel(), mix, "cpu", {}, lambda: None)
+    assert len(calls) > 1
+    calls.clear()
+    full = StemSeparator(mode="full", segment_seconds=1, overlap_seconds=0.2)._infer(
+        FakeModel(), mix, "cpu", {}, lambda: None)
+    assert calls == [1000]  # "full" is one pass over the whole track
+
+    # The first seam: window two starts at frame 80 and is crossfaded over 80-100
+    assert torch.allclose(windowed[..., 70:110], full[..., 70:110], atol=1e-6)
+    assert torch.allclose(windowed, full, atol=1e-6)
+
+def test_failed_stem_write_leaves_no_partial_files(tmp_path, monkeypatch):
+    torch = pytest.importorskip("torch")
+    import core.stems
+    from core.cancellation import CancellationToken, Cancelled
+    from core.formats import parse_stem_format
+
+    class FlakyWriter:
+        """Creates its file like a real writer; the "bass" one fails mid-write."""
+        def __init__(self, path, fmt, samplerate, channels):
+            self.path = path
+            open(path, "wb").close()
+
+        def write(self, block):
+            if os.path.basename(self.path).startswith("bass"):
+                raise OSError("disk full")
+
+        def close(self):
+            pass
+
+        def abort(self):
+            pass
+
+    monkeypatch.setattr(core.stems, "open_stem_writer", FlakyWriter)
+    stems = [torch.zeros(2, 10)] * 4
+    names = ["drums", "bass", "other", "vocals"]
+    fmt = parse_stem_format("wav")
+
+    with pytest.raises(OSError):
+        StemSeparator._write_stems(names, stems, 100, str(tmp_path), fmt, lambda: None, lambda fraction: None)
+    assert os.listdir(tmp_path) == []
+
+    # Cancelled after the first stem was written
+    token = CancellationToken()
+    with pytest.raises(Cancelled):
+        StemSeparator._write_stems(["drums", "other"], stems[:2], 100, str(tmp_path), fmt,
+                                   token.raise_if_cancelled, lambda fraction: token.cancel())
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,74 @@
+import os
+import sys
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.storage import LocalStorage, GCSStorage
+
+def test_local_storage_lists_by_prefix(tmp_path):
+    source = tmp_path / "song.opus"
+    source.write_bytes(b"audio")
+    storage = LocalStorage(str(tmp_path / "bucket"))
+    storage.upload_file(str(source), "downloads/b.opus")
+    storage.upload_file(str(source), "downloads/a.opus")
+    storage.upload_file(str(source), "exports/a.zip")
+
+    upload = storage.open_write("downloads/c.opus")  # Not committed yet
+    upload.write(b"partial")
+
+    assert storage.list("downloads/") == ["downloads/a.opus", "downloads/b.opus"]
+    assert len(storage.list()) == 3
+    upload.abort()
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket, self.name, self.content_type = bucket, name, None
+
+    def open(self, mode, chunk_size=None, content_type=None):
+        blob = self
+        class Writer:
+            def __init__(self):
+                self.chunks = []
+            def write(self, data):
+                self.chunks.append(data)
+            def close(self):
+                # Like BlobWriter: closing always finalises the object
+                blob.bucket.objects[blob.name] = b"".join(self.chunks)
+        return Writer()
+
+    def compose(self, sources):
+        self.bucket.objects[self.name] = b"".join(self.bucket.objects[s.name] for s in sources)
+
+    def delete(self):
+        del self.bucket.objects[self.name]
+
+class FakeBucket:
+    def __init__(self):
+        self.objects = {}
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+class FakeClient:
+    def __init__(self):
+        self.fake_bucket = FakeBucket()
+
+    def bucket(self, name):
+        return self.fake_bucket
+
+def test_gcs_upload_only_appears_under_its_name_on_commit():
+    client = FakeClient()
+    storage = GCSStorage(client=client)
+
+    aborted = storage.open_write("exports/a.zip", content_type="application/zip")
+    aborted.write(b"partial")
+    aborted.abort()
+    assert client.fake_bucket.objects == {}
+
+    upload = storage.open_write("exports/a.zip", content_type="application/zip")
+    upload.write(b"whole ")
+    upload.write(b"zip")
+    assert "exports/a.zip" not in client.fake_bucket.objects
+    upload.commit()
+    assert client.fake_bucket.objects == {"exports/a.zip": b"whole zip"}
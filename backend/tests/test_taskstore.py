@@ -0,0 +1,58 @@
+import asyncio
+import os
+import sys
+import threading
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.taskstore import MemoryTaskStore, AsyncTaskStore
+
+def test_memory_store_roundtrip():
+    store = MemoryTaskStore()
+    store.create("a", {"status": "queued", "result_file": None})
+    store.update("a", {"status": "completed", "result_file": "x.zip"})
+
+    assert store.get("a") == {"status": "completed", "result_file": "x.zip"}
+    assert store.get("missing") is None
+
+    store.delete("a")
+    assert store.get("a") is None
+
+def test_memory_store_returns_copies():
+    store = MemoryTaskStore()
+    store.create("a", {"status": "queued"})
+    store.get("a")["status"] = "mutated"
+    assert store.get("a")["status"] == "queued"
+
+class BlockingTaskStore(MemoryTaskStore):
+    """Holds every get() until the test releases it, counting the callers."""
+
+    def __init__(self):
+        super().__init__()
+        self.waiting = 0
+        self.release = threading.Event()
+        self._count_lock = threading.Lock()
+
+    def get(self, task_id):
+        with self._count_lock:
+            self.waiting += 1
+        assert self.release.wait(5), "store call was never released"
+        return super().get(task_id)
+
+def test_slow_store_does_not_block_the_event_loop():
+    store = BlockingTaskStore()
+    tasks = AsyncTaskStore(store)
+
+    async def main():
+        await tasks.create("a", {"status": "queued"})
+        calls = asyncio.gather(*[tasks.get("a") for _ in range(8)])
+        # The loop keeps running while all 8 calls are blocked at once; if the
+        # store ran on the loop (or one call at a time) this never completes
+        while store.waiting < 8:
+            await asyncio.sleep(0.01)
+        store.release.set()
+        return await calls
+
+    results = asyncio.run(asyncio.wait_for(main(), timeout=5))
+    assert all(r == {"status": "queued"} for r in results)
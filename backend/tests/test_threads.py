@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.threads import ThreadBudget, THREAD_ENV_VARS
+
+def test_budget_splits_cpus_between_workers():
+    budget = ThreadBudget(workers=4, threads=0, cpus=range(8))
+    assert budget.threads == 2
+    # Never less than one thread, even with more workers than CPUs
+    assert ThreadBudget(workers=4, threads=0, cpus=[0]).threads == 1
+    # An explicit count wins
+    assert ThreadBudget(workers=4, threads=3, cpus=range(8)).threads == 3
+
+def test_concurrent_allotments_get_disjoint_cpus():
+    budget = ThreadBudget(workers=2, threads=0, pin=True, cpus=range(4))
+    with budget.allot() as first, budget.allot() as second:
+        assert first.threads == second.threads == 2
+        assert set(first.cpus).isdisjoint(second.cpus)
+        # A third job shares a slice rather than waiting
+        with budget.allot() as third:
+            assert third.cpus in (first.cpus, second.cpus)
+    # Released slices are handed out again
+    with budget.allot() as again:
+        assert again.cpus == first.cpus
+
+def test_allotment_env_caps_native_pools():
+    budget = ThreadBudget(workers=2, threads=0, pin=False, cpus=range(4))
+    with budget.allot() as allotment:
+        env = allotment.env({"PATH": "/bin"})
+        assert allotment.cpus is None
+        allotment.pin(os.getpid())  # No-op without pinning
+    assert env["PATH"] == "/bin"
+    assert all(env[name] == "2" for name in THREAD_ENV_VARS)
+
+@pytest.mark.skipif(not hasattr(os, "sched_setaffinity"), reason="needs sched_setaffinity")
+def test_pinned_subprocess_runs_on_its_slice():
+    cpus = sorted(os.sched_getaffinity(0))
+    budget = ThreadBudget(workers=len(cpus), threads=0, pin=True, cpus=cpus)
+    with budget.allot() as allotment:
+        # The child reports its mask once the parent has pinned it
+        process = subprocess.Popen(
+            [sys.executable, "-c",
+             "import os, sys; sys.stdin.readline(); "
+             "print(sorted(os.sched_getaffinity(0)), os.environ['OMP_NUM_THREADS'], sep='|')"],
+            env=allotment.env(), stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+        )
+        allotment.pin(process.pid)
+        output = process.communicate("go\n")[0].strip()
+    assert output == f"{sorted(allotment.cpus)}|1"
+
+def test_batch_allotment_takes_one_share_per_track():
+    budget = ThreadBudget(workers=4, threads=0, pin=True, cpus=range(8))
+    with budget.allot(jobs=3) as batch:
+        assert batch.threads == 6
+        assert len(batch.cpus) == 6
+        with budget.allot() as single:
+            # The one slice nobody holds
+            assert single.threads == 2 and set(single.cpus).isdisjoint(batch.cpus)
+    # Never more than the whole machine
+    with budget.allot(jobs=10) as everything:
+        assert everything.threads == 8 and everything.cpus == list(range(8))
@@ -0,0 +1,97 @@
+import os
+import sys
+
+import pytest
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.storage import LocalStorage
+from core.transfer import TransferManager, PARTS_PREFIX
+
+class FlakyStorage:
+    """LocalStorage that fails chosen slice transfers and counts the rest."""
+
+    def __init__(self, root, fail_offsets=()):
+        self.inner = LocalStorage(root)
+        self.fail_offsets = set(fail_offsets)
+        self.ranges = []
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def upload_range(self, local_path, offset, length, name):
+        if offset in self.fail_offsets:
+            raise ConnectionError("connection reset")
+        self.ranges.append(offset)
+        self.inner.upload_range(local_path, offset, length, name)
+
+    def download_range(self, name, start, length, local_path):
+        if start in self.fail_offsets:
+            raise ConnectionError("connection reset")
+        self.ranges.append(start)
+        self.inner.download_range(name, start, length, local_path)
+
+def make_file(path, size):
+    data = os.urandom(size)
+    path.write_bytes(data)
+    return data
+
+def test_sliced_upload_composes_object_and_skips_identical_reupload(tmp_path):
+    data = make_file(tmp_path / "song.zip", 10_000)
+    storage = LocalStorage(str(tmp_path / "bucket"))
+    transfers = TransferManager(storage, slice_size=1024, workers=4)
+
+    assert transfers.upload(str(tmp_path / "song.zip"), "exports/song.zip") == "uploaded"
+    with open(storage.uri("exports/song.zip"), "rb") as f:
+        assert f.read() == data
+    # Parts are cleaned up once composed
+    assert storage.list(PARTS_PREFIX) == []
+
+    assert transfers.upload(str(tmp_path / "song.zip"), "exports/song.zip") == "skipped"
+    # Different bytes under the same name are uploaded again
+    changed = make_file(tmp_path / "song.zip", 10_000)
+    assert transfers.upload(str(tmp_path / "song.zip"), "exports/song.zip") == "uploaded"
+    with open(storage.uri("exports/song.zip"), "rb") as f:
+        assert f.read() == changed
+
+def test_failed_upload_resumes_from_stored_parts(tmp_path):
+    make_file(tmp_path / "song.zip", 8192)
+    storage = FlakyStorage(str(tmp_path / "bucket"), fail_offsets={4096})
+    transfers = TransferManager(storage, slice_size=1024, workers=2, attempts=2, retry_delay=0)
+
+    with pytest.raises(ConnectionError):
+        transfers.upload(str(tmp_path / "song.zip"), "exports/song.zip")
+    assert not storage.exists("exports/song.zip")
+    assert sorted(storage.ranges) == [0, 1024, 2048, 3072, 5120, 6144, 7168]
+
+    # The connection recovers: only the missing slice is sent
+    storage.fail_offsets.clear()
+    storage.ranges.clear()
+    assert transfers.upload(str(tmp_path / "song.zip"), "exports/song.zip") == "uploaded"
+    assert storage.ranges == [4096]
+    assert storage.list(PARTS_PREFIX) == []
+
+def test_failed_download_resumes_from_finished_slices(tmp_path):
+    data = make_file(tmp_path / "song.opus", 8192)
+    storage = FlakyStorage(str(tmp_path / "bucket"), fail_offsets={2048})
+    storage.inner.upload_file(str(tmp_path / "song.opus"), "downloads/song.opus")
+    transfers = TransferManager(storage, slice_size=1024, workers=2, attempts=1)
+    target = tmp_path / "recovered" / "song.opus"
+
+    with pytest.raises(ConnectionError):
+        transfers.download("downloads/song.opus", str(target))
+    assert not target.exists()
+    assert os.path.exists(f"{target}.partial.json")
+
+    storage.fail_offsets.clear()
+    storage.ranges.clear()
+    assert transfers.download("downloads/song.opus", str(target)) == str(target)
+    assert storage.ranges == [2048]
+    assert target.read_bytes() == data
+    assert not os.path.exists(f"{target}.partial") and not os.path.exists(f"{target}.partial.json")
+
+def test_download_of_missing_object_raises(tmp_path):
+    transfers = TransferManager(LocalStorage(str(tmp_path / "bucket")))
+    with pytest.raises(FileNotFoundError):
+        transfers.download("downloads/missing.opus", str(tmp_path / "missing.opus"))
@@ -0,0 +1,100 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+@pytest.fixture
+def workflow(tmp_path, monkeypatch):
+    """The job workflow on a local bucket and in-memory stores."""
+    for module in ("numpy", "soundfile", "torch", "librosa", "pyloudnorm", "yt_dlp"):
+        pytest.importorskip(module)
+    import core.cache
+    import core.jobqueue
+    import core.taskstore
+    from core.cache import ResultCache, MemoryCacheBackend
+    from core.jobqueue import JobQueue
+    from core.storage import LocalStorage
+    from core.taskstore import MemoryTaskStore
+
+    # Importing workflow builds its stores; keep them off Firestore
+    monkeypatch.setattr(core.taskstore, "make_task_store", lambda *args, **kwargs: MemoryTaskStore())
+    monkeypatch.setattr(core.cache, "make_backend", lambda *args, **kwargs: MemoryCacheBackend())
+    monkeypatch.setattr("core.analyzer.ANALYSIS_CACHE_BACKEND", "none")
+    module = importlib.import_module("workflow")
+
+    storage = LocalStorage(str(tmp_path / "bucket"))
+    monkeypatch.setattr(module, "task_store", MemoryTaskStore())
+    monkeypatch.setattr(module, "result_cache", ResultCache(MemoryCacheBackend()))
+    monkeypatch.setattr(module, "get_storage", lambda *args: storage)
+    monkeypatch.setattr(core.jobqueue, "_QUEUE", JobQueue(":memory:"))
+    return module, storage
+
+def test_long_track_job_never_decodes_the_whole_track(workflow, tmp_path, monkeypatch):
+    import numpy as np
+    import soundfile as sf
+    import torch
+    import core.stems
+    from core.analyzer import AudioAnalyzer
+    from core.audio import AudioStream, DecodedAudio
+    from core.stems import StemSeparator
+    workflow, storage = workflow
+
+    sr = 44100
+    t = np.arange(3 * sr) / sr
+    signal = (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+    track = tmp_path / "Long_Track.wav"
+    sf.write(str(track), np.stack([signal, signal], axis=1), sr)
+
+    class FakeDownloader:
+        def __init__(self, storage=None):
+            self.last_info = {"video_id": None}
+
+        def download(self, query, resolved=None, token=None):
+            return str(track)
+
+    class FakeModel:
+        samplerate = sr
+        audio_channels = 2
+        sources = ["drums", "bass", "other", "vocals"]
+
+    def no_decoding(*args, **kwargs):
+        raise AssertionError("the whole track was decoded")
+
+    seen = {}
+    real_separate, real_analyze = StemSeparator.separate, AudioAnalyzer.analyze
+
+    def separate(self, audio, **kwargs):
+        seen["separate"] = audio
+        return real_separate(self, audio, **kwargs)
+
+    def analyze(self, audio, **kwargs):
+        seen["analyze"] = audio
+        seen["analysis"] = real_analyze(self, audio, **kwargs)
+        return seen["analysis"]
+
+    # Anything over a second counts as long here
+    monkeypatch.setattr(workflow, "DECODE_STREAM_MIN_SECONDS", 1)
+    monkeypatch.setattr(workflow, "AudioDownloader", FakeDownloader)
+    monkeypatch.setattr(DecodedAudio, "load", no_decoding)
+    monkeypatch.setattr(StemSeparator, "separate", separate)
+    monkeypatch.setattr(AudioAnalyzer, "analyze", analyze)
+    monkeypatch.setattr(core.stems, "get_model", lambda name, device: FakeModel())
+    monkeypatch.setattr(core.stems, "_run_model",
+                        lambda model, mix, device, profile: torch.stack([mix * 0.25] * 4, dim=1))
+    monkeypatch.setattr(workflow, "StemSeparator", lambda storage=None: StemSeparator(
+        output_dir=str(tmp_path / "stems"), engine="inprocess", storage=storage))
+
+    workflow.task_store.create("job", {"task_id": "job", "status": "queued"})
+    workflow.process_job("job", {"input": str(track), "resolved": {"video_id": None}})
+
+    task = workflow.task_store.get("job")
+    assert task["status"] == "completed", task
+    assert storage.exists(f"exports/{task['result_file']}")
+    # Separation and analysis both streamed the file
+    assert isinstance(seen["separate"], AudioStream)
+    assert isinstance(seen["analyze"], AudioStream)
+    assert seen["analysis"] is not None
@@ -0,0 +1,47 @@
+"""
+Standalone job worker: runs queued jobs in a process separate from the API.
+
+Start the API with EMBEDDED_WORKER=0 and run `python worker.py` next to it;
+both share the SQLite queue at QUEUE_DB_PATH.
+"""
+import time
+
+# 🧵 Size the native thread pools for JOB_WORKERS concurrent jobs before
+# numpy/torch create them
+from core.threads import get_thread_budget
+get_thread_budget().apply_process_defaults()
+
+from core.jobqueue import get_job_queue
+from core.scheduler import WorkerPool
+from core.stems import StemSeparator
+from config import DEMUCS_PRELOAD, JOB_WORKERS
+from workflow import process_job
+
+def main():
+    print("\n" + "="*50)
+    print("      👷 STEMSENSE WORKER 👷")
+    print("="*50 + "\n")
+    print(f"🧵 Thread budget: {get_thread_budget().describe()}")
+
+    # 🔥 Warm the Demucs model before taking the first job
+    if DEMUCS_PRELOAD:
+        StemSeparator().preload()
+
+    # The API can't signal this process directly, so running jobs watch the
+    # task store for cancellation
+    pool = WorkerPool(
+        get_job_queue(),
+        lambda task_id, payload: process_job(task_id, payload, poll_cancellation=True),
+        workers=JOB_WORKERS,
+    )
+    pool.start()
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\nStopping worker pool...")
+        pool.stop(timeout=5)
+
+if __name__ == "__main__":
+    main()
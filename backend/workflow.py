@@ -0,0 +1,268 @@
+"""
+The job workflow shared by the API's embedded workers and `worker.py`.
+"""
+import os
+
+from core.downloader import AudioDownloader
+from core.stems import StemSeparator
+from core.analyzer import AudioAnalyzer
+from core.packager import Packager
+from core.audio import DecodedAudio, AudioStream
+from core.pipeline import Stage, StageExecutor, StageFailed
+from core.cancellation import Cancelled, get_cancellations
+from core.batching import get_separation_batcher
+from core.scheduler import get_limiter
+from core.cache import ResultCache, fingerprint_file, extract_video_id
+from core.storage import get_storage, forget_signed_url
+from core.events import get_event_bus, TERMINAL_STATUSES
+from core.jobqueue import get_job_queue
+from core.taskstore import make_task_store
+from core.formats import parse_stem_format
+from core.profiles import parse_separation_profile
+from config import (
+    DECODE_TO_MEMMAP, DECODE_DIR, DECODE_STREAM_MIN_SECONDS, STEM_FORMAT, ANALYZE_STEMS, CANCEL_POLL_SECONDS, EMBEDDED_WORKER,
+    SEPARATION_BATCH_SIZE, SEPARATION_PROFILE,
+)
+
+# Persistent storage for task statuses (Firestore in production)
+task_store = make_task_store()
+
+# 🔍 Content-addressed cache of finished exports/ ZIPs
+result_cache = ResultCache()
+
+class CacheHit(Exception):
+    """Raised by a stage when the job's result already exists."""
+    def __init__(self, result_file):
+        super().__init__(result_file)
+        self.result_file = result_file
+
+# Helper to make sure a cached result was not deleted from storage
+def export_exists(result_file: str) -> bool:
+    try:
+        if get_storage().exists(f"exports/{result_file}"):
+            return True
+        forget_signed_url(f"exports/{result_file}")
+        return False
+    except Exception as e:
+        print(f"⚠️ Could not verify cached export {result_file}: {e}")
+        return False
+
+# Helper to decode a job's download once for every stage; long tracks (or
+# ones whose length can't be probed) are streamed from the file instead
+def decode_audio(path: str):
+    stream = AudioStream(path)
+    if stream.duration is None or stream.duration > DECODE_STREAM_MIN_SECONDS:
+        print(f"🌊 Streaming {os.path.basename(path)} instead of decoding it up front")
+        return stream
+    return DecodedAudio.load(path, memmap_dir=DECODE_DIR if DECODE_TO_MEMMAP else None)
+
+# Job options that change what ends up in the ZIP, with their defaults
+DEFAULT_OPTIONS = {
+    "original_format": "source",
+    "stem_format": parse_stem_format(STEM_FORMAT)["name"],
+    "separation_profile": parse_separation_profile(SEPARATION_PROFILE)["name"],
+}
+# Always part of the cache/dedupe key, even at their defaults: the defaults
+# come from deployment settings (STEM_FORMAT, SEPARATION_PROFILE, DEMUCS_MODEL),
+# so results made under an earlier setting must never be served for them
+ALWAYS_KEYED = ("separation_profile", "stem_format")
+
+def job_variant(options: dict = None):
+    """
+    Cache/dedupe suffix for a job's options: the separation profile (whose
+    canonical name includes the model) and stem format, plus any other
+    option that differs from its default, e.g.
+    {"original_format": "mp3"} -> "original_format=mp3,separation_profile=htdemucs,stem_format=wav".
+    """
+    options = {**DEFAULT_OPTIONS, **{k: v for k, v in (options or {}).items() if v is not None}}
+    parts = [
+        f"{name}={options[name]}"
+        for name in sorted(DEFAULT_OPTIONS)
+        if name in ALWAYS_KEYED or options[name] != DEFAULT_OPTIONS[name]
+    ]
+    return ",".join(parts)
+
+# Helper to find the requests a job reports to: every one deduplicated into
+# it that has not cancelled (just the job's own task outside the queue). A
+# job sending its final status takes no new subscribers, so none miss it.
+def job_subscribers(task_id: str, final: bool = False):
+    queue = get_job_queue()
+    subscribers = queue.finish(task_id) if final else queue.subscribers(task_id)
+    return [task_id] if subscribers is None else subscribers
+
+# Helper to persist a status change and push it to live listeners (SSE)
+def update_task(task_id: str, fields: dict):
+    for subscriber in job_subscribers(task_id, final=fields.get("status") in TERMINAL_STATUSES):
+        task_store.update(subscriber, fields)
+        get_event_bus().publish(subscriber, {"task_id": subscriber, **fields})
+
+# Helper to push fine-grained progress; not persisted, so no Firestore writes
+def publish_progress(task_id: str, status: str, fraction: float):
+    for subscriber in job_subscribers(task_id):
+        get_event_bus().publish(subscriber, {
+            "task_id": subscriber,
+            "status": status,
+            "progress": round(min(max(fraction, 0.0), 1.0), 3),
+        })
+
+# Helper to check if task was cancelled: a shared job keeps running until
+# every request waiting on it has cancelled
+def is_cancelled(task_id: str) -> bool:
+    subscribers = get_job_queue().subscribers(task_id)
+    if subscribers is not None:
+        cancelled = not subscribers
+    else:
+        task = task_store.get(task_id)
+        cancelled = bool(task and task.get("status") == "cancelled")
+    if cancelled:
+        print(f"🛑 Task {task_id} was cancelled by user. Stopping.")
+    return cancelled
+
+# Helper function to run the heavy processing in the background
+def run_full_workflow(task_id: str, query: str, resolved: dict = None, options: dict = None,
+                      poll_cancellation: bool = not EMBEDDED_WORKER):
+    # 🛑 CHECKPOINT 1: Start
+    if is_cancelled(task_id): return
+
+    # 🛑 Delivered to the running stages by POST /cancel (same process), or
+    # by polling the task store when this worker runs apart from the API
+    cancellations = get_cancellations()
+    token = cancellations.open(task_id)
+    if poll_cancellation:
+        cancellations.watch(task_id, lambda: is_cancelled(task_id), CANCEL_POLL_SECONDS)
+    try:
+        _run_stages(task_id, query, resolved, options, token)
+    finally:
+        cancellations.close(task_id)
+
+def _run_stages(task_id, query, resolved, options, token):
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    variant = job_variant(options)
+
+    storage = get_storage()
+    downloader = AudioDownloader(storage=storage)
+    separator = StemSeparator(storage=storage)
+    # 📦 With batching, concurrent jobs share one model pass / demucs run; the
+    # batcher runs one batch at a time, so it takes the "separate" slot's place
+    batching = SEPARATION_BATCH_SIZE > 1
+    separate_track = get_separation_batcher(storage).separate if batching else separator.separate
+    analyzer = AudioAnalyzer()
+    packager = Packager(storage=storage)
+
+    def download(results):
+        # 🔍 Another job may have finished this input/video since we were queued
+        video_id = resolved["video_id"] if resolved else extract_video_id(query)
+        cached = result_cache.lookup(
+            [result_cache.input_key(query), result_cache.video_key(video_id)],
+            exists=export_exists,
+            variant=variant,
+        )
+        if cached:
+            raise CacheHit(cached)
+        return downloader.download(query, resolved=resolved, token=token)
+
+    def fingerprint(results):
+        # 🔍 Different searches can land on the same audio: key on its content
+        content_hash = fingerprint_file(results["download"])
+        video_id = (downloader.last_info or {}).get("video_id")
+        cached = result_cache.lookup(
+            [result_cache.audio_key(content_hash), result_cache.video_key(video_id)],
+            exists=export_exists,
+            variant=variant,
+        )
+        if cached:
+            raise CacheHit(cached)
+        return content_hash
+
+    # The job as a DAG: analysis only needs the decoded original, so it runs
+    # while Demucs is separating and the job takes max(separate, analyze).
+    stages = [
+        Stage("download", download,
+              status="downloading", error="Download failed", resource="download"),
+        Stage("fingerprint", fingerprint, requires=("download",)),
+        # Decode once; every stage below shares this buffer (or stream)
+        Stage("decode", lambda r: decode_audio(r["download"]),
+              requires=("fingerprint",), error="Decoding failed"),
+        Stage("separate", lambda r: separate_track(
+                  r["decode"], output_format=options["stem_format"],
+                  progress=lambda fraction: publish_progress(task_id, "separating", fraction),
+                  token=token, profile=options["separation_profile"]),
+              requires=("decode",), status="separating", error="Stem separation failed",
+              resource=None if batching else "separate"),
+        Stage("analyze", lambda r: analyzer.analyze(r["decode"], content_hash=r["fingerprint"]),
+              requires=("decode", "fingerprint"), status="analyzing", required=False, resource="analyze"),
+        # Beat grid, key and per-stem loudness from the freshly written stems
+        Stage("analyze_stems", lambda r: analyzer.analyze_stems(r["separate"]) if ANALYZE_STEMS else None,
+              requires=("separate",), status="analyzing", required=False, resource="analyze"),
+        Stage("package", lambda r: packager.create_package(
+                  track_name=os.path.splitext(os.path.basename(r["download"]))[0],
+                  original_file=r["download"],
+                  stems_dir=r["separate"],
+                  analysis_data=r["analyze"] or {"note": "analysis failed"},
+                  original_format=options["original_format"],
+                  stem_analysis=r["analyze_stems"],
+                  token=token),
+              requires=("separate", "analyze", "analyze_stems"), status="packaging", error="Packaging failed",
+              resource="package"),
+    ]
+    executor = StageExecutor(
+        stages,
+        # 🛑 CHECKPOINTS: before each stage starts, after each one finishes
+        # and whenever the token fires (no task store read per check)
+        token=token,
+        # Never overwrite "cancelled" with the status of a stage still winding down
+        on_status=lambda status: None if token.cancelled else update_task(task_id, {"status": status}),
+        limiter=get_limiter(),
+    )
+
+    try:
+        results = executor.run()
+        result_file = os.path.basename(results["package"])
+
+        update_task(task_id, {
+            "status": "completed",
+            "result_file": result_file
+        })
+
+        result_cache.store(result_file, [
+            result_cache.input_key(query),
+            result_cache.video_key((downloader.last_info or {}).get("video_id")),
+            result_cache.audio_key(results["fingerprint"]),
+        ], variant=variant)
+
+    except CacheHit as hit:
+        print(f"🚀 CACHE HIT for: {query} -> {hit.result_file}")
+        update_task(task_id, {
+            "status": "completed",
+            "result_file": hit.result_file,
+            "is_cached": True
+        })
+
+    except Cancelled:
+        # Every stage has returned (those that honour the token stop early),
+        # so the worker's capacity is really free for the next job
+        return
+
+    except StageFailed as e:
+        update_task(task_id, {
+            "status": "failed",
+            "error": e.message
+        })
+
+    except Exception as e:
+        # One last check to see if we failed BECAUSE of a purposeful cancel
+        if token.cancelled: return
+        
+        update_task(task_id, {
+            "status": "failed",
+            "error": str(e)
+        })
+    finally:
+        audio = executor.results.get("decode")
+        if audio is not None:
+            audio.close()
+
+# Entry point used by WorkerPool for every job taken off the queue
+def process_job(task_id: str, payload: dict, poll_cancellation: bool = not EMBEDDED_WORKER):
+    run_full_workflow(task_id, payload["input"], payload.get("resolved"), payload.get("options"),
+                      poll_cancellation=poll_cancellation)
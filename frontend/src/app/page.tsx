@@ -16,7 +16,7 @@ import {
   Waves,
   XOctagon
 } from 'lucide-react';
-import { submitTask, getTaskStatus, getDownloadUrl, cancelTask } from '@/lib/api';
+import { submitTask, getTaskStatus, subscribeToTask, getDownloadUrl, cancelTask } from '@/lib/api';
 
 const STEPS = [
   { id: 'downloading', label: 'Downloading', icon: Download },
@@ -32,6 +32,8 @@ export default function Home() {
   const [resultFile, setResultFile] = useState<string | null>(null);
   const [error, setError] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState(false);
+  const [progress, setProgress] = useState<number | null>(null);
+  const [useSSE, setUseSSE] = useState(true);
 
   // 📥 Load session from Local Storage on mount
   useEffect(() => {
@@ -39,7 +41,7 @@ export default function Home() {
     if (savedTaskId) {
       console.log('🔄 Restoring session for task:', savedTaskId);
       setTaskId(savedTaskId);
-      setStatus('queued'); // Optimistic status, polling will correct it
+      setStatus('queued'); // Optimistic status, live updates will correct it
     }
   }, []);
 
@@ -50,30 +52,41 @@ export default function Home() {
     }
   }, [taskId]);
 
-  // Polling logic
+  const isFinished = status === 'completed' || status === 'failed' || status === 'cancelled';
+
+  const handleUpdate = (data: any) => {
+    console.log('Task Status Update:', data);
+    setStatus(data.status);
+    setProgress(typeof data.progress === 'number' ? data.progress : null);
+
+    if (data.status === 'completed') {
+      setResultFile(data.result_file);
+      localStorage.removeItem('stemsense_current_task'); // 🧹 Clear session
+    } else if (data.status === 'failed') {
+      setError(data.error || 'Processing failed');
+      localStorage.removeItem('stemsense_current_task'); // 🧹 Clear session
+    } else if (data.status === 'cancelled') {
+      setError('Task was cancelled by user');
+      localStorage.removeItem('stemsense_current_task'); // 🧹 Clear session
+    }
+  };
+
+  // 📡 Live updates: server pushes every change over SSE
+  useEffect(() => {
+    if (!taskId || isFinished || !useSSE) return;
+    // Stream dropped or unsupported (old proxy, 404): fall back to polling
+    return subscribeToTask(taskId, handleUpdate, () => setUseSSE(false));
+  }, [taskId, isFinished, useSSE]);
+
+  // Polling fallback
   useEffect(() => {
     let interval: NodeJS.Timeout;
 
-    if (taskId && (status !== 'completed' && status !== 'failed') && status !== 'cancelled') {
+    if (taskId && !isFinished && !useSSE) {
       interval = setInterval(async () => {
         try {
           const data = await getTaskStatus(taskId);
-          console.log('Task Status Update:', data);
-          setStatus(data.status);
-
-          if (data.status === 'completed') {
-            setResultFile(data.result_file);
-            localStorage.removeItem('stemsense_current_task'); // 🧹 Clear session
-            clearInterval(interval);
-          } else if (data.status === 'failed') {
-            setError(data.error || 'Processing failed');
-            localStorage.removeItem('stemsense_current_task'); // 🧹 Clear session
-            clearInterval(interval);
-          } else if (data.status === 'cancelled') {
-            setError('Task was cancelled by user');
-            localStorage.removeItem('stemsense_current_task'); // 🧹 Clear session
-            clearInterval(interval);
-          }
+          handleUpdate(data);
         } catch (err) {
           console.error('Polling error:', err);
           // If 404, maybe the task is truly gone or expired
@@ -87,7 +100,7 @@ export default function Home() {
     }
 
     return () => clearInterval(interval);
-  }, [taskId, status]);
+  }, [taskId, isFinished, useSSE]);
 
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
@@ -100,6 +113,8 @@ export default function Home() {
 
     try {
       const data = await submitTask(input);
+      setUseSSE(true);
+      setProgress(null);
       setTaskId(data.task_id);
       setStatus('queued');
     } catch (err: any) {
@@ -338,7 +353,7 @@ export default function Home() {
                         animate={{ 
                           width: status === 'queued' ? '5%' : 
                                  status === 'downloading' ? '25%' : 
-                                 status === 'separating' ? '55%' : 
+                                 status === 'separating' ? `${Math.round(30 + 40 * (progress ?? 0.5))}%` : 
                                  status === 'analyzing' ? '75%' : 
                                  status === 'packaging' ? '90%' : 
                                  status === 'completed' ? '100%' : '0%'
@@ -18,6 +18,21 @@ export const getTaskStatus = async (taskId: string) => {
     return response.data;
 };
 
+// Live status/progress updates via Server-Sent Events
+export const subscribeToTask = (
+    taskId: string,
+    onUpdate: (data: any) => void,
+    onError: () => void,
+) => {
+    const source = new EventSource(`${NEXT_PUBLIC_API_URL}/tasks/${taskId}/events`);
+    source.onmessage = (event) => onUpdate(JSON.parse(event.data));
+    source.onerror = () => {
+        source.close();
+        onError();
+    };
+    return () => source.close();
+};
+
 export const getDownloadUrl = (filename: string) => {
     return `${NEXT_PUBLIC_API_URL}/download/${filename}`;
 };